@@ -1,6 +1,15 @@
 # -*- coding: utf-8 -*-
-"""企业知识库 RAG 问答 - FastAPI 服务入口。"""
+"""
+企业知识库 RAG 问答 - FastAPI 服务入口。
+问答链、向量库等较重的模块在首次使用时（或由启动预热）才导入，进程启动后即可响应 /health。
+"""
+import asyncio
+import importlib
+import json
+import signal
 import sys
+import threading
+import time
 from pathlib import Path
 
 # 将项目根目录加入 path，便于直接运行 python api/main.py
@@ -9,13 +18,13 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
-from config import get_settings
+from config import get_settings, reload_settings
 from logger_config import logger
-from rag import answer_question, rebuild_index
+from metrics import INFLIGHT, REGISTRY, REQUEST_SECONDS, REQUESTS, format_timings, request_timings
 
 app = FastAPI(
     title="企业内部知识库问答 API",
@@ -24,56 +33,375 @@ app = FastAPI(
 )
 
 
+_warmup_state: dict = {"status": "pending", "steps": {}, "elapsed_ms": None, "error": None}
+
+
+def _warmup() -> None:
+    """预热：导入问答链，加载嵌入模型、向量库（全部分区）与重排模型，记录各步耗时；完成后 /ready 返回 200。"""
+    started = time.perf_counter()
+    steps = _warmup_state["steps"]
+    _warmup_state["status"] = "warming"
+
+    def step(name: str, fn) -> None:
+        t = time.perf_counter()
+        fn()
+        steps[name] = round((time.perf_counter() - t) * 1000, 1)
+
+    try:
+        step("import", lambda: importlib.import_module("rag.chain"))
+        from knowledge import get_embeddings, get_partitions
+        step("embeddings", lambda: get_embeddings().embed_query("预热"))
+        step("index", get_partitions)
+        from rag.reranker import get_reranker
+        reranker = get_reranker()
+        if reranker:
+            step("reranker", reranker.warmup)
+    except Exception as e:
+        _warmup_state.update(status="failed", error=str(e))
+        logger.warning(f"启动预热失败（请求到达时将再次尝试加载）: {e}")
+        return
+    _warmup_state.update(status="ready", elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    logger.info(f"向量库与嵌入模型已预热，耗时 {_warmup_state['elapsed_ms'] / 1000:.1f}s")
+
+
 @app.on_event("startup")
 def startup_warmup():
-    """启动时预热：加载嵌入模型与向量库，避免首条请求卡顿。"""
+    """
+    启动预热（WARMUP_MODE）：background 在后台线程加载，服务立即接受请求，就绪状态见 /ready；
+    blocking 加载完成后才开始接受请求；off 不预热，首个请求到达时加载。
+    """
+    mode = get_settings().warmup_mode
+    if mode == "blocking":
+        _warmup()
+    elif mode == "background":
+        threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    else:
+        _warmup_state["status"] = "off"
+    _install_reload_signal()
+
+
+def _install_reload_signal() -> None:
+    """kill -HUP <pid> 时重新读取 .env 与环境变量（仅 POSIX；Windows 请用 POST /api/settings/reload）。"""
+    if not hasattr(signal, "SIGHUP"):
+        return
+    try:
+        signal.signal(signal.SIGHUP, lambda *_: _reload_settings())
+    except ValueError:  # 非主线程（如部分测试/嵌入式运行方式）无法注册信号处理器
+        logger.debug("未注册 SIGHUP 配置重载")
+
+
+def _reload_settings() -> None:
     try:
-        from knowledge import get_vector_store
-        get_vector_store()
-        logger.info("向量库与嵌入模型已预热")
+        reload_settings()
+        logger.info("配置已重新加载")
     except Exception as e:
-        logger.warning(f"启动预热跳过: {e}")
+        logger.error(f"配置重新加载失败，继续使用原配置: {e}")
 
 
 class QuestionRequest(BaseModel):
     question: str = Field(..., min_length=1, max_length=2000, description="用户问题")
     top_k: int | None = Field(default=None, ge=1, le=20, description="检索条数，不传则用配置默认值")
+    scope: list[str] | None = Field(default=None, description="只在这些知识库分区中检索（PARTITION_BY=folder 时有效），不传则按问题自动路由")
+    include_timings: bool = Field(default=False, description="是否在响应中返回各阶段耗时明细（毫秒）")
 
 
 class QuestionResponse(BaseModel):
     answer: str
     sources: list[dict]
     retrieved_only: bool
+    cached: bool = False
+    degraded: bool = False
+    timings: dict[str, float] | None = None
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: list[str] = Field(..., min_length=1, description="问题列表，条数上限见 BATCH_MAX_QUESTIONS")
+    top_k: int | None = Field(default=None, ge=1, le=20, description="检索条数，不传则用配置默认值")
+    concurrency: int | None = Field(default=None, ge=1, le=64, description="LLM 并发调用数，不传则用配置默认值")
+    scope: list[str] | None = Field(default=None, description="只在这些知识库分区中检索（PARTITION_BY=folder 时有效），不传则按问题自动路由")
 
 
 @app.get("/health")
-def health():
+async def health():
+    """存活检查：进程已启动即返回，不等待模型与索引加载。"""
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """就绪检查：预热完成（或 WARMUP_MODE=off）时返回 200，预热中或失败时返回 503，附各步耗时与错误信息。"""
+    ok = _warmup_state["status"] in ("ready", "off")
+    return JSONResponse(status_code=200 if ok else 503, content=_warmup_state)
+
+
 @app.post("/api/ask", response_model=QuestionResponse)
-def api_ask(req: QuestionRequest):
-    """提交问题，返回 RAG 答案与引用来源。"""
+async def api_ask(req: QuestionRequest):
+    """
+    提交问题，返回 RAG 答案与引用来源（异步：查询向量微批合并，LLM 异步调用，不占用线程池）。
+    各阶段经准入控制：排队已满或超时时返回 503 + Retry-After，LLM 阶段可降级为仅检索的回答（degraded=true）。
+    """
+    from rag import aanswer_question
+    from rag.admission import Overloaded
+    started = time.perf_counter()
+    with INFLIGHT.track_inprogress(endpoint="ask"), request_timings() as timings:
+        try:
+            result = await aanswer_question(req.question, top_k=req.top_k, scope=req.scope)
+        except ValueError as e:
+            REQUESTS.inc(endpoint="ask", status="bad_request")
+            raise HTTPException(status_code=400, detail=str(e))
+        except Overloaded as e:
+            REQUESTS.inc(endpoint="ask", status="shed")
+            raise _overloaded(e)
+        except TimeoutError as e:
+            REQUESTS.inc(endpoint="ask", status="timeout")
+            logger.warning(f"问答请求超时: {e}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except Exception as e:
+            REQUESTS.inc(endpoint="ask", status="error")
+            logger.exception("问答请求失败")
+            raise HTTPException(status_code=500, detail=str(e))
+    elapsed = time.perf_counter() - started
+    REQUESTS.inc(endpoint="ask", status="cached" if result.get("cached") else "degraded" if result.get("degraded") else "ok")
+    REQUEST_SECONDS.observe(elapsed, endpoint="ask")
+    return QuestionResponse(
+        answer=result["answer"],
+        sources=result["sources"],
+        retrieved_only=result["retrieved_only"],
+        cached=result.get("cached", False),
+        degraded=result.get("degraded", False),
+        timings={**format_timings(timings), "total": round(elapsed * 1000, 2)} if req.include_timings else None,
+    )
+
+
+def _overloaded(e) -> HTTPException:
+    """准入控制拒绝：503 + Retry-After，客户端与负载均衡据此退避重试。"""
+    logger.warning(f"准入控制拒绝请求（{e.stage}/{e.reason}）")
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/ask/stream")
+async def api_ask_stream(req: QuestionRequest):
+    """
+    流式问答（Server-Sent Events）：先发送 sources 事件（检索结果），再逐段发送 token 事件，最后发送带耗时的 done 事件；
+    出错时发送 error 事件。准入控制的某一阶段已满（名额与队列均占满）时直接返回 503 + Retry-After。
+    """
+    from rag import astream_answer
+    from rag.admission import Overloaded, get_admission
+
+    admission = get_admission()
+    try:
+        if admission:
+            admission.check()
+    except Overloaded as e:
+        REQUESTS.inc(endpoint="ask_stream", status="shed")
+        raise _overloaded(e)
+
+    async def events():
+        started = time.perf_counter()
+        status = "ok"
+        with INFLIGHT.track_inprogress(endpoint="ask_stream"):
+            try:
+                async for item in astream_answer(req.question, top_k=req.top_k, scope=req.scope):
+                    yield _sse(item["event"], item["data"])
+            except Overloaded as e:
+                status = "shed"
+                yield _sse("error", {"detail": str(e), "retry_after": e.retry_after})
+            except Exception as e:
+                status = "error"
+                logger.exception("流式问答请求失败")
+                yield _sse("error", {"detail": str(e)})
+        REQUESTS.inc(endpoint="ask_stream", status=status)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="ask_stream")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/ask/batch")
+async def api_ask_batch(req: BatchQuestionRequest):
+    """
+    批量问答（NDJSON 流，每行一个 JSON）：问题分轮批量嵌入并一起检索，LLM 调用有界并发，结果按完成顺序返回。
+    每行含 index（输入序号）与 question；成功时带 answer / sources / retrieved_only / cached，失败时只带 error，不影响其余问题。
+    """
+    from rag import abatch_answer, check_scope
+    limit = get_settings().batch_max_questions
+    if len(req.questions) > limit:
+        raise HTTPException(status_code=413, detail=f"单次最多 {limit} 个问题")
+    if req.scope:
+        try:
+            await asyncio.to_thread(check_scope, req.scope)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        started = time.perf_counter()
+        errors = 0
+        with INFLIGHT.track_inprogress(endpoint="ask_batch"):
+            async for item in abatch_answer(req.questions, top_k=req.top_k, concurrency=req.concurrency, scope=req.scope):
+                errors += "error" in item
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        REQUESTS.inc(endpoint="ask_batch", status="error" if errors else "ok")
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="ask_batch")
+        logger.info(f"批量问答完成：{len(req.questions)} 个问题，失败 {errors} 个，耗时 {time.perf_counter() - started:.1f}s")
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+@app.get("/api/cache/stats")
+def api_cache_stats():
+    """缓存统计：问答缓存、嵌入缓存的命中/未命中与淘汰情况，以及查询向量微批、嵌入服务、重排、请求合并与 LLM 调用情况。"""
+    from knowledge import get_embedding_cache_stats, get_embedding_server_stats
+    from knowledge.query_batcher import get_query_batcher
+    from rag.admission import get_admission
+    from rag.answer_cache import get_answer_cache
+    from rag.llm_client import get_llm_caller
+    from rag.reranker import get_reranker
+    from rag.singleflight import get_single_flight
+    cache = get_answer_cache()
+    reranker = get_reranker()
+    server = get_embedding_server_stats()
+    flight = get_single_flight()
+    admission = get_admission()
+    return {
+        "answer_cache": cache.stats() if cache else None,
+        "embedding_cache": server["embedding_cache"] if server else get_embedding_cache_stats(),
+        "embedding_server": server,
+        "query_batcher": get_query_batcher().stats(),
+        "reranker": reranker.stats() if reranker else None,
+        "coalescing": flight.stats() if flight else None,
+        "llm": get_llm_caller().stats(),
+        "admission": admission.stats() if admission else None,
+    }
+
+
+def _cache_metrics():
+    """抓取时把各缓存已有的统计导出为指标。"""
+    from knowledge import get_embedding_cache_stats, get_embedding_server_stats
+    from knowledge.query_batcher import get_query_batcher
+    from rag.admission import get_admission
+    from rag.answer_cache import get_answer_cache
+    from rag.llm_client import get_llm_caller
+    from rag.reranker import get_reranker
+    from rag.singleflight import get_single_flight
+    answer = get_answer_cache()
+    if answer:
+        st = answer.stats()
+        yield "rag_answer_cache_lookups_total", "counter", "问答缓存查找次数", [
+            ({"result": "exact_hit"}, st["exact_hits"]),
+            ({"result": "semantic_hit"}, st["semantic_hits"]),
+            ({"result": "miss"}, st["misses"]),
+        ]
+        yield "rag_answer_cache_entries", "gauge", "问答缓存条数", [({}, st["entries"])]
+    server = get_embedding_server_stats()
+    embedding = server["embedding_cache"] if server else get_embedding_cache_stats()
+    if embedding:
+        yield "rag_embedding_cache_lookups_total", "counter", "嵌入缓存查找次数", [
+            ({"result": "hit"}, embedding["hits"]),
+            ({"result": "miss"}, embedding["misses"]),
+        ]
+    if server:
+        # 嵌入服务由本机全部 worker 共用，各 worker 导出的是同一组数值
+        yield "rag_embedding_server_batches_total", "counter", "嵌入服务批量前向计算次数", [({}, server["batches"])]
+        yield "rag_embedding_server_texts_total", "counter", "嵌入服务计算的文本数", [({}, server["texts"])]
+    batcher = get_query_batcher().stats()
+    yield "rag_query_batches_total", "counter", "查询向量批量嵌入次数", [({}, batcher["batches"])]
+    yield "rag_query_batch_queries_total", "counter", "经微批器嵌入的问题数", [({}, batcher["queries"])]
+    reranker = get_reranker()
+    if reranker:
+        st = reranker.stats()
+        yield "rag_rerank_total", "counter", "重排次数（按结果区分）", [({"result": "reranked"}, st["reranked"]), ({"result": "fallback"}, st["fallbacks"])]
+    flight = get_single_flight()
+    if flight:
+        st = flight.stats()
+        yield "rag_coalesced_requests_total", "counter", "请求合并：执行检索与生成的请求（leader）与共享其结果的请求（follower）", [
+            ({"role": "leader"}, st["leaders"]),
+            ({"role": "follower"}, st["followers"]),
+        ]
+    st = get_llm_caller().stats()
+    yield "rag_llm_calls_total", "counter", "LLM 调用次数（按结果区分）", [
+        ({"result": "ok"}, st["ok"]),
+        ({"result": "timeout"}, st["timeouts"]),
+        ({"result": "error"}, st["errors"]),
+    ]
+    yield "rag_llm_hedged_total", "counter", "发出的对冲请求数", [({}, st["hedged"])]
+    yield "rag_llm_hedge_wins_total", "counter", "对冲请求先于原请求返回的次数", [({}, st["hedge_wins"])]
+    admission = get_admission()
+    if admission:
+        stages = admission.stats()["stages"]
+        yield "rag_admission_active", "gauge", "准入控制：各阶段正在执行的请求数", [({"stage": n}, g["active"]) for n, g in stages.items()]
+        yield "rag_admission_queue_depth", "gauge", "准入控制：各阶段排队等待的请求数", [({"stage": n}, g["queue_depth"]) for n, g in stages.items()]
+        yield "rag_admission_shed_total", "counter", "准入控制拒绝的请求数（按阶段与原因区分）", [
+            ({"stage": n, "reason": reason}, g[f"shed_{reason}"]) for n, g in stages.items() for reason in ("queue_full", "timeout")
+        ]
+        yield "rag_admission_degraded_total", "counter", "LLM 阶段被拒绝后降级为仅检索回答的次数", [({}, admission.degraded)]
+
+
+REGISTRY.register_collector(_cache_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus 文本格式指标：分阶段耗时直方图、请求数与在途请求数、文档/文本块计数、缓存命中。"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/api/rebuild", status_code=202)
+def api_rebuild(full: bool = False):
+    """
+    提交后台重建任务（管理员或定时任务调用），立即返回任务信息。默认增量更新，?full=true 时全量重建。
+    构建写入新版本目录，完成后原子切换，构建期间查询不受影响；进度见 GET /api/rebuild/jobs/{job_id}。
+    """
     try:
-        result = answer_question(req.question, top_k=req.top_k)
-        return QuestionResponse(
-            answer=result["answer"],
-            sources=result["sources"],
-            retrieved_only=result["retrieved_only"],
-        )
+        from rag import rebuild_index
+        return rebuild_index(full=full)
     except Exception as e:
-        logger.exception("问答请求失败")
+        logger.exception("提交重建任务失败")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/rebuild")
-def api_rebuild():
-    """重建知识库向量索引（管理员或定时任务调用）。"""
+@app.get("/api/rebuild/jobs")
+def api_rebuild_jobs():
+    """最近的重建任务（新的在前）。"""
+    from knowledge import get_index_job_manager
+    return {"jobs": get_index_job_manager().list()}
+
+
+@app.get("/api/rebuild/jobs/{job_id}")
+def api_rebuild_job(job_id: str):
+    """重建任务状态：state 为 queued / running / succeeded / failed，progress 含已处理文件数与文本块数。"""
+    from knowledge import get_index_job_manager
+    job = get_index_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@app.post("/api/rebuild/rollback")
+def api_rebuild_rollback():
+    """切回上一个索引版本。"""
+    from knowledge import rollback_index
+    result = rollback_index()
+    if result is None:
+        raise HTTPException(status_code=409, detail="没有可回滚的索引版本")
+    return {"status": "ok", **result}
+
+
+@app.post("/api/settings/reload")
+def api_settings_reload():
+    """重新读取 .env 与环境变量（等同向进程发送 SIGHUP）；检索参数与 LLM 配置下一次请求生效。"""
     try:
-        return rebuild_index()
+        reload_settings()
     except Exception as e:
-        logger.exception("重建索引失败")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("配置重新加载失败")
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok"}
 
 
 # 静态页面：问答前端
@@ -154,7 +482,7 @@ def _default_index_html() -> str:
         let html = '<div class="card"><div class="answer">' + esc(data.answer) + '</div>';
         if (data.sources && data.sources.length) {
           html += '<details class="sources"><summary>📚 参考来源 (' + data.sources.length + ')</summary><ul>';
-          data.sources.forEach(s => { html += '<li>' + esc(s.filename || s.source || '') + '</li>'; });
+          data.sources.forEach(s => { html += '<li>' + esc((s.filename || s.source || '') + (s.page ? ' 第' + s.page + '页' : '') + (s.section ? ' · ' + s.section : '') + (s.also_in && s.also_in.length ? '（另见 ' + s.also_in.join('、') + '）' : '')) + '</li>'; });
           html += '</ul></details>';
         }
         html += '</div>';
@@ -171,7 +499,7 @@ def _default_index_html() -> str:
         const r = await fetch('/api/rebuild', { method: 'POST' });
         const data = await r.json();
         if (!r.ok) throw new Error(data.detail || '重建失败');
-        result.innerHTML = '<div class="card"><div style="background:#f0fdf4;border:2px solid #bbf7d0;color:#10b981;padding:1rem;border-radius:12px;">✅ 索引已重建完成！</div></div>';
+        result.innerHTML = '<div class="card"><div style="background:#f0fdf4;border:2px solid #bbf7d0;color:#10b981;padding:1rem;border-radius:12px;">✅ 重建任务已提交，将在后台执行（进度见 /api/rebuild/jobs）</div></div>';
       } catch (e) {
         result.innerHTML = '<div class="card"><div class="error">错误：' + esc(e.message) + '</div></div>';
       }
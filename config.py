@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 """企业知识库 RAG 应用配置（环境变量 + 默认值）。"""
 import os
+import threading
+from collections.abc import Callable
 from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -22,18 +25,78 @@ class Settings(BaseSettings):
         default="chroma_db",
         description="Chroma 向量库持久化目录",
     )
+    vector_backend: Literal["chroma", "flat"] = Field(
+        default="chroma",
+        description="向量库后端：chroma（Chroma + SQLite）或 flat（内存映射 NumPy 扁平索引，多进程共享页缓存）",
+    )
+    vector_quantization: Literal["none", "int8"] = Field(
+        default="none",
+        description="向量量化存储（仅 flat 后端）：none 或 int8（按维度标量量化，先扫描量化向量再按原始精度重排候选）",
+    )
+    quantization_rescore_factor: int = Field(default=4, ge=1, le=100, description="int8 检索时按原始精度重新打分的候选数为 k 的多少倍")
+
+    # 知识库分区（按部门等一级目录拆分索引，检索只访问相关分区）
+    partition_by: Literal["none", "folder"] = Field(
+        default="none",
+        description="索引分区方式：none（单一索引）或 folder（knowledge_docs 下每个一级目录一个分区，根目录文件归入「通用」）",
+    )
+    partition_route_max: int = Field(default=2, ge=1, le=50, description="未指定范围时最多检索的分区数")
+    partition_route_margin: float = Field(default=0.05, ge=0, le=2, description="与最接近分区的质心相似度相差不超过该值的分区一并检索")
+    partition_name_boost: float = Field(default=0.05, ge=0, le=2, description="问题中出现分区名时给该分区的质心相似度加分（不超过 margin 时不会挤掉内容最相关的分区）")
 
     # 嵌入模型（本地 sentence-transformers，无需 API Key）
     embedding_model: str = Field(
         default="paraphrase-multilingual-MiniLM-L12-v2",
         description="本地嵌入模型名称",
     )
+    embedding_backend: Literal["torch", "onnx"] = Field(
+        default="torch",
+        description="嵌入推理后端：torch（sentence-transformers）或 onnx（导出为 ONNX 后用 ONNX Runtime 推理）",
+    )
+    onnx_quantization: Literal["none", "int8"] = Field(default="none", description="ONNX 后端的模型量化：none 或 int8（动态量化，体积约 1/4、推理更快，向量有少量偏差）")
+    onnx_model_dir: str = Field(default="onnx_models", description="导出的 ONNX 模型目录（相对项目根）")
+    onnx_intra_op_threads: int = Field(default=0, ge=0, description="ONNX Runtime 单次推理使用的线程数，0 表示由 ONNX Runtime 决定（物理核数）")
+    onnx_batch_size: int = Field(default=32, ge=1, le=1024, description="ONNX 后端单批最多的文本数")
+    onnx_max_batch_tokens: int = Field(default=8192, ge=128, description="ONNX 后端单批的 token 上限（条数 × 批内最长），长文本自动减小批大小")
+
+    # 嵌入服务（多 worker 部署时共用一份模型，见 scripts/embedding_server.py）
+    embedding_server_socket: str | None = Field(default=None, description="嵌入服务的 Unix 套接字路径；设置后本进程不加载嵌入模型，改为请求该服务")
+    embedding_server_max_batch: int = Field(default=64, ge=1, le=1024, description="嵌入服务单批最多合并的文本数")
+    embedding_server_max_wait_ms: float = Field(default=5.0, ge=0, le=200, description="嵌入服务首个请求到达后最多等待的毫秒数")
+    embedding_server_timeout: float = Field(default=60, gt=0, description="请求嵌入服务的超时（秒）")
+
+    # 索引流水线（解析 → 切分 → 批量嵌入 → 写入）
+    loader_workers: int = Field(default=0, ge=0, description="文档解析进程数，0 表示 CPU 核数")
+    index_queue_size: int = Field(default=4, ge=1, description="切分与嵌入写入阶段之间的有界队列长度（批次数）")
+    index_snapshot_path: str | None = Field(default=None, description="索引快照文件（相对项目根）；启动时尚无索引则先导入该快照，而不是从知识库全量构建")
+
+    # 入库去重（MinHash + LSH，近似重复的文本块只嵌入、存储一份，其他文件记为出处）
+    dedup_enabled: bool = Field(default=False, description="是否在切分后、嵌入前去除近似重复的文本块（同一分区内）；开启会改变索引内容与检索结果")
+    dedup_threshold: float = Field(default=0.9, ge=0.5, le=1, description="视为重复的相似度阈值（字符片段 Jaccard 估计值）；数字不一致的块始终保留")
+
+    # 嵌入缓存（磁盘持久化，按文本哈希复用已计算的向量）
+    embedding_cache_enabled: bool = Field(default=True, description="是否启用磁盘嵌入缓存")
+    embedding_cache_dir: str = Field(default="embedding_cache", description="嵌入缓存目录（相对项目根）")
+    embedding_cache_max_entries: int = Field(default=200_000, ge=1, description="嵌入缓存最大条数，超出按 LRU 淘汰")
 
     # LLM 配置（可选：OpenAI 兼容 API）
     llm_api_base: str | None = Field(default=None, description="LLM API 基地址，如 https://api.openai.com/v1")
     llm_api_key: str | None = Field(default=None, description="LLM API Key")
     llm_model: str = Field(default="gpt-4o-mini", description="调用的模型名")
     llm_temperature: float = Field(default=0.2, ge=0, le=2, description="生成温度")
+    llm_timeout: float = Field(default=60, gt=0, description="单次 LLM 调用的截止时间（秒）；异步调用含重试与对冲在内")
+    llm_first_token_timeout: float = Field(default=20, gt=0, description="流式问答等待 LLM 首个片段的超时（秒）；整个生成仍受 llm_timeout 限制")
+    llm_connect_timeout: float = Field(default=5, gt=0, description="连接 LLM API 的超时（秒）")
+    llm_max_retries: int = Field(default=1, ge=0, le=10, description="LLM 调用失败（连接错误、429、5xx）时的重试次数")
+    llm_max_connections: int = Field(default=64, ge=1, description="LLM 客户端连接池的最大连接数")
+    llm_max_keepalive: int = Field(default=16, ge=0, description="连接池中保持的空闲长连接数")
+    llm_keepalive_expiry: float = Field(default=60, ge=0, description="空闲长连接的保活时间（秒）")
+    llm_hedge_percentile: float = Field(default=0, ge=0, lt=100, description="对冲请求：调用耗时超过近期该分位数仍未返回时再发一次相同请求（如 95），0 表示关闭")
+    llm_hedge_min_samples: int = Field(default=20, ge=1, description="启用对冲前至少需要的近期调用耗时样本数")
+    llm_hedge_min_delay_ms: float = Field(default=200, ge=0, description="发出对冲请求前的最短等待（毫秒）")
+
+    # 请求合并（相同问题同时在途时只检索、调用 LLM 一次）
+    request_coalescing: bool = Field(default=True, description="是否合并同时在途的相同问题（规范化问题、top_k、检索范围、索引版本均相同）")
 
     # RAG 参数
     chunk_size: int = Field(default=500, ge=100, le=2000, description="文本块大小")
@@ -41,9 +104,55 @@ class Settings(BaseSettings):
     top_k: int = Field(default=8, ge=1, le=20, description="检索返回的文档数量")
     score_threshold: float | None = Field(default=None, ge=0, le=1, description="相似度阈值，None 表示不过滤")
 
+    # 上下文打包（合并相邻文本块、去重，按 token 预算装入提示词）
+    context_max_tokens: int = Field(default=3000, ge=0, description="参考文档的 token 预算（估算值），0 表示不限制")
+    context_dedup_threshold: float = Field(default=0.9, ge=0, le=1, description="文本块近似重复的相似度阈值（字符二元组 Jaccard），1 表示只去除完全包含的重复")
+
+    # 混合检索（BM25 词法 + 向量，倒数排名融合）
+    hybrid_search: bool = Field(default=False, description="是否启用 BM25 + 向量混合检索；开启会改变检索排序")
+    hybrid_fetch_k: int = Field(default=20, ge=1, le=200, description="融合前向量与词法检索各自召回的条数")
+    rrf_k: int = Field(default=60, ge=1, description="倒数排名融合的平滑常数")
+
+    # 重排（本地 cross-encoder，CPU）
+    rerank_enabled: bool = Field(default=False, description="是否启用 cross-encoder 重排")
+    rerank_model: str = Field(default="cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", description="本地重排模型名称（需支持中文）")
+    rerank_fetch_k: int = Field(default=24, ge=1, le=200, description="重排前召回的候选条数")
+    rerank_batch_size: int = Field(default=16, ge=1, le=256, description="单批打分的 (问题, 文本块) 对数")
+    rerank_budget_ms: float = Field(default=200, ge=0, description="单次请求的重排时间预算（毫秒），预计超出时按检索顺序返回")
+    rerank_cache_max_entries: int = Field(default=20000, ge=1, description="重排分数缓存最大条数，超出按 LRU 淘汰")
+
+    # 查询向量微批（并发问题合并为一次批量嵌入）
+    query_batch_max_size: int = Field(default=32, ge=1, le=512, description="单批最多合并的问题数")
+    query_batch_max_wait_ms: float = Field(default=5.0, ge=0, le=200, description="首个问题到达后最多等待的毫秒数")
+
+    # 准入控制（/api/ask、/api/ask/stream 各阶段的并发上限与有界等待队列，超出时快速拒绝或降级）
+    admission_enabled: bool = Field(default=True, description="是否启用准入控制")
+    admission_embed_concurrency: int = Field(default=32, ge=0, description="同时计算查询向量的请求数上限，0 表示不限制")
+    admission_search_concurrency: int = Field(default=8, ge=0, description="同时执行检索的请求数上限，0 表示不限制")
+    admission_llm_concurrency: int = Field(default=16, ge=0, description="同时调用 LLM 的请求数上限，0 表示不限制")
+    admission_queue_size: int = Field(default=64, ge=0, description="每个阶段的等待队列长度，排满后新请求立即被拒绝")
+    admission_queue_timeout_ms: float = Field(default=2000, ge=0, description="每个阶段最长排队时间（毫秒），超时即被拒绝")
+    admission_degrade: bool = Field(default=True, description="LLM 阶段被拒绝时降级为仅检索的回答（否则返回 503）")
+    admission_retry_after: int = Field(default=2, ge=1, description="拒绝时 Retry-After 响应头的秒数")
+
+    # 批量问答（/api/ask/batch 与 scripts/batch_ask.py）
+    batch_max_questions: int = Field(default=5000, ge=1, description="单次批量请求最多的问题数")
+    batch_chunk_size: int = Field(default=64, ge=1, le=1024, description="每轮一起嵌入并检索的问题数")
+    batch_llm_concurrency: int = Field(default=4, ge=1, le=64, description="批量问答同时进行的 LLM 调用数")
+
+    # 问答缓存（精确 + 语义两级，索引更新后自动失效）
+    answer_cache_enabled: bool = Field(default=True, description="是否启用问答缓存")
+    answer_cache_max_entries: int = Field(default=2000, ge=1, description="问答缓存最大条数，超出按 LRU 淘汰")
+    answer_cache_ttl_seconds: float = Field(default=3600, ge=0, description="问答缓存有效期（秒），0 表示不过期")
+    answer_cache_max_distance: float = Field(default=0.05, ge=0, le=1, description="语义层复用答案的最大余弦距离，0 表示关闭语义层")
+
     # 服务
     host: str = Field(default="0.0.0.0", description="API 监听地址")
     port: int = Field(default=8000, ge=1, le=65535, description="API 端口")
+    warmup_mode: Literal["background", "blocking", "off"] = Field(
+        default="background",
+        description="启动预热：background（后台加载，服务立即可用，就绪见 /ready）、blocking（加载完成才接受请求）或 off",
+    )
 
     class Config:
         env_file = ".env"
@@ -51,8 +160,36 @@ class Settings(BaseSettings):
         extra = "ignore"
 
 
+_settings: Settings | None = None
+_settings_lock = threading.Lock()
+_reload_callbacks: list[Callable[[Settings], None]] = []
+
+
 def get_settings() -> Settings:
-    return Settings()
+    """获取配置（进程内只加载一次，避免每次调用重新读取环境变量与 .env）；修改配置后调用 reload_settings() 生效。"""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings()
+    return _settings
+
+
+def reload_settings() -> Settings:
+    """
+    重新读取环境变量与 .env 并原子替换当前配置，然后通知已注册的回调（如丢弃按旧配置创建的 LLM 客户端）。
+    检索参数（top_k、阈值、混合检索等）在下一次请求生效；嵌入模型、缓存容量等启动时创建的组件需重启进程。
+    """
+    global _settings
+    settings = _settings = Settings()
+    for callback in list(_reload_callbacks):
+        callback(settings)
+    return settings
+
+
+def on_settings_reload(callback: Callable[[Settings], None]) -> None:
+    """注册配置重载回调。"""
+    _reload_callbacks.append(callback)
 
 
 def get_knowledge_path() -> Path:
@@ -65,3 +202,8 @@ def get_knowledge_path() -> Path:
 def get_chroma_path() -> Path:
     s = get_settings()
     return PROJECT_ROOT / s.persist_directory
+
+
+def get_embedding_cache_path() -> Path:
+    s = get_settings()
+    return PROJECT_ROOT / s.embedding_cache_dir
@@ -1,10 +1,38 @@
 # -*- coding: utf-8 -*-
 """知识库模块：文档加载、切分、向量存储与检索。"""
-from .loader import load_documents_from_directory
-from .vector_store import get_vector_store, build_and_persist_index
+from .loader import load_documents_from_directory, iter_documents_from_directory
+from .index_jobs import get_index_job_manager
+from .snapshot import SnapshotError, export_snapshot, import_snapshot
+from .vector_store import (
+    build_and_persist_index,
+    get_embedding_cache_stats,
+    get_embedding_server_stats,
+    get_embeddings,
+    get_index_dir,
+    get_index_version,
+    get_lexical_index,
+    get_partitions,
+    get_vector_store,
+    rollback_index,
+    update_index,
+)
 
 __all__ = [
     "load_documents_from_directory",
+    "iter_documents_from_directory",
     "get_vector_store",
+    "get_partitions",
     "build_and_persist_index",
+    "update_index",
+    "rollback_index",
+    "export_snapshot",
+    "import_snapshot",
+    "SnapshotError",
+    "get_index_dir",
+    "get_index_job_manager",
+    "get_index_version",
+    "get_lexical_index",
+    "get_embeddings",
+    "get_embedding_cache_stats",
+    "get_embedding_server_stats",
 ]
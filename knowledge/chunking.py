@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+结构化切分：解析器按文档结构逐段产出「章节」，切分时以章节为边界，文本块不再跨越标题、条款与表格。
+
+解析端（knowledge/loader.py 中的 PDF / DOCX 解析器）通过 SectionBuilder 把标题、条款（第X条）、正文行、表格
+组织成章节 Document，metadata 带 section（章节路径，如「第二章 人力资源管理 > 第七条」）、page（PDF 页码，从 0 开始）
+与 start_index（章节在全文中的位置，各章节按 "\\n\\n" 连接计算；PDF 按页计算）。
+切分端 StructuralTextSplitter：
+1. 同一标题下相邻的短章节（如多个短条款）合并为一块，总长不超过 chunk_size；
+2. 超长章节在章节内部按 RecursiveCharacterTextSplitter 切分（保留 chunk_overlap）；
+3. 表格按行切分，每块重复表头行；
+没有 section 元数据的文档（TXT / Markdown / 调用方传入的文档）仍整体交给 RecursiveCharacterTextSplitter。
+"""
+import re
+from collections.abc import Iterable, Iterator
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# 切分规则变化时递增，已有索引会自动全量重建
+CHUNKING_VERSION = "structural-1"
+
+SECTION_SEPARATOR = "\n\n"
+MAX_SECTION_CHARS = 20000  # 单个章节缓冲的最大字符数，超出即先产出一段，无结构的长文档也不会整篇驻留内存
+MAX_HEADING_CHARS = 40  # 超过该长度的行不按「第X章」识别为标题（避免把正文句子当成标题）
+
+_NUMERAL = r"[一二三四五六七八九十百千零〇两\d]+"
+_CHAPTER = re.compile(rf"^\s*第{_NUMERAL}\s*([编章节])")
+_CLAUSE = re.compile(rf"^\s*(第{_NUMERAL}\s*条)")
+# 未使用标题样式时，按「第X编 / 第X章 / 第X节」推断层级，排在样式标题（1-9 级）之下
+_CHAPTER_LEVELS = {"编": 10, "章": 11, "节": 12}
+
+# 仅在解析与切分之间传递、不写入向量库的元数据
+_HEADING_KEY = "_heading"
+_HEADER_KEY = "_table_header"
+
+
+def chapter_level(text: str) -> int | None:
+    """「第X编 / 第X章 / 第X节」开头的短行返回推断的标题级别，否则返回 None。"""
+    if len(text) > MAX_HEADING_CHARS:
+        return None
+    m = _CHAPTER.match(text)
+    return _CHAPTER_LEVELS[m.group(1)] if m else None
+
+
+def clause_label(text: str) -> str | None:
+    """「第X条」开头的行返回条款编号（去掉空白），否则返回 None。"""
+    m = _CLAUSE.match(text)
+    return "".join(m.group(1).split()) if m else None
+
+
+class SectionBuilder:
+    """
+    把解析器按阅读顺序送入的标题、条款、正文行与表格组织成章节 Document。
+    各方法返回本次调用结束的章节（0 或 1 个），解析器可边读边 yield，不需要先拼出全文。
+    """
+
+    def __init__(self, metadata: dict):
+        self.metadata = metadata
+        self.headings: list[tuple[int, str]] = []
+        self.clause: str | None = None
+        self.page: int | None = None
+        self.lines: list[str] = []
+        self.size = 0
+        self.offset = 0
+
+    def heading(self, level: int, text: str) -> list[Document]:
+        done = self.flush()
+        while self.headings and self.headings[-1][0] >= level:
+            self.headings.pop()
+        self.headings.append((level, " ".join(text.split())[:MAX_HEADING_CHARS]))
+        self.clause = None
+        self._append(text)
+        return done
+
+    def clause_start(self, label: str, text: str) -> list[Document]:
+        done = self.flush()
+        self.clause = label
+        self._append(text)
+        return done
+
+    def line(self, text: str) -> list[Document]:
+        if not text.strip():
+            return []
+        self._append(text)
+        return self.flush() if self.size > MAX_SECTION_CHARS else []
+
+    def text(self, text: str) -> list[Document]:
+        """按行识别标题与条款（PDF 等没有样式信息的文本）。"""
+        done = []
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            level = chapter_level(line)
+            label = clause_label(line)
+            if level is not None:
+                done += self.heading(level, line)
+            elif label is not None:
+                done += self.clause_start(label, line)
+            else:
+                done += self.line(line)
+        return done
+
+    def table(self, rows: list[str]) -> list[Document]:
+        """整张表格作为一个章节（每行一行文本），切分时按行分块并重复表头。"""
+        done = self.flush()
+        rows = [r for r in rows if r.strip()]
+        if rows:
+            done += self._emit("\n".join(rows), {"block": "table", _HEADER_KEY: rows[0]})
+        return done
+
+    def start_page(self, page: int) -> list[Document]:
+        """PDF 换页：结束当前章节（标题路径保留到下一页），页内位置从 0 重新计算。"""
+        done = self.flush()
+        self.page = page
+        self.offset = 0
+        return done
+
+    def flush(self) -> list[Document]:
+        if not self.lines:
+            return []
+        text = "\n".join(self.lines)
+        self.lines = []
+        self.size = 0
+        return self._emit(text, {})
+
+    def _append(self, text: str) -> None:
+        self.lines.append(text)
+        self.size += len(text) + 1
+
+    def _emit(self, text: str, extra: dict) -> list[Document]:
+        heading = " > ".join(t for _, t in self.headings)
+        section = " > ".join(t for t in (heading, self.clause) if t)
+        metadata = {**self.metadata, "section": section, _HEADING_KEY: heading, "start_index": self.offset, **extra}
+        if self.page is not None:
+            metadata["page"] = self.page
+        self.offset += len(text) + len(SECTION_SEPARATOR)
+        return [Document(page_content=text, metadata=metadata)]
+
+
+class StructuralTextSplitter:
+    """按章节边界切分；接口与 RecursiveCharacterTextSplitter.split_documents 一致。"""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, separators: list[str]):
+        self.chunk_size = chunk_size
+        self._text = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            separators=separators,
+            add_start_index=True,  # 记录文本块在原文中的位置，供上下文打包合并相邻块
+        )
+
+    def split_documents(self, docs: list[Document]) -> list[Document]:
+        return list(self.iter_split(docs))
+
+    def iter_split(self, docs: Iterable[Document]) -> Iterator[Document]:
+        """流式切分：边读章节边产出文本块，结果与 split_documents 相同，只缓冲待合并的相邻短章节。"""
+        group: list[Document] = []
+        size = 0
+        for doc in docs:
+            structural = "section" in doc.metadata
+            mergeable = structural and "block" not in doc.metadata and len(doc.page_content) <= self.chunk_size
+            if group and not (mergeable and _siblings(group[-1], doc) and size + len(SECTION_SEPARATOR) + len(doc.page_content) <= self.chunk_size):
+                yield _merge(group)
+                group, size = [], 0
+            if mergeable:
+                size += (len(SECTION_SEPARATOR) if group else 0) + len(doc.page_content)
+                group.append(doc)
+            elif not structural:
+                yield from self._text.split_documents([doc])
+            elif doc.metadata.get("block") == "table":
+                yield from self._split_table(doc)
+            else:
+                yield from self._split_section(doc)
+        if group:
+            yield _merge(group)
+
+    def _split_section(self, doc: Document) -> Iterator[Document]:
+        base = doc.metadata.get("start_index", 0)
+        for chunk in self._text.split_documents([doc]):
+            chunk.metadata["start_index"] += base
+            yield _public(chunk)
+
+    def _split_table(self, doc: Document) -> Iterator[Document]:
+        header = doc.metadata[_HEADER_KEY]
+        rows = doc.page_content.split("\n")[1:]
+        lines = [header]
+        size = len(header)
+        first = True
+        for row in rows:
+            if len(lines) > 1 and size + 1 + len(row) > self.chunk_size:
+                yield from self._table_chunks(doc, lines, first)
+                lines, size, first = [header], len(header), False
+            lines.append(row)
+            size += 1 + len(row)
+        yield from self._table_chunks(doc, lines, first)
+
+    def _table_chunks(self, doc: Document, lines: list[str], first: bool) -> Iterator[Document]:
+        metadata = dict(doc.metadata)
+        if not first:
+            # 非首块以重复的表头开头，与原文位置不连续，不记录 start_index（上下文打包时不会与相邻块误合并）
+            metadata.pop("start_index", None)
+        chunk = Document(page_content="\n".join(lines), metadata=metadata)
+        if len(chunk.page_content) <= self.chunk_size:
+            yield _public(chunk)
+            return
+        # 单行超长（如大段文字的单元格）时在行内切分
+        for piece in self._text.split_documents([chunk]):
+            piece.metadata.pop("start_index", None)
+            yield _public(piece)
+
+
+def _siblings(a: Document, b: Document) -> bool:
+    """同一文件、同一页内，b 与 a 同属一个标题或是 a 的下级标题时可以合并（标题与其后的短条款合成一块）。"""
+    if any(a.metadata.get(k) != b.metadata.get(k) for k in ("source", "page")):
+        return False
+    parent, child = a.metadata[_HEADING_KEY], b.metadata[_HEADING_KEY]
+    return not parent or child == parent or child.startswith(parent + " > ")
+
+
+def _merge(group: list[Document]) -> Document:
+    metadata = dict(group[0].metadata)
+    if any(d.metadata["section"] != metadata["section"] for d in group[1:]):
+        # 多个章节合并为一块时，章节路径取首个章节的标题（其余章节都在该标题之下）
+        metadata["section"] = metadata[_HEADING_KEY]
+    return _public(Document(page_content=SECTION_SEPARATOR.join(d.page_content for d in group), metadata=metadata))
+
+
+def _public(doc: Document) -> Document:
+    for key in (_HEADING_KEY, _HEADER_KEY):
+        doc.metadata.pop(key, None)
+    return doc
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+入库去重：切分后、嵌入前用 MinHash + LSH 找出近似重复的文本块（同一制度的多份副本、各版本间未改动的条款、
+每页重复的页眉页脚等），只嵌入、存储第一次出现的那一块，其余文件记入该块的出处列表（provenance），引用时一并展示。
+
+- 签名：文本去空白、转小写后取 SHINGLE_SIZE 字的字符片段，NUM_PERM 个哈希函数各取最小值；
+  两块签名相同位置的比例即其片段集合 Jaccard 相似度的估计；
+- LSH：签名分 BANDS 段，任一段完全相同的块才作为候选逐一比对，入库开销不随索引规模平方增长；
+- 数字保护：块中的数字序列（金额、天数、条款号）不完全一致时不视为重复，避免把仅数字不同的两个版本合并为一个；
+- 持久化：签名存于分区目录的 dedup_index.npz（仅构建时读取），出处列表存于 dedup_sources.json（查询时读取）。
+"""
+import json
+import os
+import re
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from logger_config import logger
+
+DEDUP_INDEX_FILENAME = "dedup_index.npz"
+DEDUP_SOURCES_FILENAME = "dedup_sources.json"
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+BANDS = 8  # 8 段 × 8 行：相似度 0.9 的块成为候选的概率约 99%，0.5 的约 3%
+DEDUP_VERSION = f"minhash-{NUM_PERM}x{SHINGLE_SIZE}-b{BANDS}"
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(20240601)
+# a、b < 2^31 且片段哈希 < 2^32，a * h + b 不会溢出 uint64
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_SPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """字符片段的 32 位哈希（去重后）：按 Unicode 码位做滚动多项式哈希，整段向量化计算。"""
+    normalized = _SPACE_RE.sub("", text).lower()
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return codes
+    width = min(SHINGLE_SIZE, len(codes))
+    n = len(codes) - width + 1
+    h = np.zeros(n, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(width):
+            h = h * np.uint64(1_000_003) + codes[j:j + n]
+    return np.unique((h ^ (h >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+
+def minhash(text: str) -> np.ndarray | None:
+    """文本的 MinHash 签名（NUM_PERM 个 uint64）；去空白后为空的文本返回 None。"""
+    hashes = _shingle_hashes(text)
+    if len(hashes) == 0:
+        return None
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE).min(axis=0)
+
+
+def numbers_digest(text: str) -> int:
+    """文本中全部数字序列（按出现顺序）的摘要；摘要不同的两块不视为重复。"""
+    return zlib.crc32("\0".join(_NUMBER_RE.findall(text)).encode("ascii", "ignore"))
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """两个签名估计的 Jaccard 相似度。"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class DedupIndex:
+    """
+    一个分区内已入库文本块（保留块）的签名与 LSH 分桶，以及每个保留块的出处列表
+    {文本块 ID: [与其重复、未单独入库的其他文件]}。删除只打标记，保存时压缩。
+    """
+
+    def __init__(self, threshold: float = 0.9):
+        self.threshold = threshold
+        self.chunk_ids: list[str] = []
+        self.signatures: list[np.ndarray] = []
+        self.digests: list[int] = []
+        self.alive: list[bool] = []
+        self.sources: dict[str, list[str]] = {}
+        self._rows: dict[str, int] = {}
+        self._buckets: dict[int, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---------- 持久化 ----------
+
+    @classmethod
+    def load(cls, persist_dir: Path, threshold: float = 0.9) -> "DedupIndex | None":
+        path = Path(persist_dir) / DEDUP_INDEX_FILENAME
+        if not path.exists():
+            return None
+        try:
+            index = cls(threshold)
+            with np.load(path, allow_pickle=False) as data:
+                for cid, signature, digest in zip(data["chunk_ids"].tolist(), data["signatures"], data["digests"].tolist()):
+                    index._append(cid, signature, digest)
+            index.sources = load_sources(persist_dir)
+            return index
+        except Exception as e:
+            logger.warning(f"读取去重索引失败，将重新构建: {path}: {e}")
+            return None
+
+    def save(self, persist_dir: Path) -> None:
+        rows = [i for i, alive in enumerate(self.alive) if alive]
+        path = Path(persist_dir) / DEDUP_INDEX_FILENAME
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                chunk_ids=np.array([self.chunk_ids[i] for i in rows], dtype=str),
+                signatures=np.array([self.signatures[i] for i in rows], dtype=np.uint64).reshape(len(rows), NUM_PERM),
+                digests=np.array([self.digests[i] for i in rows], dtype=np.uint32),
+            )
+        os.replace(tmp, path)
+        sources_path = Path(persist_dir) / DEDUP_SOURCES_FILENAME
+        tmp = sources_path.with_name(sources_path.name + ".tmp")
+        tmp.write_text(json.dumps({cid: rels for cid, rels in self.sources.items() if rels}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, sources_path)
+
+    # ---------- 查重与更新 ----------
+
+    def _band_keys(self, signature: np.ndarray) -> list[int]:
+        rows = NUM_PERM // BANDS
+        return [hash((band, signature[band * rows:(band + 1) * rows].tobytes())) for band in range(BANDS)]
+
+    def _append(self, cid: str, signature: np.ndarray, digest: int) -> None:
+        row = len(self.chunk_ids)
+        self.chunk_ids.append(cid)
+        self.signatures.append(np.asarray(signature, dtype=np.uint64))
+        self.digests.append(int(digest))
+        self.alive.append(True)
+        self._rows[cid] = row
+        for key in self._band_keys(self.signatures[row]):
+            self._buckets.setdefault(key, []).append(row)
+
+    def find(self, signature: np.ndarray, digest: int) -> str | None:
+        """与签名近似重复（相似度达到阈值且数字一致）的保留块 ID；没有时返回 None。"""
+        best, best_score = None, self.threshold
+        seen: set[int] = set()
+        for key in self._band_keys(signature):
+            for row in self._buckets.get(key, ()):
+                if row in seen or not self.alive[row] or self.digests[row] != digest:
+                    continue
+                seen.add(row)
+                score = similarity(signature, self.signatures[row])
+                if score >= best_score:
+                    best, best_score = self.chunk_ids[row], score
+        return best
+
+    def add(self, cid: str, signature: np.ndarray, digest: int) -> None:
+        if cid in self._rows:
+            self.remove([cid])
+        self._append(cid, signature, digest)
+
+    def remove(self, chunk_ids: list[str]) -> None:
+        """删除保留块（连同其出处列表）。"""
+        for cid in chunk_ids:
+            row = self._rows.pop(cid, None)
+            if row is not None:
+                self.alive[row] = False
+            self.sources.pop(cid, None)
+
+    def add_source(self, cid: str, rel_path: str) -> None:
+        rels = self.sources.setdefault(cid, [])
+        if rel_path not in rels:
+            rels.append(rel_path)
+
+    def filter(
+        self, rel_path: str, docs: list, ids: list[str], own: set[str] | None = None
+    ) -> tuple[list, list[str], list[str], int]:
+        """
+        对一个文件切分出的文本块查重：与已入库块近似重复的块丢弃（出处记入对方），其余块登记为保留块。
+        own 为本文件已登记的保留块 ID（同一文件分批查重时由调用方跨批传入），与其重复的块不记出处。
+        返回 (保留的块, 保留块 ID, 本文件被并入的其他文件保留块 ID, 丢弃的块数)。
+        """
+        kept, kept_ids, duplicate_of, dropped = [], [], [], 0
+        own = set() if own is None else own
+        for doc, cid in zip(docs, ids):
+            signature = minhash(doc.page_content)
+            if signature is None:
+                kept.append(doc)
+                kept_ids.append(cid)
+                continue
+            digest = numbers_digest(doc.page_content)
+            match = self.find(signature, digest)
+            if match is None:
+                self.add(cid, signature, digest)
+                own.add(cid)
+                kept.append(doc)
+                kept_ids.append(cid)
+                continue
+            dropped += 1
+            if match not in own:  # 同一文件内的重复（如每页的页眉）不记出处
+                self.add_source(match, rel_path)
+                if match not in duplicate_of:
+                    duplicate_of.append(match)
+        return kept, kept_ids, duplicate_of, dropped
+
+    def remove_source(self, chunk_ids: list[str], rel_path: str) -> None:
+        """从这些保留块的出处列表中去掉某个文件（该文件被修改或删除时）。"""
+        for cid in chunk_ids:
+            rels = self.sources.get(cid)
+            if rels and rel_path in rels:
+                rels.remove(rel_path)
+
+
+def load_sources(persist_dir: Path) -> dict[str, list[str]]:
+    """分区的出处列表 {文本块 ID: [其他文件]}；未启用去重或文件缺失时为空。"""
+    try:
+        return json.loads((Path(persist_dir) / DEDUP_SOURCES_FILENAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"读取去重出处列表失败: {persist_dir}: {e}")
+        return {}
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+持久化嵌入缓存：以 (嵌入模型, 是否归一化, 文档/查询, 文本 sha256) 为键，向量存放在内存映射的 float32 矩阵中。
+
+目录结构（每个模型 + 归一化组合一个子目录）：
+    meta.json    模型名、维度、容量
+    vectors.f32  capacity × dim 的 float32 矩阵
+    keys.bin     capacity × 32 字节，每个槽位对应的键（全 0 表示空槽）
+    ticks.i64    capacity 个 int64，最近一次访问序号，用于重启后恢复 LRU 顺序
+    sums.u64     capacity 个 uint64，键与向量的校验和
+
+多个进程（如 API worker 与构建脚本）可以共用同一缓存目录，但槽位分配与 LRU 顺序各进程独立维护，
+一个进程可能覆盖另一个进程刚写入的槽位，这只会让对方下次读取未命中。写入时先清空槽位的键，写完向量与校验和后再写回键；
+读取时先复制向量，再核对键与校验和，不一致（槽位已被复用或正被其他进程改写）按未命中处理，因此不会返回残缺或错误的向量。
+"""
+import atexit
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger_config import logger
+
+CACHE_FORMAT = 2
+KEY_BYTES = 32
+INITIAL_CAPACITY = 1024
+
+
+def _checksum(key: bytes, vector: np.ndarray) -> int:
+    digest = hashlib.blake2b(key, digest_size=8)
+    digest.update(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+    return int.from_bytes(digest.digest(), "little")
+
+
+def cache_key(model_name: str, normalize: bool, text: str, kind: str = "document") -> bytes:
+    """kind 为 document 或 query：给查询加指令前缀的模型（如 BGE）对同一文本的两种向量不同，不能共用缓存条目。"""
+    return hashlib.sha256(f"{model_name}\0{int(normalize)}\0{kind}\0{text}".encode("utf-8")).digest()
+
+
+def embed_queries(embeddings: Embeddings, texts: list[str]) -> list[list[float]]:
+    """
+    批量计算查询向量：底层实现了 embed_queries 时使用它，否则一次 embed_documents 前向计算
+    （内置的 sentence-transformers、ONNX 后端对查询与文档的计算方式相同；给查询加指令前缀的后端应实现 embed_queries）。
+    """
+    batch = getattr(embeddings, "embed_queries", None)
+    return batch(texts) if batch is not None else embeddings.embed_documents(texts)
+
+
+class EmbeddingCache:
+    """磁盘嵌入缓存，容量上限 max_entries，超出时按 LRU 淘汰；线程安全。"""
+
+    def __init__(self, directory: str | Path, model_name: str, normalize: bool, max_entries: int):
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        self.directory = Path(directory) / f"{slug}-{'norm' if normalize else 'raw'}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.normalize = normalize
+        self.max_entries = max(1, int(max_entries))
+        self.dim: int | None = None
+        self.capacity = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._slots: OrderedDict[bytes, int] = OrderedDict()  # LRU 顺序：最久未用的在前
+        self._free: list[int] = []
+        self._tick = 0
+        self._vectors = None
+        self._keys = None
+        self._ticks = None
+        self._sums = None
+        self._load()
+
+    # ---------- 文件管理 ----------
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    def _write_meta(self) -> None:
+        meta = {"format": CACHE_FORMAT, "model": self.model_name, "normalize": self.normalize,
+                "dim": self.dim, "capacity": self.capacity}
+        self._path("meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+    def _open(self, capacity: int) -> None:
+        """按容量打开（必要时扩展）四个映射文件。"""
+        layout = (
+            ("vectors.f32", np.float32, (capacity, self.dim)),
+            ("keys.bin", np.uint8, (capacity, KEY_BYTES)),
+            ("ticks.i64", np.int64, (capacity,)),
+            ("sums.u64", np.uint64, (capacity,)),
+        )
+        maps = []
+        for name, dtype, shape in layout:
+            path = self._path(name)
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            maps.append(np.memmap(path, dtype=dtype, mode="r+", shape=shape))
+        self._vectors, self._keys, self._ticks, self._sums = maps
+        self.capacity = capacity
+
+    def _load(self) -> None:
+        meta_path = self._path("meta.json")
+        if not meta_path.exists():
+            return
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("format") != CACHE_FORMAT or meta.get("model") != self.model_name or not meta.get("dim"):
+                raise ValueError("缓存格式或模型不匹配")
+            self.dim = int(meta["dim"])
+            self._open(int(meta["capacity"]))
+        except Exception as e:
+            logger.warning(f"嵌入缓存不可用，将重新创建 {self.directory}: {e}")
+            self._vectors = self._keys = self._ticks = self._sums = None
+            self.dim = None
+            self.capacity = 0
+            for name in ("meta.json", "vectors.f32", "keys.bin", "ticks.i64", "sums.u64"):
+                self._path(name).unlink(missing_ok=True)
+            return
+
+        used = np.flatnonzero(self._keys.any(axis=1))
+        order = used[np.argsort(self._ticks[used], kind="stable")]
+        for slot in order:
+            self._slots[self._keys[slot].tobytes()] = int(slot)
+        used_set = set(int(i) for i in used)
+        self._free = [i for i in range(self.capacity - 1, -1, -1) if i not in used_set]
+        self._tick = int(self._ticks[used].max()) + 1 if len(used) else 0
+        while len(self._slots) > self.max_entries:
+            self._evict_one()
+        logger.info(f"嵌入缓存已加载: {self.directory}（{len(self._slots)} 条）")
+
+    def _grow(self) -> None:
+        new_capacity = min(self.max_entries, max(INITIAL_CAPACITY, self.capacity * 2))
+        self.flush()
+        old = self.capacity
+        self._vectors = self._keys = self._ticks = self._sums = None
+        self._open(new_capacity)
+        self._free.extend(range(new_capacity - 1, old - 1, -1))
+        self._write_meta()
+
+    def _evict_one(self) -> None:
+        _, slot = self._slots.popitem(last=False)
+        self._keys[slot] = 0
+        self._free.append(slot)
+        self.evictions += 1
+
+    def _take_slot(self) -> int:
+        if len(self._slots) >= self.max_entries:
+            self._evict_one()
+        elif not self._free:
+            if self.capacity < self.max_entries:
+                self._grow()
+            elif self._slots:
+                # 部分槽位已被其他进程占用，已达容量上限时淘汰本进程最久未用的条目
+                self._evict_one()
+            else:
+                return int(np.argmin(self._ticks))
+        return self._free.pop()
+
+    # ---------- 读写 ----------
+
+    def get_many(self, keys: list[bytes]) -> list[np.ndarray | None]:
+        """按键批量读取，未命中的位置为 None。"""
+        out: list[np.ndarray | None] = []
+        with self._lock:
+            for key in keys:
+                slot = self._slots.get(key)
+                vec = None
+                if slot is not None:
+                    # 先复制再校验：槽位被其他进程复用或正在改写时键或校验和对不上
+                    vec = np.array(self._vectors[slot])
+                    if int(self._sums[slot]) != _checksum(key, vec) or self._keys[slot].tobytes() != key:
+                        del self._slots[key]
+                        vec = None
+                if vec is None:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self.hits += 1
+                self._slots.move_to_end(key)
+                self._ticks[slot] = self._tick
+                self._tick += 1
+                out.append(vec)
+        return out
+
+    def put_many(self, keys: list[bytes], vectors) -> None:
+        arr = np.asarray(vectors, dtype=np.float32)
+        if arr.ndim != 2 or len(arr) != len(keys):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(arr.shape[1])
+                self._grow()
+            elif arr.shape[1] != self.dim:
+                logger.warning(f"嵌入维度 {arr.shape[1]} 与缓存维度 {self.dim} 不一致，跳过写入缓存")
+                return
+            for key, vec in zip(keys, arr):
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._take_slot()
+                self._keys[slot] = 0
+                self._vectors[slot] = vec
+                self._sums[slot] = _checksum(key, vec)
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._ticks[slot] = self._tick
+                self._tick += 1
+                self._slots[key] = slot
+                self._slots.move_to_end(key)
+
+    def flush(self) -> None:
+        for m in (self._vectors, self._keys, self._ticks, self._sums):
+            if m is not None:
+                m.flush()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带磁盘缓存的 Embeddings 包装：仅对缓存中没有的文本调用底层模型。
+    写入只更新内存映射，不逐次写回磁盘（查询路径不承担 msync）；索引构建结束时与进程退出时统一 flush。
+    """
+
+    def __init__(self, base: Embeddings, cache: EmbeddingCache):
+        self.base = base
+        self.cache = cache
+        atexit.register(cache.flush)
+
+    def _key(self, text: str, kind: str) -> bytes:
+        return cache_key(self.cache.model_name, self.cache.normalize, text, kind)
+
+    def _embed(self, texts: list[str], kind: str, compute) -> list[list[float]]:
+        keys = [self._key(t, kind) for t in texts]
+        cached = self.cache.get_many(keys)
+        missing: dict[bytes, str] = {}
+        for key, text, vec in zip(keys, texts, cached):
+            if vec is None:
+                missing.setdefault(key, text)
+        computed: dict[bytes, list[float]] = {}
+        if missing:
+            vectors = compute(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), vectors)
+            computed = dict(zip(missing.keys(), vectors))
+        return [vec.tolist() if vec is not None else list(computed[key]) for key, vec in zip(keys, cached)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, "document", self.base.embed_documents)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """批量查询向量（微批器、批量问答使用），与 embed_query 共用查询缓存条目。"""
+        return self._embed(texts, "query", lambda batch: embed_queries(self.base, batch))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], "query", lambda batch: [self.base.embed_query(batch[0])])[0]
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+本机嵌入服务：由单个进程持有嵌入模型（及磁盘嵌入缓存），各 API worker / 构建进程通过 Unix 套接字请求向量，
+N 个 worker 只占用一份模型内存、只冷启动一次；多个进程同时到达的请求在服务端合并为一次批量前向计算。
+
+协议（请求与响应格式相同）：4 字节大端长度 + JSON 头 + 可选二进制体（长度见头中的 body_bytes）。
+    请求  {"op": "embed", "texts": [...], "query": false}   → {"ok": true, "rows": n, "dim": d, "body_bytes": n*d*4} + float32 矩阵
+                                                      （query 为 true 时计算查询向量，缓存与文档向量分开）
+    请求  {"op": "stats"}                           → {"ok": true, "stats": {...}}
+    出错时 {"ok": false, "error": "..."}
+仅支持 POSIX（Unix 套接字）；启动方式见 scripts/embedding_server.py。
+"""
+import asyncio
+import json
+import signal
+import socket
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger_config import logger
+from .embedding_cache import embed_queries
+
+_HEADER = struct.Struct(">I")
+MAX_HEADER_BYTES = 64 * 2**20  # 单个请求头（含全部文本）的上限
+
+
+def _pack(header: dict, body: bytes = b"") -> bytes:
+    if body:
+        header = {**header, "body_bytes": len(body)}
+    raw = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(raw)) + raw + body
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("嵌入服务连接已关闭")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class EmbeddingServer:
+    """
+    嵌入服务端（asyncio）：各连接的请求进入同一队列，首个请求到达后最多再等待 max_wait_ms、或凑满 max_batch_size 条文本
+    即合并为一次 embed_documents（在线程中执行，不阻塞事件循环；同一批内重复的文本只计算一次）。
+    """
+
+    def __init__(self, embeddings: Embeddings, socket_path: str | Path, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.socket_path = Path(socket_path)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self._queue: asyncio.Queue | None = None
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def serve(self, stop: asyncio.Event) -> None:
+        """监听套接字直到 stop 被设置。"""
+        self._prepare_socket()
+        self._queue = asyncio.Queue()
+        worker = asyncio.create_task(self._run())
+        server = await asyncio.start_unix_server(self._handle, path=str(self.socket_path))
+        logger.info(f"嵌入服务已启动: {self.socket_path}（单批最多 {self.max_batch_size} 条，最多等待 {self.max_wait * 1000:g}ms）")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            # 先断开已有连接，让各连接的处理协程正常结束
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await server.wait_closed()
+            worker.cancel()
+            self.socket_path.unlink(missing_ok=True)
+            logger.info("嵌入服务已停止")
+
+    def _prepare_socket(self) -> None:
+        """清理上次异常退出遗留的套接字文件；已有服务在监听时拒绝启动。"""
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            self.socket_path.unlink()
+        else:
+            raise RuntimeError(f"已有嵌入服务在监听 {self.socket_path}")
+        finally:
+            probe.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    return
+                if size > MAX_HEADER_BYTES:
+                    writer.write(_pack({"ok": False, "error": f"请求过大（{size} 字节）"}))
+                    await writer.drain()
+                    return
+                request = json.loads(await reader.readexactly(size))
+                writer.write(await self._dispatch(request))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _dispatch(self, request: dict) -> bytes:
+        op = request.get("op")
+        try:
+            if op == "embed":
+                vectors = await self._embed(request["texts"], bool(request.get("query")))
+                return _pack({"ok": True, "rows": vectors.shape[0], "dim": vectors.shape[1]}, vectors.tobytes())
+            if op == "stats":
+                return _pack({"ok": True, "stats": self.stats()})
+            return _pack({"ok": False, "error": f"未知操作: {op}"})
+        except Exception as e:
+            return _pack({"ok": False, "error": str(e)})
+
+    async def _embed(self, texts: list[str], query: bool = False) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((texts, query, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[list[str], bool, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        count = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while count < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            batch.append(item)
+            count += len(item[0])
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = [item for item in await self._collect() if not item[2].done()]
+            # 查询与文档向量分开计算（两者的计算方式与缓存条目可能不同）
+            for query in (False, True):
+                group = [(texts, fut) for texts, q, fut in batch if q == query]
+                if group:
+                    await self._run_group(group, query)
+
+    async def _run_group(self, group: list[tuple[list[str], asyncio.Future]], query: bool) -> None:
+        unique = list(dict.fromkeys(text for texts, _ in group for text in texts))
+        compute = (lambda: embed_queries(self.embeddings, unique)) if query else (lambda: self.embeddings.embed_documents(unique))
+        try:
+            vectors = np.asarray(await asyncio.to_thread(compute), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"嵌入服务批量向量化失败（{len(unique)} 条）: {e}")
+            for _, fut in group:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        row = {text: i for i, text in enumerate(unique)}
+        self.batches += 1
+        self.requests += len(group)
+        self.texts += len(unique)
+        for texts, fut in group:
+            if not fut.done():
+                fut.set_result(vectors[[row[t] for t in texts]])
+
+    def stats(self) -> dict:
+        cache = getattr(self.embeddings, "cache", None)
+        return {
+            "clients": len(self._connections),
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_texts": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "embedding_cache": cache.stats() if cache is not None else None,
+        }
+
+
+class RemoteEmbeddings(Embeddings):
+    """通过 Unix 套接字请求本机嵌入服务的 Embeddings（线程安全：每个线程一条长连接，断开后自动重连一次）。"""
+
+    def __init__(self, socket_path: str | Path, timeout: float = 60.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ConnectionError(f"无法连接嵌入服务 {self.socket_path}（请先运行 scripts/embedding_server.py）: {e}") from e
+        return sock
+
+    def _drop(self, sock: socket.socket) -> None:
+        sock.close()
+        self._local.sock = None
+
+    def _request(self, header: dict) -> tuple[dict, bytes]:
+        payload = _pack(header)
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                sock.sendall(payload)
+                (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+                response = json.loads(_recv_exact(sock, size))
+                body = _recv_exact(sock, response["body_bytes"]) if response.get("body_bytes") else b""
+                break
+            except socket.timeout:
+                self._drop(sock)
+                raise
+            except OSError:
+                # 服务重启后旧连接失效：重连后重试一次
+                self._drop(sock)
+                if attempt:
+                    raise
+        if not response.get("ok"):
+            raise RuntimeError(f"嵌入服务出错: {response.get('error')}")
+        return response, body
+
+    def _embed(self, texts: list[str], query: bool) -> list[list[float]]:
+        if not texts:
+            return []
+        response, body = self._request({"op": "embed", "texts": list(texts), "query": query})
+        return np.frombuffer(body, dtype=np.float32).reshape(response["rows"], response["dim"]).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, query=False)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, query=True)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], query=True)[0]
+
+    def server_stats(self) -> dict:
+        return self._request({"op": "stats"})[0]["stats"]
+
+
+def serve(socket_path: str | Path | None = None) -> None:
+    """在当前进程加载嵌入模型（含磁盘缓存）并提供服务，直到收到 SIGINT / SIGTERM。"""
+    from config import get_settings
+    from .vector_store import _load_embeddings
+
+    s = get_settings()
+    path = socket_path or s.embedding_server_socket
+    if not path:
+        raise ValueError("未指定嵌入服务套接字路径（EMBEDDING_SERVER_SOCKET 或 --socket）")
+    embeddings = _load_embeddings(remote=False)
+    server = EmbeddingServer(embeddings, path, s.embedding_server_max_batch, s.embedding_server_max_wait_ms)
+
+    async def main() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await server.serve(stop)
+
+    asyncio.run(main())
+    flush = getattr(getattr(embeddings, "cache", None), "flush", None)
+    if flush:
+        flush()
+    logger.info(f"嵌入服务统计: {server.stats()}")
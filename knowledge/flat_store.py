@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+扁平向量库（NumPy）：Chroma 之外的可选后端，适合十万级以上文本块、多 worker 部署。
+
+- 向量：归一化后的 float32 矩阵，保存为 .npy，以内存映射方式只读打开，多个进程共享操作系统页缓存，无需各自拷贝；
+- 文本与元数据：逐条 JSON 拼接的数据文件 + 偏移数组，按需内存映射读取；
+- 检索：一次矩阵-向量乘法 + argpartition 取 top-k；
+- 可选 int8 量化（quantization="int8"）：另存按维度标量量化的 int8 编码（约为 float32 的 1/4），检索时只扫描编码，
+  每个查询取 k × rescore_factor 个候选再读取原始 float32 向量精确打分，常驻页缓存的向量数据约为原来的 1/4。
+
+写入（新增/删除）先记录在内存中，persist() 时合并并以新一代文件整体写出，最后原子替换指针文件 flat_index.json；
+其他进程检测到指针文件变化后自动切换到新一代文件，旧文件被替换后仍可被已映射的读者安全使用。
+"""
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from logger_config import logger
+
+FLAT_INDEX_FILENAME = "flat_index.json"
+QUANTIZATIONS = ("none", "int8")
+BLOCK_ROWS = 65536  # 分块写入的行数
+SCAN_BLOCK_ROWS = 4096  # int8 扫描时每次转换为 float32 的行数，限制临时内存
+
+
+class FlatVectorStore(VectorStore):
+    """与 answer_question / build_and_persist_index 所用 Chroma 接口兼容的内存映射扁平向量库（线程安全）。"""
+
+    def __init__(self, persist_directory: str | Path, embedding_function: Embeddings, quantization: str = "none", rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"不支持的量化方式: {quantization}")
+        self.persist_directory = Path(persist_directory)
+        self._embedding = embedding_function
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._pointer_mtime: int | None = None
+        self._generation: str | None = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    # ---------- 持久化 ----------
+
+    def _pointer_path(self) -> Path:
+        return self.persist_directory / FLAT_INDEX_FILENAME
+
+    def _files(self, generation: str) -> dict[str, Path]:
+        names = ("vectors.npy", "ids.npy", "offsets.npy", "records.bin", "codes.npy", "scales.npy")
+        return {name: self.persist_directory / f"flat_{generation}_{name}" for name in names}
+
+    def _reset_state(self) -> None:
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=str)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._records = np.zeros(0, dtype=np.uint8)
+        self._codes: np.ndarray | None = None  # int8 编码（仅量化模式）
+        self._scales: np.ndarray | None = None  # 每维反量化系数
+        self._stored_quantization = "none"  # 当前一代文件的量化方式
+        self._alive: np.ndarray | None = None  # 已删除的基础行标记为 False；None 表示全部有效
+        self._row_of: dict[str, int] | None = None  # 文本块 ID -> 基础行号，按需构建
+        self._pending: dict[str, tuple[np.ndarray, str, dict]] = {}  # 未持久化的新增：ID -> (向量, 文本, 元数据)
+        self._pending_matrix: tuple[np.ndarray, list[str]] | None = None
+
+    def _load(self) -> None:
+        with self._lock:
+            self._reset_state()
+            pointer = self._pointer_path()
+            try:
+                self._pointer_mtime = pointer.stat().st_mtime_ns
+                info = json.loads(pointer.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                self._pointer_mtime, self._generation = None, None
+                return
+            generation = info["generation"]
+            files = self._files(generation)
+            self._vectors = np.load(files["vectors.npy"], mmap_mode="r")
+            self._ids = np.load(files["ids.npy"], mmap_mode="r")
+            self._offsets = np.load(files["offsets.npy"], mmap_mode="r")
+            if files["records.bin"].stat().st_size:
+                self._records = np.memmap(files["records.bin"], dtype=np.uint8, mode="r")
+            if info.get("quantization") == "int8" and files["codes.npy"].exists():
+                self._codes = np.load(files["codes.npy"], mmap_mode="r")
+                self._scales = np.load(files["scales.npy"])
+            self._stored_quantization = info.get("quantization", "none")
+            self._generation = generation
+
+    def _maybe_reload(self) -> None:
+        """指针文件被其他进程更新（且本进程没有未持久化的修改）时切换到新一代文件；每次调用仅一次 stat。"""
+        try:
+            mtime = self._pointer_path().stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._pointer_mtime and not self._dirty():
+            self._load()
+
+    def _dirty(self) -> bool:
+        return bool(self._pending) or self._alive is not None
+
+    def persist(self) -> None:
+        """合并内存中的新增与删除，写出新一代文件并原子切换；无修改且量化方式未变时不写盘。"""
+        with self._lock:
+            if not self._dirty() and self._generation is not None and self._stored_quantization == self.quantization:
+                return
+            self.persist_directory.mkdir(parents=True, exist_ok=True)
+            keep = np.flatnonzero(self._alive) if self._alive is not None else np.arange(len(self._ids))
+            ids = [str(self._ids[i]) for i in keep]
+            pending_vectors = [vec for vec, _, _ in self._pending.values()]
+            dim = self._vectors.shape[1] if len(self._ids) else (len(pending_vectors[0]) if pending_vectors else 0)
+            generation = uuid.uuid4().hex[:12]
+            files = self._files(generation)
+
+            vectors = np.lib.format.open_memmap(files["vectors.npy"], mode="w+", dtype=np.float32, shape=(len(keep) + len(self._pending), dim))
+            for start in range(0, len(keep), BLOCK_ROWS):
+                rows = keep[start:start + BLOCK_ROWS]
+                vectors[start:start + len(rows)] = self._vectors[rows]
+            if pending_vectors:
+                vectors[len(keep):] = np.stack(pending_vectors)
+            vectors.flush()
+            if self.quantization == "int8" and vectors.size:
+                _write_int8_codes(vectors, files["codes.npy"], files["scales.npy"])
+            del vectors
+
+            offsets = [0]
+            with open(files["records.bin"], "wb") as f:
+                for i in keep:
+                    raw = self._records[self._offsets[i]:self._offsets[i + 1]].tobytes()
+                    f.write(raw)
+                    offsets.append(offsets[-1] + len(raw))
+                for cid, (_, text, metadata) in self._pending.items():
+                    raw = json.dumps({"t": text, "m": metadata}, ensure_ascii=False).encode("utf-8")
+                    f.write(raw)
+                    offsets.append(offsets[-1] + len(raw))
+                    ids.append(cid)
+            np.save(files["ids.npy"], np.array(ids, dtype=str))
+            np.save(files["offsets.npy"], np.array(offsets, dtype=np.int64))
+
+            pointer = self._pointer_path()
+            tmp = pointer.with_name(pointer.name + ".tmp")
+            tmp.write_text(json.dumps({"generation": generation, "count": len(ids), "dim": dim, "quantization": self.quantization}), encoding="utf-8")
+            os.replace(tmp, pointer)
+            old = self._generation
+            self._load()
+            if old:
+                for path in self._files(old).values():
+                    path.unlink(missing_ok=True)
+            logger.info(f"扁平向量库已持久化：{len(ids)} 个文本块（量化: {self.quantization}）-> {self.persist_directory}")
+
+    def delete_collection(self) -> None:
+        """删除全部数据文件（对应 Chroma.delete_collection）。"""
+        with self._lock:
+            generation = self._generation
+            self._reset_state()
+            self._pointer_path().unlink(missing_ok=True)
+            if generation:
+                for path in self._files(generation).values():
+                    path.unlink(missing_ok=True)
+            self._pointer_mtime, self._generation = None, None
+
+    # ---------- 写入 ----------
+
+    def _row_index(self) -> dict[str, int]:
+        if self._row_of is None:
+            self._row_of = {str(cid): i for i, cid in enumerate(self._ids)}
+        return self._row_of
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        return self.add_embeddings(ids, texts, self._embedding.embed_documents(texts), metadatas)
+
+    def add_embeddings(self, ids: list[str], texts: list[str], embeddings, metadatas: list[dict] | None = None) -> list[str]:
+        """写入已计算好的向量（如从索引快照导入），不调用嵌入模型；向量会重新归一化。"""
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.array(embeddings, dtype=np.float32, copy=True)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        with self._lock:
+            self._maybe_reload()
+            self._delete_base([cid for cid in ids if cid in self._row_index()])
+            for cid, vec, text, meta in zip(ids, vectors, texts, metadatas):
+                self._pending[cid] = (vec, text, meta or {})
+            self._pending_matrix = None
+        return ids
+
+    def add_documents(self, documents: list[Document], ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        return self.add_texts([d.page_content for d in documents], [d.metadata for d in documents], ids=ids)
+
+    def _delete_base(self, ids: list[str]) -> None:
+        rows = [self._row_index()[cid] for cid in ids if cid in self._row_index()]
+        if not rows:
+            return
+        if self._alive is None:
+            self._alive = np.ones(len(self._ids), dtype=bool)
+        self._alive[rows] = False
+        for cid in ids:
+            self._row_index().pop(cid, None)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._maybe_reload()
+            self._delete_base(ids)
+            for cid in ids:
+                if self._pending.pop(cid, None) is not None:
+                    self._pending_matrix = None
+
+    # ---------- 读取 ----------
+
+    def _record(self, row: int, offsets: np.ndarray | None = None, records: np.ndarray | None = None) -> tuple[str, dict]:
+        offsets = self._offsets if offsets is None else offsets
+        records = self._records if records is None else records
+        data = json.loads(records[offsets[row]:offsets[row + 1]].tobytes())
+        return data["t"], data["m"]
+
+    def _entry(self, cid: str) -> tuple[str, dict] | None:
+        if cid in self._pending:
+            _, text, meta = self._pending[cid]
+            return text, meta
+        row = self._row_index().get(cid)
+        return None if row is None else self._record(row)
+
+    def get(self, ids: list[str] | None = None, include: list[str] | None = None, limit: int | None = None, offset: int = 0, **kwargs: Any) -> dict:
+        """按 ID 或分页读取文本块，返回结构与 Chroma.get 相同：{ids, documents, metadatas}，include 含 embeddings 时另有向量矩阵。"""
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            self._maybe_reload()
+            if ids is None:
+                alive = self._alive if self._alive is not None else np.ones(len(self._ids), dtype=bool)
+                ids = [str(self._ids[i]) for i in np.flatnonzero(alive)] + list(self._pending)
+                ids = ids[offset:offset + limit if limit is not None else None]
+            found = [(cid, entry) for cid in ids if (entry := self._entry(cid)) is not None]
+            vectors = np.stack([self._vector(cid) for cid, _ in found]) if "embeddings" in include and found else None
+        result = {
+            "ids": [cid for cid, _ in found],
+            "documents": [text for _, (text, _) in found] if "documents" in include else None,
+            "metadatas": [meta for _, (_, meta) in found] if "metadatas" in include else None,
+        }
+        if "embeddings" in include:
+            result["embeddings"] = vectors if vectors is not None else np.zeros((0, self._vectors.shape[1] if len(self._ids) else 0), dtype=np.float32)
+        return result
+
+    def _vector(self, cid: str) -> np.ndarray:
+        if cid in self._pending:
+            return self._pending[cid][0]
+        return np.asarray(self._vectors[self._row_index()[cid]])
+
+    def _snapshot(self):
+        with self._lock:
+            self._maybe_reload()
+            if self._pending_matrix is None and self._pending:
+                self._pending_matrix = (np.stack([vec for vec, _, _ in self._pending.values()]), list(self._pending))
+            pending = self._pending_matrix if self._pending else None
+            return self._vectors, self._codes, self._scales, self._ids, self._offsets, self._records, self._alive, pending
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        """返回 [(Document, 余弦距离)]，距离越小越相关。"""
+        return self.similarity_search_by_vectors_with_relevance_scores([embedding], k, exact=kwargs.get("exact", False))[0]
+
+    def similarity_search_by_vectors_with_relevance_scores(self, embeddings: list[list[float]], k: int = 4, exact: bool = False) -> list[list[tuple[Document, float]]]:
+        """
+        批量检索：多个查询向量一次矩阵乘法打分，按输入顺序返回每个查询的 [(Document, 余弦距离)]。
+        量化模式下先扫描 int8 编码再精确重排候选；exact=True 时直接用 float32 全量打分（用于评估召回率）。
+        """
+        vectors, codes, scales, ids, offsets, records, alive, pending = self._snapshot()
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        # 每个查询的候选：(行号, 得分) 两个二维数组；行号 >= len(vectors) 表示尚未持久化的新增
+        if not len(vectors):
+            rows, scores = np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        elif codes is not None and not exact:
+            rows, scores = self._quantized_candidates(queries, vectors, codes, scales, alive, k)
+        else:
+            full = queries @ vectors.T
+            if alive is not None:
+                full[:, ~alive] = -np.inf
+            rows, scores = _top_k(full, k)
+        if pending is not None:
+            pending_scores = queries @ pending[0].T
+            pending_rows = np.broadcast_to(np.arange(len(pending[1])) + len(vectors), pending_scores.shape)
+            rows, scores = np.concatenate([rows, pending_rows], axis=1), np.concatenate([scores, pending_scores], axis=1)
+        batch = []
+        for row_ids, row_scores in zip(rows, scores):
+            results = []
+            for j in np.argsort(-row_scores)[:k]:
+                i, score = int(row_ids[j]), float(row_scores[j])
+                if not np.isfinite(score):
+                    break
+                if i < len(vectors):
+                    cid, (text, meta) = str(ids[i]), self._record(i, offsets, records)
+                else:
+                    cid = pending[1][i - len(vectors)]
+                    with self._lock:
+                        entry = self._entry(cid)
+                    if entry is None:
+                        continue
+                    text, meta = entry
+                results.append((Document(page_content=text, metadata=meta, id=cid), 1.0 - score))
+            batch.append(results)
+        return batch
+
+    def _quantized_candidates(self, queries: np.ndarray, vectors: np.ndarray, codes: np.ndarray, scales: np.ndarray, alive: np.ndarray | None, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """int8 编码分块估算全部得分，每个查询取前 k × rescore_factor 个候选，再读取这些行的原始向量精确打分。"""
+        approx = np.empty((len(queries), len(codes)), dtype=np.float32)
+        scaled = queries * scales
+        for start in range(0, len(codes), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            np.matmul(scaled, block.T, out=approx[:, start:start + len(block)])
+        if alive is not None:
+            approx[:, ~alive] = -np.inf
+        rows, estimated = _top_k(approx, k * self.rescore_factor)
+        order = np.argsort(rows, axis=1)  # 按行号顺序读取原始向量，内存映射访问更连续
+        rows, estimated = np.take_along_axis(rows, order, axis=1), np.take_along_axis(estimated, order, axis=1)
+        scores = np.empty_like(estimated)
+        for j in range(len(queries)):
+            scores[j] = vectors[rows[j]] @ queries[j]
+        return rows, np.where(np.isfinite(estimated), scores, -np.inf)
+
+    def iter_vectors(self, block_rows: int = BLOCK_ROWS) -> Iterator[np.ndarray]:
+        """分块遍历全部有效向量（含未持久化的新增），用于计算分区质心等统计。"""
+        vectors, _, _, _, _, _, alive, pending = self._snapshot()
+        for start in range(0, len(vectors), block_rows):
+            block = np.asarray(vectors[start:start + block_rows])
+            yield block if alive is None else block[alive[start:start + block_rows]]
+        if pending is not None:
+            yield pending[0]
+
+    def memory_stats(self) -> dict:
+        """检索需扫描的向量数据量（字节）：量化模式只扫描 int8 编码，原始向量仅按候选行读取。"""
+        vectors, codes = self._vectors, self._codes
+        return {
+            "quantization": "int8" if codes is not None else "none",
+            "rows": int(vectors.shape[0]),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "float32_bytes": int(vectors.nbytes),
+            "int8_bytes": int(codes.nbytes) if codes is not None else None,
+            "scan_bytes": int(codes.nbytes if codes is not None else vectors.nbytes),
+        }
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None, ids: list[str] | None = None, persist_directory: str | Path = "chroma_db", **kwargs: Any) -> "FlatVectorStore":
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        store.persist()
+        return store
+
+
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """按行取得分最高的 k 个 (列号, 得分)，不排序。"""
+    k = min(k, scores.shape[1])
+    rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return rows, np.take_along_axis(scores, rows, axis=1)
+
+
+def _write_int8_codes(vectors: np.ndarray, codes_path: Path, scales_path: Path) -> None:
+    """按维度对称标量量化：scale = 该维最大绝对值 / 127，code = round(x / scale)。"""
+    peak = np.zeros(vectors.shape[1], dtype=np.float32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        np.maximum(peak, np.abs(vectors[start:start + BLOCK_ROWS]).max(axis=0), out=peak)
+    scales = np.where(peak > 0, peak / 127, 1).astype(np.float32)
+    codes = np.lib.format.open_memmap(codes_path, mode="w+", dtype=np.int8, shape=vectors.shape)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        codes[start:start + BLOCK_ROWS] = np.clip(np.rint(vectors[start:start + BLOCK_ROWS] / scales), -127, 127)
+    codes.flush()
+    del codes
+    np.save(scales_path, scales)
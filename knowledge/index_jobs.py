@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+后台索引重建任务：/api/rebuild 只提交任务并立即返回任务 ID，构建在单个后台线程中依次执行（写入新版本目录，完成后原子切换），
+不占用请求线程，也不影响构建期间的查询。任务状态（排队/进行中/成功/失败）与按文件、文本块统计的进度可随时查询。
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from logger_config import logger
+
+MAX_JOB_HISTORY = 20
+
+
+class IndexJobManager:
+    """串行执行的重建任务队列（线程安全）。已有相同类型的任务在排队时直接返回该任务，不重复排队。"""
+
+    def __init__(self, max_history: int = MAX_JOB_HISTORY):
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._jobs: dict[str, dict] = {}  # 按提交顺序
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-rebuild")
+
+    def submit(self, full: bool = False) -> dict:
+        with self._lock:
+            for job in self._jobs.values():
+                if job["state"] == "queued" and job["full"] == full:
+                    return dict(job)
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "full": full,
+                "state": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": {},
+                "report": None,
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            self._trim()
+        self._executor.submit(self._run, job["id"])
+        return dict(job)
+
+    def _trim(self) -> None:
+        finished = [jid for jid, job in self._jobs.items() if job["state"] in ("succeeded", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[jid]
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id: str) -> None:
+        from .vector_store import update_index
+
+        job = self._jobs[job_id]
+        self._update(job_id, state="running", started_at=time.time())
+        try:
+            report = update_index(full_rebuild=job["full"], progress=lambda p: self._update(job_id, progress=p))
+            self._update(job_id, state="succeeded", report=report, finished_at=time.time())
+        except Exception as e:
+            logger.exception(f"索引重建任务失败: {job_id}")
+            self._update(job_id, state="failed", error=str(e), finished_at=time.time())
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
+
+
+_job_manager_instance: IndexJobManager | None = None
+_job_manager_lock = threading.Lock()
+
+
+def get_index_job_manager() -> IndexJobManager:
+    global _job_manager_instance
+    with _job_manager_lock:
+        if _job_manager_instance is None:
+            _job_manager_instance = IndexJobManager()
+        return _job_manager_instance
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+索引版本目录：每次重建写入 chroma_db/versions/<版本名>/ 下的全新目录，构建完成后原子替换指针文件 chroma_db/CURRENT 切换到新版本。
+查询始终读取指针指向的目录，不会看到构建到一半的索引；上一个版本保留用于回滚，更早的版本自动清理。
+
+兼容旧布局：没有 CURRENT 指针时，直接把 chroma_db 根目录当作当前版本（版本名 "."）。
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from logger_config import logger
+
+POINTER_FILENAME = "CURRENT"
+VERSIONS_DIRNAME = "versions"
+LEGACY_VERSION = "."
+
+_pointer_cache: dict[Path, tuple[int | None, dict]] = {}  # 根目录 -> (指针 mtime_ns, 指针内容)
+
+
+def read_pointer(root: Path) -> dict:
+    """读取指针 {"version": 当前版本名, "previous": 上一版本名或 None}；按 mtime 缓存，每次调用仅一次 stat。"""
+    path = Path(root) / POINTER_FILENAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {"version": LEGACY_VERSION, "previous": None}
+    cached = _pointer_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        try:
+            cached = (mtime, json.loads(path.read_text(encoding="utf-8")))
+        except Exception as e:
+            logger.warning(f"读取索引版本指针失败，使用根目录: {path}: {e}")
+            cached = (mtime, {"version": LEGACY_VERSION, "previous": None})
+        _pointer_cache[path] = cached
+    return cached[1]
+
+
+def version_dir(root: Path, version: str) -> Path:
+    return Path(root) if version == LEGACY_VERSION else Path(root) / VERSIONS_DIRNAME / version
+
+
+def active_dir(root: Path) -> Path:
+    """当前提供查询的索引目录。"""
+    return version_dir(root, read_pointer(root)["version"])
+
+
+def create_version(root: Path, copy_from: Path | None = None) -> tuple[str, Path]:
+    """
+    新建版本目录并返回 (版本名, 目录)。copy_from 不为空时先复制该目录的内容（增量更新在副本上进行，不改动正在服务的版本）。
+    """
+    name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:4]}"
+    target = Path(root) / VERSIONS_DIRNAME / name
+    if copy_from is not None and Path(copy_from).exists():
+        ignore = shutil.ignore_patterns(VERSIONS_DIRNAME, POINTER_FILENAME, "*.tmp")
+        shutil.copytree(copy_from, target, ignore=ignore)
+    else:
+        target.mkdir(parents=True)
+    return name, target
+
+
+def activate(root: Path, version: str) -> str | None:
+    """原子切换当前版本，返回被替换下来的版本名（保留为回滚目标）。"""
+    root = Path(root)
+    current = read_pointer(root)["version"]
+    pointer = root / POINTER_FILENAME
+    tmp = pointer.with_name(pointer.name + ".tmp")
+    tmp.write_text(json.dumps({"version": version, "previous": current, "activated_at": time.time()}), encoding="utf-8")
+    os.replace(tmp, pointer)
+    return current
+
+
+def rollback(root: Path) -> str | None:
+    """切回上一个版本；没有可用的上一版本时返回 None。"""
+    pointer = read_pointer(root)
+    previous = pointer.get("previous")
+    if not previous or not version_dir(root, previous).exists():
+        return None
+    activate(root, previous)
+    return previous
+
+
+def discard(root: Path, version: str) -> None:
+    """删除未激活的版本目录（构建失败时清理）。"""
+    if version != LEGACY_VERSION:
+        shutil.rmtree(version_dir(root, version), ignore_errors=True)
+
+
+def prune(root: Path) -> list[str]:
+    """
+    只保留当前与上一个版本，删除更早的版本目录；返回被删除的版本名。
+    版本名以时间开头，晚于当前版本创建的目录（可能是正在进行的构建）不删除。
+    """
+    pointer = read_pointer(root)
+    current = pointer["version"]
+    keep = {current, pointer.get("previous")}
+    base = Path(root) / VERSIONS_DIRNAME
+    removed = []
+    if base.is_dir():
+        for path in base.iterdir():
+            if path.is_dir() and path.name not in keep and (current == LEGACY_VERSION or path.name < current):
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path.name)
+    if removed:
+        logger.info(f"已清理旧索引版本: {', '.join(sorted(removed))}")
+    return removed
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+词法倒排索引（BM25）：中文按字二元组（bigram）、英文/数字按词切分，弥补向量检索对条款编号、表单名、专有名词不敏感的问题。
+
+索引与 Chroma 集合同步增量更新，以 CSR 形式（词表 + 偏移 + 文档号 + 词频）持久化在 chroma_db/lexical_index.npz。
+新增的文本块先进入内存中的待合并倒排，删除只打标记，查询或保存前统一合并压缩。
+"""
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from logger_config import logger
+
+LEXICAL_INDEX_FILENAME = "lexical_index.npz"
+
+_CJK = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    """切词：连续汉字切为字二元组（单字保留原字），英文与数字按词（含 1.2、v2-3 等形式）。"""
+    text = "".join(chr(ord(c) - 0xFEE0) if 0xFF01 <= ord(c) <= 0xFF5E else c for c in text.lower())
+    tokens: list[str] = []
+    for m in _TOKEN_RE.finditer(text):
+        word = m.group()
+        if "㐀" <= word[0]:
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class LexicalIndex:
+    """BM25 倒排索引，文档以 Chroma 文本块 ID 标识。"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunk_ids: list[str] = []
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.terms: dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.uint16)
+        self._doc_index: dict[str, int] = {}
+        self._pending: dict[str, list[tuple[int, int]]] = {}
+        self._pending_lengths: list[int] = []
+        self._dirty = False
+
+    # ---------- 持久化 ----------
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "LexicalIndex | None":
+        path = Path(persist_dir) / LEXICAL_INDEX_FILENAME
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                index = cls()
+                index.chunk_ids = data["chunk_ids"].tolist()
+                index.lengths = data["lengths"]
+                index.alive = np.ones(len(index.chunk_ids), dtype=bool)
+                index.terms = {t: i for i, t in enumerate(data["terms"].tolist())}
+                index.offsets = data["offsets"]
+                index.doc_ids = data["doc_ids"]
+                index.tfs = data["tfs"]
+            index._doc_index = {cid: i for i, cid in enumerate(index.chunk_ids)}
+            return index
+        except Exception as e:
+            logger.warning(f"读取词法索引失败，将重新构建: {path}: {e}")
+            return None
+
+    def save(self, persist_dir: Path) -> None:
+        self._compact()
+        path = Path(persist_dir) / LEXICAL_INDEX_FILENAME
+        tmp = path.with_name(path.name + ".tmp")
+        terms = sorted(self.terms, key=self.terms.get)
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                chunk_ids=np.array(self.chunk_ids, dtype=str),
+                lengths=self.lengths,
+                terms=np.array(terms, dtype=str),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs,
+            )
+        os.replace(tmp, path)
+
+    # ---------- 更新 ----------
+
+    def add(self, chunk_ids: list[str], texts: list[str]) -> None:
+        """新增文本块（已存在的 ID 先删除再添加）。"""
+        self.remove([cid for cid in chunk_ids if cid in self._doc_index])
+        base = len(self.chunk_ids)
+        for offset, (cid, text) in enumerate(zip(chunk_ids, texts)):
+            doc = base + offset
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                self._pending.setdefault(term, []).append((doc, min(tf, 65535)))
+            self._pending_lengths.append(len(tokens))
+            self._doc_index[cid] = doc
+            self.chunk_ids.append(cid)
+        self._dirty = True
+
+    def remove(self, chunk_ids: list[str]) -> None:
+        """删除文本块（打删除标记，合并时清理）。"""
+        if not chunk_ids:
+            return
+        self._flush_lengths()
+        for cid in chunk_ids:
+            doc = self._doc_index.pop(cid, None)
+            if doc is not None:
+                self.alive[doc] = False
+                self._dirty = True
+
+    def _flush_lengths(self) -> None:
+        if self._pending_lengths:
+            self.lengths = np.concatenate([self.lengths, np.array(self._pending_lengths, dtype=np.int32)])
+            self.alive = np.concatenate([self.alive, np.ones(len(self._pending_lengths), dtype=bool)])
+            self._pending_lengths = []
+
+    def _compact(self) -> None:
+        """合并待合并倒排、清理已删除文本块，重建紧凑的 CSR 结构。"""
+        if not self._dirty:
+            return
+        self._flush_lengths()
+        n_base_terms = len(self.terms)
+        term_rows = np.repeat(np.arange(n_base_terms, dtype=np.int64), np.diff(self.offsets))
+        docs, tfs = [self.doc_ids.astype(np.int64)], [self.tfs]
+        rows = [term_rows]
+        terms = dict(self.terms)
+        for term, postings in self._pending.items():
+            row = terms.setdefault(term, len(terms))
+            arr = np.array(postings, dtype=np.int64)
+            rows.append(np.full(len(arr), row, dtype=np.int64))
+            docs.append(arr[:, 0])
+            tfs.append(arr[:, 1].astype(np.uint16))
+        rows, docs, tfs = np.concatenate(rows), np.concatenate(docs), np.concatenate(tfs)
+
+        keep = self.alive[docs]
+        rows, docs, tfs = rows[keep], docs[keep], tfs[keep]
+        new_doc = np.cumsum(self.alive) - 1
+        docs = new_doc[docs]
+
+        # 丢弃已无倒排的词，重新编号
+        counts = np.bincount(rows, minlength=len(terms))
+        live_terms = np.flatnonzero(counts)
+        new_row = np.full(len(terms), -1, dtype=np.int64)
+        new_row[live_terms] = np.arange(len(live_terms))
+        rows = new_row[rows]
+        order = np.lexsort((docs, rows))
+        term_list = sorted(terms, key=terms.get)
+
+        self.terms = {term_list[t]: i for i, t in enumerate(live_terms)}
+        self.offsets = np.concatenate([[0], np.cumsum(counts[live_terms])]).astype(np.int64)
+        self.doc_ids = docs[order].astype(np.int32)
+        self.tfs = tfs[order]
+        self.chunk_ids = [cid for cid, a in zip(self.chunk_ids, self.alive) if a]
+        self.lengths = self.lengths[self.alive]
+        self.alive = np.ones(len(self.chunk_ids), dtype=bool)
+        self._doc_index = {cid: i for i, cid in enumerate(self.chunk_ids)}
+        self._pending = {}
+        self._dirty = False
+
+    # ---------- 查询 ----------
+
+    def __len__(self) -> int:
+        return len(self._doc_index)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """BM25 检索，返回 [(chunk_id, score)]，按得分降序。"""
+        self._compact()
+        n = len(self.chunk_ids)
+        if n == 0:
+            return []
+        avgdl = float(self.lengths.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / avgdl)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            row = self.terms.get(term)
+            if row is None:
+                continue
+            start, end = self.offsets[row], self.offsets[row + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[i], float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(ranked_lists: list[list[str]], k: int, rrf_k: int = 60) -> list[str]:
+    """倒数排名融合（RRF）：score(d) = Σ 1 / (rrf_k + rank)，返回融合后前 k 个键。"""
+    scores: dict[str, float] = {}
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
@@ -1,9 +1,27 @@
 # -*- coding: utf-8 -*-
-"""从目录加载多种格式的企业文档（PDF、Word、TXT、Markdown）。"""
+"""
+从目录加载多种格式的企业文档（PDF、Word、TXT、Markdown）。
+PDF、DOCX 按结构流式解析为章节（见 knowledge/chunking.py），切分时以章节为边界。
+各格式的解析库在首次加载该类型文件时才导入，导入本模块（以及 API 进程启动）不加载 pypdf、unstructured 等。
+"""
+import multiprocessing
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from xml.etree import ElementTree
 from langchain_core.documents import Document
 from logger_config import logger
+from metrics import DOCUMENTS_LOADED, FILES_LOADED, observe_stage
+from .chunking import SectionBuilder, chapter_level, clause_label
 
 
 def _load_txt_or_md(path: Path) -> list[Document]:
@@ -27,19 +45,127 @@ def _load_txt_or_md(path: Path) -> list[Document]:
         return []
 
 
+def _load_pdf(path: Path) -> list[Document]:
+    """
+    按页流式解析 .pdf：逐页提取文本并按行识别章、条，每页单独记录页码（page 从 0 开始）。
+    返回整个文件的章节列表；iter_load_files 不经过这里，直接按批写出 _iter_pdf_sections 的结果。
+    """
+    return list(_iter_pdf_sections(path))
+
+
+def _iter_pdf_sections(path: Path) -> Iterator[Document]:
+    from pypdf import PdfReader
+
+    builder = SectionBuilder({"source": str(path), "filename": path.name})
+    reader = PdfReader(str(path))
+    for number, page in enumerate(reader.pages):
+        yield from builder.start_page(number)
+        yield from builder.text(page.extract_text() or "")
+    yield from builder.flush()
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_HEADING_STYLE = re.compile(r"^(?:heading|标题)\s*(\d)$", re.IGNORECASE)
+
+
 def _load_docx(path: Path) -> list[Document]:
-    """使用 python-docx 加载 .docx 文件（仅支持 .docx，不支持旧版 .doc）。"""
+    """
+    流式解析 .docx（仅支持 .docx，不支持旧版 .doc）：直接增量读取压缩包内的 word/document.xml，
+    按正文顺序逐个处理段落与表格、处理完即释放，不构建整篇文档对象；标题样式、「第X章」「第X条」与表格行决定章节边界。
+    返回整个文件的章节列表；iter_load_files 不经过这里，直接按批写出 _iter_docx_sections 的结果。
+    """
     try:
-        from docx import Document as DocxDocument
-        doc = DocxDocument(str(path))
-        parts = [p.text for p in doc.paragraphs if p.text.strip()]
-        text = "\n\n".join(parts)
-        if not text.strip():
-            return []
-        return [Document(page_content=text, metadata={"source": str(path), "filename": path.name})]
+        return list(_iter_docx_sections(path))
     except Exception as e:
-        logger.warning(f"python-docx 加载失败 {path}: {e}")
+        logger.warning(f"解析 .docx 失败 {path}: {e}")
+        return []
+
+
+def _iter_docx_sections(path: Path) -> Iterator[Document]:
+    builder = SectionBuilder({"source": str(path), "filename": path.name})
+    with zipfile.ZipFile(path) as archive:
+        styles = _docx_heading_styles(archive)
+        with archive.open("word/document.xml") as f:
+            body = None
+            table_depth = 0
+            for event, elem in ElementTree.iterparse(f, events=("start", "end")):
+                if elem.tag == f"{_W}tbl":
+                    table_depth += 1 if event == "start" else -1
+                if event == "start":
+                    if elem.tag == f"{_W}body":
+                        body = elem
+                    continue
+                if table_depth or body is None or elem.tag not in (f"{_W}p", f"{_W}tbl"):
+                    continue
+                if elem.tag == f"{_W}p":
+                    yield from _docx_paragraph(builder, elem, styles)
+                else:
+                    yield from builder.table([_docx_row(tr) for tr in elem.iterfind(f"{_W}tr")])
+                # 顶层段落、表格处理完即从树中移除，内存占用与文档长度无关
+                elem.clear()
+                if elem in body:
+                    body.remove(elem)
+    yield from builder.flush()
+
+
+def _docx_heading_styles(archive: zipfile.ZipFile) -> dict[str, int]:
+    """styleId → 标题级别：样式名为 Heading N / 标题 N / Title，或样式定义了大纲级别。"""
+    try:
+        root = ElementTree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    levels = {}
+    for style in root.iterfind(f"{_W}style"):
+        name = style.find(f"{_W}name")
+        name = name.get(f"{_W}val", "") if name is not None else ""
+        outline = style.find(f"{_W}pPr/{_W}outlineLvl")
+        m = _HEADING_STYLE.match(name.strip())
+        if m:
+            levels[style.get(f"{_W}styleId")] = int(m.group(1))
+        elif name.strip().lower() in ("title", "标题"):
+            levels[style.get(f"{_W}styleId")] = 0
+        elif outline is not None and int(outline.get(f"{_W}val", 9)) < 9:
+            levels[style.get(f"{_W}styleId")] = int(outline.get(f"{_W}val")) + 1
+    return levels
+
+
+def _docx_text(elem) -> str:
+    parts = []
+    for node in elem.iter():
+        if node.tag == f"{_W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{_W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _docx_paragraph(builder: SectionBuilder, p, styles: dict[str, int]) -> list[Document]:
+    text = _docx_text(p).strip()
+    if not text:
         return []
+    level = None
+    outline = p.find(f"{_W}pPr/{_W}outlineLvl")
+    style = p.find(f"{_W}pPr/{_W}pStyle")
+    if outline is not None and int(outline.get(f"{_W}val", 9)) < 9:
+        level = int(outline.get(f"{_W}val")) + 1
+    elif style is not None:
+        level = styles.get(style.get(f"{_W}val"))
+    if level is None:
+        level = chapter_level(text)
+    if level is not None:
+        return builder.heading(level, text)
+    label = clause_label(text)
+    if label is not None:
+        return builder.clause_start(label, text)
+    return builder.line(text)
+
+
+def _docx_row(tr) -> str:
+    """表格行：各单元格文本以 | 分隔（单元格内换行替换为空格）。"""
+    cells = (" ".join(_docx_text(tc).split()) for tc in tr.iterfind(f"{_W}tc"))
+    return " | ".join(cells)
 
 
 def _load_doc(path: Path) -> list[Document]:
@@ -73,20 +199,22 @@ def _load_doc(path: Path) -> list[Document]:
 
 # 支持的后缀与加载方式（Loader 类或 (path -> list[Document]) 函数）
 LOADER_MAP = {
-    ".pdf": PyPDFLoader,
+    ".pdf": _load_pdf,
     ".txt": _load_txt_or_md,
     ".md": _load_txt_or_md,
     ".markdown": _load_txt_or_md,
+    ".docx": _load_docx,
 }
-# docx/doc 使用自定义函数
-try:
-    import docx  # noqa: F401
-    LOADER_MAP[".docx"] = _load_docx
-except ImportError:
-    pass
 # .doc（旧版 Word）单独处理，使用 unstructured
 LOADER_MAP[".doc"] = _load_doc
 
+# 按章节流式解析的格式：iter_load_files 在解析进程内分批写出章节，不在内存中攒整个文件
+_SECTION_PARSERS = {
+    ".pdf": _iter_pdf_sections,
+    ".docx": _iter_docx_sections,
+}
+SECTION_BATCH_SIZE = 64  # 解析进程每次写出、主进程每次读回的章节数
+
 
 def _load_file(path: Path) -> list[Document]:
     """加载单个文件，返回 Document 列表。"""
@@ -96,10 +224,10 @@ def _load_file(path: Path) -> list[Document]:
         logger.warning(f"暂不支持的文件格式: {path.name} ({suffix})")
         return []
     try:
-        if callable(loader) and not hasattr(loader, "load"):
-            return loader(path)
-        loader_instance = loader(str(path))
-        docs = loader_instance.load()
+        if not hasattr(loader, "load"):
+            docs = loader(path)
+        else:
+            docs = loader(str(path)).load()
         for d in docs:
             d.metadata.setdefault("source", str(path))
             d.metadata.setdefault("filename", path.name)
@@ -109,27 +237,163 @@ def _load_file(path: Path) -> list[Document]:
         return []
 
 
-def load_documents_from_directory(directory: str | Path) -> list[Document]:
+def _load_file_spooled(path: Path, spool_dir: str) -> tuple[str | list[Document], int, float]:
     """
-    从指定目录递归加载所有支持格式的文档。
-    支持: .pdf, .txt, .md, .docx 等。
+    在解析进程内执行（单进程时在当前进程）：PDF、DOCX 边解析边把章节按 SECTION_BATCH_SIZE 个一批写入 spool_dir 下的临时文件，
+    返回 (临时文件路径, 章节数, 耗时秒数)，解析进程不攒整个文件的章节，进程间也只传路径；其他格式整体加载，返回 (docs, 数量, 耗时)。
+    解析中途失败时整个文件记为空，不产出已写出的部分。
+    """
+    started = time.perf_counter()
+    parse = _SECTION_PARSERS.get(path.suffix.lower())
+    if parse is None:
+        docs = _load_file(path)
+        return docs, len(docs), time.perf_counter() - started
+    fd, spool = tempfile.mkstemp(suffix=".sections", dir=spool_dir)
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            batch = []
+            for doc in parse(path):
+                batch.append(doc)
+                if len(batch) >= SECTION_BATCH_SIZE:
+                    pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+                count += len(batch)
+    except Exception as e:
+        logger.error(f"加载文件失败 {path}: {e}")
+        count = 0
+    if not count:
+        os.unlink(spool)
+        return [], 0, time.perf_counter() - started
+    return spool, count, time.perf_counter() - started
+
+
+def _read_spool(spool: str) -> Iterator[Document]:
+    """逐批读回解析进程写出的章节，读完（或迭代器被关闭）即删除临时文件。"""
+    try:
+        with open(spool, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+    finally:
+        Path(spool).unlink(missing_ok=True)
+
+
+def _open_loaded(result: str | list[Document]) -> Iterator[Document]:
+    return _read_spool(result) if isinstance(result, str) else iter(result)
+
+
+def _record_load(path: Path, count: int, seconds: float | None) -> None:
+    if seconds is not None:
+        observe_stage("load_file", seconds)
+    FILES_LOADED.inc(suffix=path.suffix.lower(), result="ok" if count else "empty_or_failed")
+    DOCUMENTS_LOADED.inc(count)
+
+
+def _process_context():
+    """
+    解析进程的启动方式：forkserver（不支持时 spawn），不直接 fork 当前进程。
+    API 进程内后台重建时已有 uvicorn、HTTP 连接池、预热等线程，fork 会继承其他线程持有的锁（如日志锁）而可能死锁。
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def iter_load_files(
+    paths: Iterable[Path],
+    max_workers: int | None = None,
+    max_pending: int | None = None,
+) -> Iterator[tuple[Path, Iterator[Document]]]:
     """
+    使用进程池并行解析文件，按完成顺序逐个产出 (path, docs)，docs 为该文件 Document 的迭代器，须在取下一个文件前读完。
+    PDF、DOCX 的章节由解析进程分批写入临时文件、在这里逐批读回（见 _load_file_spooled），单个大文件不会整体驻留内存或整体跨进程传输。
+    同时在途的文件数不超过 max_pending（默认 2 × 进程数），消费端处理慢时不会继续提交，内存与临时文件占用有上限。
+    单个文件失败只产出空迭代器；解析进程崩溃时，当时在途的文件记为失败，其余文件换新进程池继续。
+    """
+    queue = deque(paths)
+    workers = max_workers or os.cpu_count() or 1
+    spool_dir = tempfile.mkdtemp(prefix="rag-sections-")
+    try:
+        if workers <= 1 or len(queue) <= 1:
+            for path in queue:
+                result, count, seconds = _load_file_spooled(path, spool_dir)
+                _record_load(path, count, seconds)
+                yield path, _open_loaded(result)
+            return
+        yield from _iter_load_pool(queue, workers, max_pending or workers * 2, spool_dir)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def _iter_load_pool(queue: deque, workers: int, max_pending: int, spool_dir: str) -> Iterator[tuple[Path, Iterator[Document]]]:
+    while queue:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(queue)), mp_context=_process_context())
+        pending = {}
+        broken = False
+        try:
+            while queue or pending:
+                while queue and len(pending) < max_pending:
+                    path = queue.popleft()
+                    pending[pool.submit(_load_file_spooled, path, spool_dir)] = path
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    seconds = None
+                    try:
+                        result, count, seconds = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        logger.error(f"解析进程异常退出，文件记为加载失败: {path}")
+                        result, count = [], 0
+                    except Exception as e:
+                        logger.error(f"加载文件失败 {path}: {e}")
+                        result, count = [], 0
+                    _record_load(path, count, seconds)
+                    yield path, _open_loaded(result)
+                if broken:
+                    for path in pending.values():
+                        logger.error(f"解析进程异常退出，文件记为加载失败: {path}")
+                        _record_load(path, 0, None)
+                        yield path, iter([])
+                    pending.clear()
+                    break
+        finally:
+            pool.shutdown(wait=not broken, cancel_futures=True)
+
+
+def iter_documents_from_directory(directory: str | Path, max_workers: int | None = None) -> Iterator[Document]:
+    """流式版本的 load_documents_from_directory：并行解析，逐个产出 Document，不在内存中汇总全部文档。"""
     directory = Path(directory)
     if not directory.is_dir():
         logger.warning(f"目录不存在或不是目录: {directory}")
-        return []
+        return
 
-    all_docs: list[Document] = []
     supported = set(LOADER_MAP.keys())
-    for path in directory.rglob("*"):
-        if not path.is_file():
-            continue
-        if path.suffix.lower() not in supported:
-            continue
-        docs = _load_file(path)
-        all_docs.extend(docs)
-        if docs:
-            logger.info(f"已加载: {path.name} -> {len(docs)} 个片段")
+    paths = [p for p in directory.rglob("*") if p.is_file() and p.suffix.lower() in supported]
+    total = 0
+    for path, docs in iter_load_files(paths, max_workers=max_workers):
+        count = 0
+        for doc in docs:
+            count += 1
+            yield doc
+        if count:
+            logger.info(f"已加载: {path.name} -> {count} 个片段")
+        total += count
+    logger.info(f"共加载 {total} 个文档块，来自目录 {directory}")
+
 
-    logger.info(f"共加载 {len(all_docs)} 个文档块，来自目录 {directory}")
-    return all_docs
+def load_documents_from_directory(directory: str | Path, max_workers: int | None = None) -> list[Document]:
+    """
+    从指定目录递归加载所有支持格式的文档（进程池并行解析）。
+    支持: .pdf, .txt, .md, .docx 等。
+    """
+    return list(iter_documents_from_directory(directory, max_workers=max_workers))
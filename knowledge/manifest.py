@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""索引清单（manifest）：记录每个源文件的路径、mtime、大小、内容哈希及其产生的文本块 ID，用于增量重建索引。"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from logger_config import logger
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_FORMAT = 1
+
+
+def new_manifest(params: dict, index_version: int = 0) -> dict:
+    """创建空清单。params 为影响索引内容的参数（嵌入模型、切分参数等），变化时需全量重建。"""
+    return {
+        "format": MANIFEST_FORMAT,
+        "index_version": index_version,
+        "params": params,
+        "files": {},
+    }
+
+
+def load_manifest(persist_dir: Path) -> dict:
+    """读取清单；不存在或损坏时返回空清单（params 为 None，会触发全量重建）。"""
+    path = Path(persist_dir) / MANIFEST_FILENAME
+    if not path.exists():
+        return new_manifest(params=None)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("format") != MANIFEST_FORMAT:
+            logger.warning(f"索引清单格式不兼容，将全量重建: {path}")
+            return new_manifest(params=None, index_version=int(data.get("index_version", 0)))
+        data.setdefault("files", {})
+        return data
+    except Exception as e:
+        logger.warning(f"读取索引清单失败，将全量重建: {path}: {e}")
+        return new_manifest(params=None)
+
+
+def save_manifest(persist_dir: Path, manifest: dict) -> None:
+    """原子写入清单（先写临时文件再替换），避免进程中断留下半截文件。"""
+    path = Path(persist_dir) / MANIFEST_FILENAME
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    """按块计算文件 sha256，避免大文件一次性读入内存。"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id(rel_path: str, sha256: str, index: int) -> str:
+    """文本块 ID：由相对路径 + 内容哈希 + 序号确定，重复执行得到相同 ID（写入时 upsert 幂等）。"""
+    prefix = hashlib.sha1(f"{rel_path}\0{sha256}".encode("utf-8")).hexdigest()[:20]
+    return f"{prefix}-{index:05d}"
+
+
+def scan_directory(directory: Path, supported: set[str]) -> dict[str, Path]:
+    """递归列出目录下所有支持格式的文件：{相对路径(posix): 绝对路径}。"""
+    directory = Path(directory)
+    files: dict[str, Path] = {}
+    if not directory.is_dir():
+        return files
+    for path in directory.rglob("*"):
+        if not path.is_file() or path.suffix.lower() not in supported:
+            continue
+        files[path.relative_to(directory).as_posix()] = path
+    return files
+
+
+def diff_files(files: dict[str, Path], manifest: dict) -> dict:
+    """
+    对比当前文件与清单。mtime 与大小均未变化的文件直接视为未变更（不读内容）；
+    否则计算哈希，哈希相同仅刷新清单中的 mtime/大小（调用方保存清单后，下次不必再读内容）。
+    返回: { "added": [(rel, path, stat, sha)], "modified": [...], "removed": [rel], "unchanged": [rel], "refreshed": [rel] }
+    """
+    known = manifest.get("files", {})
+    added, modified, unchanged, refreshed = [], [], [], []
+    for rel, path in sorted(files.items()):
+        st = path.stat()
+        entry = known.get(rel)
+        if entry and entry.get("mtime") == st.st_mtime and entry.get("size") == st.st_size:
+            unchanged.append(rel)
+            continue
+        sha = file_sha256(path)
+        if entry and entry.get("sha256") == sha:
+            entry["mtime"] = st.st_mtime
+            entry["size"] = st.st_size
+            unchanged.append(rel)
+            refreshed.append(rel)
+        elif entry:
+            modified.append((rel, path, st, sha))
+        else:
+            added.append((rel, path, st, sha))
+    removed = sorted(set(known) - set(files))
+    return {"added": added, "modified": modified, "removed": removed, "unchanged": unchanged, "refreshed": refreshed}
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime 嵌入后端（EMBEDDING_BACKEND=onnx）：把配置的 sentence-transformers 模型导出为 ONNX（可选动态 int8 量化），
+用 ONNX Runtime 在 CPU 上推理，替代 PyTorch，索引构建与查询向量化的 CPU 开销更低。
+
+- 导出：首次使用时在 onnx_models/<模型名>/ 下导出 model.onnx、tokenizer.json 与 export.json（池化方式、最大长度、维度），
+  ONNX_QUANTIZATION=int8 时另存动态量化的 model_int8.onnx；导出需要 torch 与 sentence-transformers，
+  也可在其他机器上用 scripts/export_onnx.py 导出后复制目录，推理只依赖 onnxruntime 与 tokenizers；
+- 推理：分词后按长度排序，长度相近的文本组成一批，只填充到批内最长，批大小受 onnx_batch_size 与 onnx_max_batch_tokens 限制；
+  按导出时的池化方式（mean / cls）取句向量并归一化，与 sentence-transformers 的输出一致；
+- int8 量化的向量与原模型有少量偏差，嵌入缓存与索引参数按 "<模型名>#int8" 区分，不与 float32 的向量混用。
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import PROJECT_ROOT
+from logger_config import logger
+
+EXPORT_META_FILENAME = "export.json"
+MODEL_FILENAMES = {"none": "model.onnx", "int8": "model_int8.onnx"}
+ONNX_OPSET = 14
+
+
+def model_export_dir(base_dir: Path, model_name: str) -> Path:
+    return Path(base_dir) / model_name.replace("/", "__")
+
+
+def export_onnx_model(model_name: str, target_dir: Path, quantization: str = "none", force: bool = False) -> Path:
+    """
+    导出模型（已导出且 force=False 时跳过），返回对应量化方式的 .onnx 文件路径。
+    需要 torch 与 sentence-transformers；int8 量化由 onnxruntime.quantization 完成。
+    """
+    target_dir = Path(target_dir)
+    model_path = target_dir / MODEL_FILENAMES["none"]
+    if force or not (model_path.exists() and (target_dir / EXPORT_META_FILENAME).exists()):
+        _export_float(model_name, target_dir)
+    if quantization == "int8":
+        quantized = target_dir / MODEL_FILENAMES["int8"]
+        if force or not quantized.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            started = time.perf_counter()
+            quantize_dynamic(str(model_path), str(quantized), weight_type=QuantType.QInt8)
+            logger.info(f"已生成 int8 动态量化模型: {quantized}（{quantized.stat().st_size / 1e6:.1f} MB，耗时 {time.perf_counter() - started:.1f}s）")
+        return quantized
+    return model_path
+
+
+def _export_float(model_name: str, target_dir: Path) -> None:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    started = time.perf_counter()
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, tokenizer = st[0].auto_model.eval(), st.tokenizer
+    pooling = st[1].get_pooling_mode_str() if len(st) > 1 and hasattr(st[1], "get_pooling_mode_str") else "mean"
+    if pooling not in ("mean", "cls"):
+        raise ValueError(f"ONNX 后端不支持池化方式 {pooling}（仅支持 mean、cls）")
+    input_names = list(tokenizer.model_input_names)
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = transformer
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    sample = tokenizer(["导出示例文本", "sample"], padding=True, return_tensors="pt")
+    axes = {0: "batch", 1: "sequence"}
+    target_dir.mkdir(parents=True, exist_ok=True)
+    tmp = target_dir / (MODEL_FILENAMES["none"] + ".tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(),
+            tuple(sample[name] for name in input_names),
+            str(tmp),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{name: axes for name in input_names}, "last_hidden_state": axes},
+            opset_version=ONNX_OPSET,
+        )
+    os.replace(tmp, target_dir / MODEL_FILENAMES["none"])
+    tokenizer.save_pretrained(str(target_dir))
+    if not (target_dir / "tokenizer.json").exists():
+        raise ValueError(f"模型 {model_name} 没有 fast tokenizer（tokenizer.json），ONNX 后端无法使用")
+    meta = {
+        "model": model_name,
+        "pooling": pooling,
+        "max_seq_length": int(st.max_seq_length),
+        "dim": int(st.get_sentence_embedding_dimension()),
+        "input_names": input_names,
+        "pad_token_id": int(tokenizer.pad_token_id or 0),
+    }
+    (target_dir / EXPORT_META_FILENAME).write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    logger.info(f"已导出 ONNX 模型: {model_name} -> {target_dir}（耗时 {time.perf_counter() - started:.1f}s）")
+
+
+class OnnxEmbeddings(Embeddings):
+    """LangChain Embeddings 实现：ONNX Runtime CPU 推理 + 按长度分桶的动态批处理（线程安全）。"""
+
+    def __init__(
+        self,
+        model_dir: Path,
+        quantization: str = "none",
+        intra_op_threads: int = 0,
+        batch_size: int = 32,
+        max_batch_tokens: int = 8192,
+        normalize: bool = True,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        self.meta = json.loads((model_dir / EXPORT_META_FILENAME).read_text(encoding="utf-8"))
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.normalize = normalize
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=self.meta["max_seq_length"])
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(str(model_dir / MODEL_FILENAMES[quantization]), options, providers=["CPUExecutionProvider"])
+        self._inputs = [i.name for i in self.session.get_inputs()]
+
+    def _batches(self, lengths: list[int]) -> list[list[int]]:
+        """按长度升序把文本分批：每批不超过 batch_size 条，且 条数 × 批内最长 不超过 max_batch_tokens。"""
+        batches: list[list[int]] = []
+        current: list[int] = []
+        for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+            if current and (len(current) >= self.batch_size or (len(current) + 1) * lengths[i] > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run(self, encodings: list) -> np.ndarray:
+        width = max(1, max(len(e.ids) for e in encodings))
+        input_ids = np.full((len(encodings), width), self.meta["pad_token_id"], dtype=np.int64)
+        attention = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, e in enumerate(encodings):
+            input_ids[row, :len(e.ids)] = e.ids
+            attention[row, :len(e.ids)] = 1
+        feeds = {"input_ids": input_ids, "attention_mask": attention, "token_type_ids": np.zeros_like(input_ids)}
+        hidden = self.session.run(None, {name: feeds[name] for name in self._inputs})[0]
+        if self.meta["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention[:, :, None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """批量嵌入，返回 len(texts) × dim 的 float32 矩阵（按输入顺序）。"""
+        result = np.zeros((len(texts), self.meta["dim"]), dtype=np.float32)
+        if not texts:
+            return result
+        encodings = self.tokenizer.encode_batch(list(texts))
+        for batch in self._batches([len(e.ids) for e in encodings]):
+            result[batch] = self._run([encodings[i] for i in batch])
+        return result
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_array([text])[0].tolist()
+
+
+def load_onnx_embeddings(s, normalize: bool = True) -> OnnxEmbeddings:
+    """按配置加载 ONNX 后端；尚未导出时先导出（需要 torch 与 sentence-transformers）。"""
+    model_dir = model_export_dir(PROJECT_ROOT / s.onnx_model_dir, s.embedding_model)
+    if not (model_dir / MODEL_FILENAMES[s.onnx_quantization]).exists() or not (model_dir / EXPORT_META_FILENAME).exists():
+        logger.info(f"未找到 {s.embedding_model} 的 ONNX 模型，开始导出到 {model_dir}")
+        export_onnx_model(s.embedding_model, model_dir, s.onnx_quantization)
+    embeddings = OnnxEmbeddings(
+        model_dir,
+        quantization=s.onnx_quantization,
+        intra_op_threads=s.onnx_intra_op_threads,
+        batch_size=s.onnx_batch_size,
+        max_batch_tokens=s.onnx_max_batch_tokens,
+        normalize=normalize,
+    )
+    logger.info(f"ONNX 嵌入模型已加载: {model_dir.name}（量化: {s.onnx_quantization}，线程: {s.onnx_intra_op_threads or '默认'}）")
+    return embeddings
+
+
+def embedding_identity(s) -> str:
+    """嵌入缓存与索引参数使用的模型标识：int8 量化的 ONNX 模型与原模型向量不完全相同，单独区分。"""
+    if s.embedding_backend == "onnx" and s.onnx_quantization == "int8":
+        return f"{s.embedding_model}#int8"
+    return s.embedding_model
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+知识库分区：按 knowledge_docs 下的一级目录（如 人事/、财务/、IT/）把索引拆成互相独立的分区，每个分区有自己的向量库与词法索引，
+检索只访问相关分区，开销随相关分区而不是整个知识库的规模增长。
+
+- 目录布局：<索引版本目录>/partitions/<分区名>/；未启用分区时整个版本目录就是唯一的分区（名称为空串）；
+- knowledge_docs 根目录下的文件归入 DEFAULT_PARTITION；
+- 路由：请求未指定范围时，按查询向量与各分区质心（分区内全部文本块向量的均值）的相似度，选最接近的分区及与其相差不超过 margin 的分区；
+  问题中出现分区名只给该分区的相似度加 name_boost，仍与其他分区一同比较，不直接选中。
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from logger_config import logger
+
+ROOT_PARTITION = ""
+DEFAULT_PARTITION = "通用"
+PARTITIONS_DIRNAME = "partitions"
+PARTITION_INFO_FILENAME = "partition.json"
+
+
+class IndexPartition:
+    """
+    一个分区的检索对象：向量库、词法索引（可能为 None）、路由用的质心向量，
+    以及入库去重的出处列表 sources {文本块 ID: [内容重复、未单独入库的其他文件]}（构建期间另有 dedup 去重索引）。
+    """
+
+    def __init__(self, name: str, store, lexical, centroid: list[float] | None = None, chunks: int = 0):
+        self.name = name
+        self.store = store
+        self.lexical = lexical
+        self.centroid = np.asarray(centroid, dtype=np.float32) if centroid is not None else None
+        self.chunks = chunks
+        self.sources: dict[str, list[str]] = {}
+        self.dedup = None
+
+
+def partition_of(rel_path: str) -> str:
+    """文件（相对 knowledge_docs 的 posix 路径）所属分区：一级目录名，根目录下的文件归入 DEFAULT_PARTITION。"""
+    head, sep, _ = rel_path.partition("/")
+    return head if sep else DEFAULT_PARTITION
+
+
+def partition_dir(persist_dir: Path, name: str) -> Path:
+    return Path(persist_dir) if name == ROOT_PARTITION else Path(persist_dir) / PARTITIONS_DIRNAME / name
+
+
+def list_partition_dirs(persist_dir: Path) -> dict[str, Path]:
+    base = Path(persist_dir) / PARTITIONS_DIRNAME
+    if not base.is_dir():
+        return {}
+    return {path.name: path for path in sorted(base.iterdir()) if path.is_dir()}
+
+
+def load_partition_info(path: Path) -> dict:
+    try:
+        return json.loads((Path(path) / PARTITION_INFO_FILENAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"读取分区信息失败: {path}: {e}")
+        return {}
+
+
+def save_partition_info(path: Path, chunks: int, centroid: list[float] | None) -> None:
+    target = Path(path) / PARTITION_INFO_FILENAME
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(json.dumps({"chunks": chunks, "centroid": centroid}), encoding="utf-8")
+    os.replace(tmp, target)
+
+
+def route(
+    question: str,
+    embedding: list[float],
+    partitions: list[IndexPartition],
+    max_partitions: int,
+    margin: float,
+    name_boost: float = 0.0,
+) -> list[IndexPartition]:
+    """
+    为未指定范围的问题选择要检索的分区（至少一个，至多 max_partitions 个）：按问题向量与各分区质心的相似度排序，
+    与最高分相差不超过 margin 的分区一并检索。问题中出现分区名只给该分区加 name_boost，不跳过质心比较；
+    name_boost 不超过 margin 时，内容最相关的分区总在 margin 之内，不会因问题碰巧提到其他分区名而被挤掉。
+    """
+    scored = [p for p in partitions if p.centroid is not None]
+    if len(scored) < len(partitions):
+        return partitions  # 缺少质心（旧版本分区）时不做取舍
+    query = np.asarray(embedding, dtype=np.float32)
+    similarity = np.array([float(p.centroid @ query) + (name_boost if p.name and p.name in question else 0.0) for p in scored])
+    order = np.argsort(-similarity)
+    best = similarity[order[0]]
+    return [scored[i] for i in order[:max_partitions] if similarity[i] >= best - margin]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""查询向量微批处理：把几毫秒内到达的多个问题合并为一次批量前向计算（embed_queries）。"""
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+
+from config import get_settings
+from logger_config import logger
+from .embedding_cache import embed_queries
+
+
+class QueryEmbeddingBatcher:
+    """
+    异步微批器：首个请求到达后最多再等待 max_wait_ms，或凑满 max_batch_size 条即发起一次批量嵌入。
+    嵌入在线程池中执行，不阻塞事件循环；同一批内重复的问题只计算一次。
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.batches = 0
+        self.queries = 0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> list[float]:
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = [(text, fut) for text, fut in await self._collect() if not fut.done()]
+            if not batch:
+                continue
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = await asyncio.to_thread(embed_queries, self.embeddings, texts)
+            except Exception as e:
+                logger.warning(f"批量查询向量化失败（{len(texts)} 条）: {e}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            by_text = dict(zip(texts, vectors))
+            self.batches += 1
+            self.queries += len(batch)
+            for text, fut in batch:
+                if not fut.done():
+                    fut.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+_batcher_instance: QueryEmbeddingBatcher | None = None
+
+
+def get_query_batcher() -> QueryEmbeddingBatcher:
+    """获取查询向量微批器（单例，复用进程内的嵌入模型）。"""
+    global _batcher_instance
+    if _batcher_instance is None:
+        from .vector_store import get_embeddings
+        s = get_settings()
+        _batcher_instance = QueryEmbeddingBatcher(
+            get_embeddings(),
+            max_batch_size=s.query_batch_max_size,
+            max_wait_ms=s.query_batch_max_wait_ms,
+        )
+    return _batcher_instance
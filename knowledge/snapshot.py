@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+索引快照：把当前版本的全部分区（向量、文本、元数据、去重出处）与索引清单打包为单个压缩文件，新节点导入即可提供查询，
+无需重新解析、嵌入整个知识库。
+
+- 格式：gzip 压缩的 tar 流，依次为 snapshot.json（格式版本、嵌入模型、切分与去重参数）、manifest.json（索引清单）、
+  每批至多 SNAPSHOT_BATCH_SIZE 个文本块的 chunks/<分区序号>-<批次>.jsonl 与同名 .npy 向量、extra/<分区序号>/ 下的去重文件，
+  最后是 checksums.json（各分区文本块数与全部成员列表）；
+- 校验：每个成员的 sha256 记在其 PAX 头中，导入时逐个校验后才写入；缺少末尾的 checksums.json、文本块数不符，
+  或实际读到的成员与其中的成员列表不一致（如缺少 manifest.json 或去重文件）均视为文件不完整；
+- 导入：流式读取、逐批写入新的索引版本目录（向量直接写入，不调用嵌入模型），词法索引与分区质心随之重建，全部成功后原子切换；
+  嵌入模型与当前配置 EMBEDDING_MODEL 不一致、或分区方式不同的快照拒绝导入。向量库后端与量化方式以导入节点的配置为准。
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from config import get_chroma_path, get_settings
+from logger_config import logger
+from metrics import stage
+from . import index_versions
+from .dedup import DEDUP_INDEX_FILENAME, DEDUP_SOURCES_FILENAME, DedupIndex
+from .onnx_embeddings import embedding_identity
+from .manifest import file_sha256, load_manifest, new_manifest, save_manifest
+from .partitions import PARTITIONS_DIRNAME, ROOT_PARTITION, partition_dir
+from .store_adapter import add_embeddings
+from .vector_store import (
+    NORMALIZE_EMBEDDINGS,
+    _activate,
+    _build_lock,
+    _BuildPartitions,
+    _dedup_index_from_store,
+    _index_exists,
+    _index_params,
+    _partitioned,
+    get_index_dir,
+    get_index_version,
+    get_partitions,
+)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_BATCH_SIZE = 4096
+SNAPSHOT_COMPRESSLEVEL = 3  # 向量几乎不可压缩，高压缩级别只会拖慢导出
+HEADER_MEMBER = "snapshot.json"
+MANIFEST_MEMBER = "manifest.json"
+TRAILER_MEMBER = "checksums.json"
+CHECKSUM_PAX_KEY = "RAGSNAPSHOT.sha256"
+_LAYOUT_PARAMS = ("vector_backend", "vector_quantization")  # 只影响本地存储布局，导入时按本节点配置
+_EXTRA_FILES = (DEDUP_INDEX_FILENAME, DEDUP_SOURCES_FILENAME)
+_READ_ERRORS = (tarfile.TarError, EOFError, OSError, ValueError, KeyError, IndexError)  # 截断、解压失败、成员内容不合法
+
+
+class SnapshotError(ValueError):
+    """快照损坏、不完整，或与当前配置不兼容。"""
+
+
+class _SnapshotWriter:
+    def __init__(self, path: Path):
+        self._file = gzip.open(path, "wb", compresslevel=SNAPSHOT_COMPRESSLEVEL)
+        self._tar = tarfile.open(fileobj=self._file, mode="w|", format=tarfile.PAX_FORMAT)
+        self.members: list[str] = []
+
+    def add(self, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.pax_headers = {CHECKSUM_PAX_KEY: hashlib.sha256(data).hexdigest()}
+        self._tar.addfile(info, io.BytesIO(data))
+        self.members.append(name)
+
+    def add_json(self, name: str, value) -> None:
+        self.add(name, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def add_array(self, name: str, array: np.ndarray) -> None:
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        self.add(name, buffer.getvalue())
+
+    def close(self, summary: dict) -> None:
+        self.add_json(TRAILER_MEMBER, {**summary, "members": list(self.members)})
+        self._tar.close()
+        self._file.close()
+
+
+def export_snapshot(path: str | Path) -> dict:
+    """
+    把当前索引版本导出为单个快照文件（先写临时文件，完成后替换），导出期间不进行索引构建。
+    返回 {path, version, index_version, chunks, partitions, bytes, sha256, elapsed}。
+    """
+    s = get_settings()
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    started = time.perf_counter()
+    with _build_lock, stage("snapshot_export"):
+        persist_dir = get_index_dir()
+        if not _index_exists(persist_dir):
+            raise SnapshotError("当前没有可导出的索引，请先构建索引")
+        partitions = get_partitions(allow_create=False)
+        manifest = load_manifest(persist_dir)
+        names = list(partitions)
+        writer = _SnapshotWriter(tmp)
+        try:
+            writer.add_json(HEADER_MEMBER, {
+                "format": SNAPSHOT_FORMAT,
+                "created_at": time.time(),
+                "embedding_model": embedding_identity(s),
+                "normalize_embeddings": NORMALIZE_EMBEDDINGS,
+                "params": manifest.get("params") or _index_params(),
+                "partition_by": s.partition_by,
+                "index_version": int(manifest.get("index_version", 0)),
+                "partitions": names,
+            })
+            writer.add_json(MANIFEST_MEMBER, manifest)
+            counts: dict[str, int] = {}
+            for number, name in enumerate(names):
+                counts[name] = _export_partition(writer, number, partitions[name].store)
+                for filename in _EXTRA_FILES:
+                    extra = partition_dir(persist_dir, name) / filename
+                    if extra.exists():
+                        writer.add(f"extra/{number:03d}/{filename}", extra.read_bytes())
+            writer.close({"chunks": counts})
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    os.replace(tmp, path)
+    report = {
+        "path": str(path),
+        "version": index_versions.read_pointer(get_chroma_path())["version"],
+        "index_version": int(manifest.get("index_version", 0)),
+        "chunks": sum(counts.values()),
+        "bytes": path.stat().st_size,
+        "sha256": file_sha256(path),
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+    if _partitioned():
+        report["partitions"] = counts
+    logger.info(f"索引快照已导出: {path}（{report['chunks']} 个文本块，{report['bytes']} 字节，耗时 {report['elapsed']}s）")
+    return report
+
+
+def _export_partition(writer: _SnapshotWriter, number: int, vector_store) -> int:
+    """分批写出一个分区的文本块与向量，返回文本块数。"""
+    offset = batch = 0
+    while True:
+        got = vector_store.get(include=["documents", "metadatas", "embeddings"], limit=SNAPSHOT_BATCH_SIZE, offset=offset)
+        if not got["ids"]:
+            return offset
+        lines = (
+            json.dumps({"id": cid, "t": text, "m": meta or {}}, ensure_ascii=False)
+            for cid, text, meta in zip(got["ids"], got["documents"], got["metadatas"])
+        )
+        writer.add(f"chunks/{number:03d}-{batch:05d}.jsonl", "\n".join(lines).encode("utf-8"))
+        writer.add_array(f"chunks/{number:03d}-{batch:05d}.npy", np.asarray(got["embeddings"], dtype=np.float32))
+        offset += len(got["ids"])
+        batch += 1
+
+
+def import_snapshot(path: str | Path) -> dict:
+    """
+    从快照导入索引：写入新的版本目录，校验全部通过后原子切换为当前版本（失败时丢弃该目录，当前版本不受影响）。
+    返回 {path, version, index_version, chunks, partitions, bytes, elapsed}；快照损坏或不兼容时抛出 SnapshotError。
+    """
+    path = Path(path)
+    root = get_chroma_path()
+    started = time.perf_counter()
+    with _build_lock, stage("snapshot_import"):
+        try:
+            tar = tarfile.open(path, mode="r|gz")
+        except (tarfile.TarError, OSError) as e:
+            raise SnapshotError(f"无法读取索引快照 {path}: {e}") from e
+        with tar:
+            members = iter(tar)
+            try:
+                header = json.loads(_read_member(tar, next(members, None), HEADER_MEMBER))
+            except SnapshotError:
+                raise
+            except _READ_ERRORS as e:
+                raise SnapshotError(f"索引快照损坏: {e}") from e
+            _check_header(header)
+            name, persist_dir = index_versions.create_version(root)
+            try:
+                counts, partitions, index_version = _load_snapshot(tar, members, header, persist_dir)
+            except SnapshotError:
+                index_versions.discard(root, name)
+                raise
+            except _READ_ERRORS as e:
+                index_versions.discard(root, name)
+                raise SnapshotError(f"索引快照损坏或不完整: {e}") from e
+            except BaseException:
+                index_versions.discard(root, name)
+                raise
+        _activate(name, persist_dir, partitions)
+    report = {
+        "path": str(path),
+        "version": name,
+        "index_version": index_version,
+        "chunks": sum(counts.values()),
+        "bytes": path.stat().st_size,
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+    if _partitioned():
+        report["partitions"] = counts
+    logger.info(f"索引快照已导入: {path}（{report['chunks']} 个文本块，耗时 {report['elapsed']}s）")
+    return report
+
+
+def _check_header(header: dict) -> None:
+    s = get_settings()
+    if header.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"不支持的索引快照格式: {header.get('format')}（当前支持 {SNAPSHOT_FORMAT}）")
+    if header.get("embedding_model") != embedding_identity(s) or header.get("normalize_embeddings") != NORMALIZE_EMBEDDINGS:
+        raise SnapshotError(f"索引快照的嵌入模型为 {header.get('embedding_model')}，与当前配置 {embedding_identity(s)} 不一致，拒绝导入")
+    if header.get("partition_by") != s.partition_by:
+        raise SnapshotError(f"索引快照的分区方式为 {header.get('partition_by')}，与当前配置 PARTITION_BY={s.partition_by} 不一致，拒绝导入")
+
+
+def _load_snapshot(tar: tarfile.TarFile, members, header: dict, persist_dir: Path) -> tuple[dict[str, int], dict, int]:
+    """逐个成员校验并写入版本目录，返回 (各分区文本块数, 全部分区, 新的索引版本号)。"""
+    s = get_settings()
+    partitions = _BuildPartitions(persist_dir, full_rebuild=True)
+    if _partitioned():
+        (persist_dir / PARTITIONS_DIRNAME).mkdir(exist_ok=True)
+    else:
+        partitions.get(ROOT_PARTITION)
+    names = header["partitions"]
+    counts = {name: 0 for name in names}
+    manifest, trailer, records = None, None, None
+    seen = [HEADER_MEMBER]
+    for member in members:
+        data = _read_member(tar, member)
+        if member.name != TRAILER_MEMBER:
+            seen.append(member.name)
+        if member.name == MANIFEST_MEMBER:
+            manifest = json.loads(data)
+        elif member.name == TRAILER_MEMBER:
+            trailer = json.loads(data)
+            break
+        elif member.name.startswith("chunks/") and member.name.endswith(".jsonl"):
+            records = (member.name[:-len(".jsonl")], [json.loads(line) for line in data.decode("utf-8").splitlines() if line])
+        elif member.name.startswith("chunks/") and member.name.endswith(".npy"):
+            stem = member.name[:-len(".npy")]
+            vectors = np.load(io.BytesIO(data), allow_pickle=False)
+            if records is None or records[0] != stem or len(records[1]) != len(vectors):
+                raise SnapshotError(f"索引快照损坏：{member.name} 与文本块数据不对应")
+            name = names[int(stem.split("/")[1].split("-")[0])]
+            partition = partitions.get(name)
+            ids, texts = [r["id"] for r in records[1]], [r["t"] for r in records[1]]
+            with stage("snapshot_load"):
+                add_embeddings(partition.store, ids, texts, vectors, [r["m"] for r in records[1]])
+                partition.lexical.add(ids, texts)
+            counts[name] += len(ids)
+            records = None
+        elif member.name.startswith("extra/"):
+            _, number, filename = member.name.split("/")
+            if filename in _EXTRA_FILES:
+                name = names[int(number)]
+                partitions.get(name)
+                (partition_dir(persist_dir, name) / filename).write_bytes(data)
+    if trailer is None:
+        raise SnapshotError("索引快照不完整：缺少末尾的校验信息")
+    if trailer.get("chunks") != counts:
+        raise SnapshotError(f"索引快照不完整：文本块数 {counts} 与记录的 {trailer.get('chunks')} 不符")
+    if trailer.get("members") != seen:
+        missing = [name for name in trailer.get("members") or [] if name not in seen]
+        raise SnapshotError(f"索引快照不完整：成员与末尾记录的列表不符（缺少 {', '.join(missing) or '无'}）")
+
+    for name, partition in partitions.opened.items():
+        if partition.dedup is not None:
+            path = partition_dir(persist_dir, name)
+            partition.dedup = DedupIndex.load(path, s.dedup_threshold) or _dedup_index_from_store(partition.store, s.dedup_threshold)
+    loaded = partitions.persist()
+
+    manifest = manifest or new_manifest(params=None)
+    params = manifest.get("params")
+    local = _index_params()
+    if params is not None:
+        params = {**params, **{key: local[key] for key in _LAYOUT_PARAMS}}
+        if params != local:
+            logger.warning("索引快照的切分或去重参数与当前配置不同：可直接提供查询，下次增量更新时将全量重建")
+    manifest["params"] = params
+    # 版本号继续递增，依赖索引版本的问答缓存不会误用旧答案
+    manifest["index_version"] = max(get_index_version(), int(header.get("index_version", 0))) + 1
+    save_manifest(persist_dir, manifest)
+    return counts, loaded, manifest["index_version"]
+
+
+def _read_member(tar: tarfile.TarFile, member: tarfile.TarInfo | None, expected: str | None = None) -> bytes:
+    """读取成员内容并按 PAX 头中的 sha256 校验。"""
+    if member is None or (expected is not None and member.name != expected):
+        raise SnapshotError(f"不是有效的索引快照：缺少 {expected}")
+    data = tar.extractfile(member).read()
+    checksum = member.pax_headers.get(CHECKSUM_PAX_KEY)
+    if checksum is None or hashlib.sha256(data).hexdigest() != checksum:
+        raise SnapshotError(f"索引快照校验失败：{member.name}")
+    return data
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+向量库后端适配：按向量检索（返回 0~1 相关度）、写入已计算好的向量、遍历全部向量，两种后端的统一入口。
+
+FlatVectorStore 直接提供这些操作。Chroma 只经由 langchain-chroma 的公开方法访问（单个查询向量检索、get 分页读取向量）；
+没有公开接口的两项——一次请求检索多个查询向量、写入已有向量而不调用嵌入模型——集中在本模块的 _chroma_* 函数中，
+langchain-chroma 升级时只需核对这一处。
+"""
+import math
+from collections.abc import Iterator
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .flat_store import FlatVectorStore
+
+WRITE_BATCH_SIZE = 256
+
+
+def _relevance(store, distance: float) -> float:
+    """
+    距离换算为相关度（越大越相关）：扁平索引返回余弦距离；Chroma 集合按默认的 l2 空间创建（见 vector_store._open_vector_store），
+    换算与 langchain-chroma 对 l2 空间的默认换算一致。
+    """
+    if isinstance(store, FlatVectorStore):
+        return 1.0 - distance
+    return 1.0 - distance / math.sqrt(2)
+
+
+def search_by_vector(store, embedding: list[float], k: int) -> list[tuple[Document, float]]:
+    """单个查询向量检索，返回 [(文本块, 相关度)]，按相关度降序。"""
+    pairs = store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+    return [(doc, _relevance(store, distance)) for doc, distance in pairs]
+
+
+def search_by_vectors(store, embeddings: list[list[float]], k: int) -> list[list[tuple[Document, float]]]:
+    """批量检索（按输入顺序返回）：扁平索引一次矩阵乘法打分，Chroma 一次 query 请求。"""
+    if isinstance(store, FlatVectorStore):
+        batch = store.similarity_search_by_vectors_with_relevance_scores(embeddings, k)
+    else:
+        batch = _chroma_query(store, embeddings, k)
+    return [[(doc, _relevance(store, distance)) for doc, distance in pairs] for pairs in batch]
+
+
+def add_embeddings(store, ids: list[str], texts: list[str], vectors: np.ndarray, metadatas: list[dict]) -> None:
+    """写入已计算好的向量（索引快照导入），不调用嵌入模型；相同 ID 覆盖。"""
+    if isinstance(store, FlatVectorStore):
+        store.add_embeddings(ids, texts, vectors, metadatas)
+        return
+    for i in range(0, len(ids), WRITE_BATCH_SIZE):
+        _chroma_upsert(
+            store,
+            ids[i:i + WRITE_BATCH_SIZE],
+            texts[i:i + WRITE_BATCH_SIZE],
+            np.asarray(vectors[i:i + WRITE_BATCH_SIZE], dtype=np.float32),
+            metadatas[i:i + WRITE_BATCH_SIZE],
+        )
+
+
+def iter_vectors(store, batch_size: int = 1000) -> Iterator[np.ndarray]:
+    """分批遍历全部文本块的向量（计算分区质心等统计用）。"""
+    if isinstance(store, FlatVectorStore):
+        yield from store.iter_vectors()
+        return
+    offset = 0
+    while True:
+        got = store.get(include=["embeddings"], limit=batch_size, offset=offset)
+        if not got["ids"]:
+            return
+        yield np.asarray(got["embeddings"], dtype=np.float32)
+        offset += len(got["ids"])
+
+
+# ---------- Chroma：langchain-chroma 没有公开接口的操作 ----------
+
+def _chroma_query(store, embeddings: list[list[float]], k: int) -> list[list[tuple[Document, float]]]:
+    res = store._collection.query(query_embeddings=embeddings, n_results=k, include=["documents", "metadatas", "distances"])
+    return [
+        [(Document(page_content=text, metadata=meta or {}, id=cid), distance) for cid, text, meta, distance in zip(*row)]
+        for row in zip(res["ids"], res["documents"], res["metadatas"], res["distances"])
+    ]
+
+
+def _chroma_upsert(store, ids: list[str], texts: list[str], vectors: np.ndarray, metadatas: list[dict]) -> None:
+    store._collection.upsert(ids=ids, embeddings=vectors.tolist(), documents=texts, metadatas=[meta or None for meta in metadatas])
@@ -1,26 +1,105 @@
 # -*- coding: utf-8 -*-
-"""向量存储：使用 Chroma + 本地 Embedding，支持持久化与检索。"""
+"""向量存储：Chroma 或内存映射扁平索引 + 本地 Embedding，支持持久化、按目录分区与检索。"""
+from __future__ import annotations
+
+import queue
+import shutil
+import threading
+import time
 import warnings
+from collections.abc import Callable
+from itertools import islice
 from pathlib import Path
-from langchain_chroma import Chroma
+from typing import TYPE_CHECKING
+
+import numpy as np
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from config import get_settings, get_chroma_path, get_knowledge_path
+from config import PROJECT_ROOT, get_settings, get_chroma_path, get_embedding_cache_path, get_knowledge_path
 from logger_config import logger
-from .loader import load_documents_from_directory
+from metrics import CHUNKS_DEDUPLICATED, CHUNKS_DELETED, CHUNKS_INDEXED, stage
+from . import index_versions
+from .chunking import CHUNKING_VERSION, StructuralTextSplitter
+from .dedup import DEDUP_VERSION, DedupIndex, load_sources, minhash, numbers_digest
+from .embedding_cache import CachedEmbeddings, EmbeddingCache
+from .flat_store import FLAT_INDEX_FILENAME, FlatVectorStore
+from .lexical_index import LexicalIndex
+from .loader import LOADER_MAP, iter_load_files
+from .onnx_embeddings import embedding_identity
+from .partitions import (
+    PARTITIONS_DIRNAME,
+    ROOT_PARTITION,
+    IndexPartition,
+    list_partition_dirs,
+    load_partition_info,
+    partition_dir,
+    partition_of,
+    save_partition_info,
+)
+from .store_adapter import iter_vectors
+from .manifest import (
+    MANIFEST_FILENAME,
+    chunk_id,
+    diff_files,
+    load_manifest,
+    new_manifest,
+    save_manifest,
+    scan_directory,
+)
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma  # chromadb 导入较慢，仅在使用 Chroma 后端时导入
+
+COLLECTION_NAME = "enterprise_knowledge"
+NORMALIZE_EMBEDDINGS = True
+# 每批写入向量库的文本块数量（批量嵌入更高效，也避免超过 Chroma 单批上限）
+ADD_BATCH_SIZE = 256
 
 # 单例缓存：进程内只加载一次嵌入模型与向量库，避免每次请求重复加载
 _embeddings_instance = None
-_vector_store_instance = None
+_active_index: tuple[Path, dict[str, IndexPartition]] | None = None  # (索引版本目录, {分区名: 分区})，整体赋值以原子切换
+_index_version_cache: tuple[Path, int, int] | None = None  # (清单路径, mtime_ns, 版本号)
+_build_lock = threading.Lock()  # 同一进程内的索引构建串行执行
+_load_lock = threading.RLock()  # 后台预热与首批请求同时到达时只加载一次嵌入模型与向量库
 
 
 def _get_embeddings():
-    """获取本地 HuggingFace 嵌入模型（单例，仅加载一次）。"""
+    """获取嵌入模型（单例，仅加载一次）：本地 HuggingFace 模型，或配置了嵌入服务时为其客户端。"""
     global _embeddings_instance
     if _embeddings_instance is not None:
         return _embeddings_instance
+    with _load_lock:
+        if _embeddings_instance is None:
+            _embeddings_instance = _load_embeddings()
+    return _embeddings_instance
+
+
+def _load_embeddings(remote: bool = True):
+    """remote=False 时总是在本进程加载模型（嵌入服务自身使用）。"""
     s = get_settings()
+    if remote and s.embedding_server_socket:
+        from .embedding_server import RemoteEmbeddings
+        logger.info(f"使用嵌入服务: {s.embedding_server_socket}（本进程不加载嵌入模型）")
+        return RemoteEmbeddings(s.embedding_server_socket, timeout=s.embedding_server_timeout)
+    if s.embedding_backend == "onnx":
+        from .onnx_embeddings import load_onnx_embeddings
+        embeddings = load_onnx_embeddings(s, normalize=NORMALIZE_EMBEDDINGS)
+    else:
+        embeddings = _load_torch_embeddings(s.embedding_model)
+        logger.info("嵌入模型已加载（仅此一次）")
+    if s.embedding_cache_enabled:
+        cache = EmbeddingCache(
+            get_embedding_cache_path(),
+            model_name=embedding_identity(s),
+            normalize=NORMALIZE_EMBEDDINGS,
+            max_entries=s.embedding_cache_max_entries,
+        )
+        embeddings = CachedEmbeddings(embeddings, cache)
+    return embeddings
+
+
+def _load_torch_embeddings(model_name: str):
+    """sentence-transformers（PyTorch，CPU）嵌入模型。"""
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", DeprecationWarning)
         try:
@@ -30,100 +109,709 @@ def _get_embeddings():
                 from langchain_huggingface import HuggingFaceEmbeddings
             except ImportError:
                 from langchain_community.embeddings import HuggingFaceEmbeddings
-        _embeddings_instance = HuggingFaceEmbeddings(
-            model_name=s.embedding_model,
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
             model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True},
+            encode_kwargs={"normalize_embeddings": NORMALIZE_EMBEDDINGS},
         )
-    logger.info("嵌入模型已加载（仅此一次）")
-    return _embeddings_instance
 
 
-def _get_text_splitter():
+def get_embeddings():
+    """获取进程内共享的嵌入模型（含磁盘缓存包装）。"""
+    return _get_embeddings()
+
+
+def get_embedding_cache_stats() -> dict | None:
+    """嵌入缓存命中/未命中统计（使用嵌入服务时为服务端的缓存）；未启用缓存、模型尚未加载或服务不可用时返回 None。"""
+    if isinstance(_embeddings_instance, CachedEmbeddings):
+        return _embeddings_instance.cache.stats()
+    server_stats = get_embedding_server_stats()
+    return server_stats["embedding_cache"] if server_stats else None
+
+
+def _flush_embedding_cache() -> None:
+    """把嵌入缓存写回磁盘：索引构建结束时调用一次（进程退出时另由 atexit 写回），查询路径不逐次写回。"""
+    if isinstance(_embeddings_instance, CachedEmbeddings):
+        _embeddings_instance.cache.flush()
+
+
+def get_embedding_server_stats() -> dict | None:
+    """嵌入服务的连接数、请求数与合批情况；未使用嵌入服务或服务不可用时返回 None。"""
+    stats = getattr(_embeddings_instance, "server_stats", None)
+    if stats is None:
+        return None
+    try:
+        return stats()
+    except Exception as e:
+        logger.warning(f"获取嵌入服务统计失败: {e}")
+        return None
+
+
+def _get_text_splitter() -> StructuralTextSplitter:
     s = get_settings()
-    return RecursiveCharacterTextSplitter(
+    return StructuralTextSplitter(
         chunk_size=s.chunk_size,
         chunk_overlap=s.chunk_overlap,
-        length_function=len,
         separators=["\n\n", "\n", "。", "！", "？", "；", " ", ""],
     )
 
 
-def get_vector_store(allow_create: bool = True) -> Chroma:
+def _open_vector_store(persist_dir: Path) -> Chroma | FlatVectorStore:
+    """按配置的后端打开向量库；两种后端对外接口一致。"""
+    s = get_settings()
+    if s.vector_backend == "flat":
+        return FlatVectorStore(persist_dir, _get_embeddings(), quantization=s.vector_quantization, rescore_factor=s.quantization_rescore_factor)
+    if s.vector_quantization != "none":
+        logger.warning("VECTOR_QUANTIZATION 仅对 flat 后端生效，Chroma 后端按 float32 存储")
+    from langchain_chroma import Chroma
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=_get_embeddings(),
+        persist_directory=str(persist_dir),
+    )
+
+
+def _vector_store_exists(persist_dir: Path) -> bool:
+    marker = FLAT_INDEX_FILENAME if get_settings().vector_backend == "flat" else "chroma.sqlite3"
+    return (persist_dir / marker).exists()
+
+
+def _partitioned() -> bool:
+    return get_settings().partition_by == "folder"
+
+
+def _index_exists(persist_dir: Path) -> bool:
+    """版本目录中是否已有按当前配置（后端、是否分区）构建的索引。"""
+    if _partitioned():
+        return (persist_dir / PARTITIONS_DIRNAME).is_dir()
+    return _vector_store_exists(persist_dir)
+
+
+def _partition_name(rel_path: str) -> str:
+    return partition_of(rel_path) if _partitioned() else ROOT_PARTITION
+
+
+def _persist(vector_store: Chroma | FlatVectorStore) -> None:
+    """落盘：Chroma 写入即持久化；扁平索引在一轮写入结束后统一合并写出。"""
+    if isinstance(vector_store, FlatVectorStore):
+        vector_store.persist()
+
+
+def _clear_index_dir(persist_dir: Path) -> None:
+    """全量重建前清空版本目录中除清单外的全部索引文件（向量库、词法索引、分区），避免残留旧向量。"""
+    for path in persist_dir.iterdir():
+        if path.name == MANIFEST_FILENAME:
+            continue
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+
+def _index_params() -> dict:
+    """影响索引内容的参数；任一变化时已有向量不可复用，需要全量重建。"""
+    s = get_settings()
+    return {
+        "embedding_model": embedding_identity(s),
+        "vector_backend": s.vector_backend,
+        "vector_quantization": s.vector_quantization if s.vector_backend == "flat" else "none",
+        "partition_by": s.partition_by,
+        "chunk_size": s.chunk_size,
+        "chunk_overlap": s.chunk_overlap,
+        "chunking": CHUNKING_VERSION,
+        "dedup": f"{DEDUP_VERSION}@{s.dedup_threshold:g}" if s.dedup_enabled else None,
+    }
+
+
+def get_index_dir() -> Path:
+    """当前提供查询的索引版本目录（由 chroma_db/CURRENT 指针决定）。"""
+    return index_versions.active_dir(get_chroma_path())
+
+
+def _load_partitions(persist_dir: Path, opened: dict[str, IndexPartition] | None = None) -> dict[str, IndexPartition]:
+    """打开版本目录中的全部分区（opened 中已打开的直接复用）；空分区不参与检索。"""
+    opened = opened or {}
+    if not _partitioned():
+        if ROOT_PARTITION in opened:
+            opened[ROOT_PARTITION].sources = load_sources(persist_dir)
+            return {ROOT_PARTITION: opened[ROOT_PARTITION]}
+        partition = IndexPartition(ROOT_PARTITION, _open_vector_store(persist_dir), LexicalIndex.load(persist_dir))
+        partition.sources = load_sources(persist_dir)
+        return {ROOT_PARTITION: partition}
+    partitions = {}
+    for name, path in list_partition_dirs(persist_dir).items():
+        info = load_partition_info(path)
+        if not info.get("chunks"):
+            continue
+        partition = opened.get(name) or IndexPartition(name, _open_vector_store(path), LexicalIndex.load(path))
+        partition.centroid = np.asarray(info["centroid"], dtype=np.float32) if info.get("centroid") else None
+        partition.chunks = info["chunks"]
+        partition.sources = load_sources(path)
+        partitions[name] = partition
+    return partitions
+
+
+def get_partitions(allow_create: bool = True) -> dict[str, IndexPartition]:
     """
-    获取或创建 Chroma 向量库（单例缓存，进程内复用）。
-    allow_create: 若持久化目录不存在是否从知识库重建索引。
+    当前索引版本的全部分区 {分区名: IndexPartition}（单例缓存，进程内复用）；未启用分区时只有名称为空串的一个分区。
+    当前版本被切换（本进程或其他进程的重建完成后）时自动打开新版本目录。
+    allow_create: 若当前版本尚无索引是否从知识库构建。
     """
-    global _vector_store_instance
-    if _vector_store_instance is not None:
-        return _vector_store_instance
-
-    persist_dir = get_chroma_path()
-    embeddings = _get_embeddings()
-    collection_name = "enterprise_knowledge"
+    global _active_index
+    persist_dir = get_index_dir()
+    active = _active_index
+    if active is not None and active[0] == persist_dir:
+        return active[1]
 
-    if (persist_dir / "chroma.sqlite3").exists():
-        _vector_store_instance = Chroma(
-            collection_name=collection_name,
-            embedding_function=embeddings,
-            persist_directory=str(persist_dir),
-        )
-        logger.info(f"已加载已有向量库: {persist_dir}")
-        return _vector_store_instance
+    if _index_exists(persist_dir):
+        with _load_lock, stage("vector_store_load"):
+            active = _active_index
+            if active is not None and active[0] == persist_dir:
+                return active[1]
+            partitions = _load_partitions(persist_dir)
+            _active_index = (persist_dir, partitions)
+        logger.info(f"已加载已有向量库: {persist_dir}" + (f"（{len(partitions)} 个分区）" if _partitioned() else ""))
+        return partitions
 
     if allow_create:
-        logger.info("未发现已有向量库，将从头构建索引")
-        _vector_store_instance = build_and_persist_index()
-        return _vector_store_instance
+        if not _import_configured_snapshot():
+            logger.info("未发现已有向量库，将从头构建索引")
+            update_index()
+        return _active_index[1]
 
-    _vector_store_instance = Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=str(persist_dir),
+    partitions = _load_partitions(persist_dir)
+    _active_index = (persist_dir, partitions)
+    return partitions
+
+
+def _import_configured_snapshot() -> bool:
+    """配置了 INDEX_SNAPSHOT_PATH 时导入该快照（新节点上线）；未配置、文件不存在或快照被拒绝时返回 False，改为从知识库构建。"""
+    configured = get_settings().index_snapshot_path
+    if not configured:
+        return False
+    path = PROJECT_ROOT / configured
+    if not path.is_file():
+        logger.warning(f"索引快照不存在: {path}，将从知识库构建索引")
+        return False
+    from .snapshot import SnapshotError, import_snapshot
+    try:
+        import_snapshot(path)
+    except SnapshotError as e:
+        logger.error(f"未导入索引快照，将从知识库构建索引: {e}")
+        return False
+    return True
+
+
+def get_vector_store(allow_create: bool = True, partition: str | None = None) -> Chroma | FlatVectorStore:
+    """
+    获取向量库（后端由 vector_backend 配置）；按目录分区时须指定分区名。
+    allow_create: 若当前版本尚无索引是否从知识库构建。
+    """
+    partitions = get_partitions(allow_create)
+    name = ROOT_PARTITION if partition is None else partition
+    if name not in partitions:
+        raise ValueError("已按目录分区建立索引，请指定分区名" if partition is None else f"知识库分区不存在: {partition}")
+    return partitions[name].store
+
+
+def get_index_version() -> int:
+    """当前索引版本号：每次索引内容发生变化时递增。按清单文件 mtime 缓存，每次调用仅两次 stat（版本指针 + 清单）。"""
+    global _index_version_cache
+    path = get_index_dir() / MANIFEST_FILENAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+    cached = _index_version_cache
+    if cached is None or cached[0] != path or cached[1] != mtime:
+        cached = _index_version_cache = (path, mtime, int(load_manifest(path.parent).get("index_version", 0)))
+    return cached[2]
+
+
+def _add_in_batches(vector_store: Chroma | FlatVectorStore, splits: list[Document], ids: list[str]) -> None:
+    for i in range(0, len(splits), ADD_BATCH_SIZE):
+        vector_store.add_documents(splits[i:i + ADD_BATCH_SIZE], ids=ids[i:i + ADD_BATCH_SIZE])
+
+
+def get_lexical_index(partition: str | None = None) -> LexicalIndex | None:
+    """获取当前版本（指定分区）的词法倒排索引，随版本切换自动更新；不存在时返回 None。"""
+    found = get_partitions().get(ROOT_PARTITION if partition is None else partition)
+    return found.lexical if found is not None else None
+
+
+def _activate(name: str, persist_dir: Path, partitions: dict[str, IndexPartition]) -> None:
+    """切换到新构建完成的版本：先替换进程内单例（已加载好的向量库与词法索引，查询无需等待加载），再原子替换版本指针。"""
+    global _active_index
+    _active_index = (persist_dir, partitions)
+    previous = index_versions.activate(get_chroma_path(), name)
+    logger.info(f"已切换到索引版本 {name}（上一版本 {previous} 保留用于回滚）")
+    index_versions.prune(get_chroma_path())
+
+
+def _centroid(vector_store: Chroma | FlatVectorStore) -> list[float] | None:
+    """分区质心：全部文本块向量之和再归一化（向量均已归一化），用于问题路由。"""
+    total = None
+    for batch in iter_vectors(vector_store):
+        if len(batch):
+            part = np.asarray(batch, dtype=np.float64).sum(axis=0)
+            total = part if total is None else total + part
+    norm = np.linalg.norm(total) if total is not None else 0.0
+    return (total / norm).astype(np.float32).tolist() if norm else None
+
+
+def _lexical_index_from_store(vector_store: Chroma | FlatVectorStore, batch_size: int = 1000) -> LexicalIndex:
+    """从已有向量库重建词法索引（词法索引文件缺失或损坏时使用，无需重新嵌入）。"""
+    index = LexicalIndex()
+    offset = 0
+    while True:
+        batch = vector_store.get(include=["documents"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        index.add(batch["ids"], batch["documents"])
+        offset += len(batch["ids"])
+    logger.info(f"已从向量库重建词法索引：{len(index)} 个文本块")
+    return index
+
+
+def _dedup_index_from_store(vector_store: Chroma | FlatVectorStore, threshold: float, batch_size: int = 1000) -> DedupIndex:
+    """从已有向量库重建去重签名（去重索引文件缺失或损坏时使用；原有出处列表无法恢复）。"""
+    index = DedupIndex(threshold)
+    offset = 0
+    while True:
+        batch = vector_store.get(include=["documents"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        for cid, text in zip(batch["ids"], batch["documents"]):
+            signature = minhash(text)
+            if signature is not None:
+                index.add(cid, signature, numbers_digest(text))
+        offset += len(batch["ids"])
+    logger.info(f"已从向量库重建去重索引：{len(index)} 个文本块")
+    return index
+
+
+class _UpsertWorker:
+    """嵌入 + 写入阶段：后台线程从有界队列取批次写入向量库，与解析、切分并行；队列满时生产端阻塞，内存占用有上限。"""
+
+    def __init__(self, queue_size: int):
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._error: Exception | None = None
+        self.seconds = 0.0  # 嵌入 + 写入累计耗时
+        self._thread = threading.Thread(target=self._run, name="index-upsert", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            started = time.perf_counter()
+            try:
+                _add_in_batches(*item)
+                self.seconds += time.perf_counter() - started
+            except Exception as e:
+                self._error = e
+
+    def put(self, vector_store: Chroma | FlatVectorStore, splits: list[Document], ids: list[str]) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put((vector_store, splits, ids))
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def update_index(full_rebuild: bool = False, progress: Callable[[dict], None] | None = None) -> dict:
+    """
+    增量更新索引：对比索引清单，仅对新增/修改的文件加载、切分、嵌入；
+    删除已修改/已移除文件的旧文本块。嵌入模型或切分参数变化、或 full_rebuild=True 时清空后全量重建。
+    构建在新的版本目录中进行（增量更新先复制当前版本），完成后原子切换，构建期间查询始终读取旧版本；文件均未变化时不生成新版本。
+    progress: 可选回调，构建过程中以 {stage, files_total, files_done, chunks_added, current_file} 报告进度。
+    返回变更报告: { added, modified, removed, unchanged, chunks_added, chunks_deleted, full_rebuild, index_version, version, elapsed }，
+    按目录分区时另含 partitions: {分区名: 文本块数}；启用入库去重时另含 dedup（丢弃的重复块数、节省的嵌入耗时与磁盘空间估算）。
+    """
+    root = get_chroma_path()
+    with _build_lock, stage("index_update"):
+        current_dir = get_index_dir()
+        has_index = _index_exists(current_dir)
+        if has_index and not full_rebuild and _is_up_to_date(current_dir):
+            logger.info("知识库文件均未变化，无需重建索引")
+            return {
+                "added": [], "modified": [], "removed": [], "unchanged": len(load_manifest(current_dir)["files"]),
+                "chunks_added": 0, "chunks_deleted": 0, "full_rebuild": False, "index_version": get_index_version(),
+                "version": index_versions.read_pointer(root)["version"], "elapsed": 0.0,
+            }
+        if progress:
+            progress({"stage": "preparing"})
+        with stage("index_copy"):
+            name, persist_dir = index_versions.create_version(root, copy_from=current_dir if has_index and not full_rebuild else None)
+        if not has_index or full_rebuild:
+            # 空目录：沿用当前版本号，使新版本号继续递增（依赖版本号的问答缓存不会误用旧答案）
+            save_manifest(persist_dir, new_manifest(params=None, index_version=get_index_version()))
+        try:
+            report, partitions = _update_index(full_rebuild, persist_dir, progress)
+        except Exception:
+            index_versions.discard(root, name)
+            raise
+        finally:
+            _flush_embedding_cache()
+        if progress:
+            progress({"stage": "swapping"})
+        _activate(name, persist_dir, partitions)
+        report["version"] = name
+        return report
+
+
+def _is_up_to_date(persist_dir: Path) -> bool:
+    """
+    当前版本的清单与知识库文件一致（参数未变、无新增/修改/删除）时返回 True。
+    仅被 touch 或重新检出（内容未变）的文件刷新后的 mtime/大小写回当前版本的清单：之后的检查不再重新计算哈希，
+    需要增量更新时新版本复制的也是刷新后的清单。
+    """
+    manifest = load_manifest(persist_dir)
+    if manifest.get("params") != _index_params():
+        return False
+    files = scan_directory(get_knowledge_path(), set(LOADER_MAP.keys()))
+    diff = diff_files(files, manifest)
+    if diff["refreshed"]:
+        save_manifest(persist_dir, manifest)
+    return not (diff["added"] or diff["modified"] or diff["removed"])
+
+
+class _BuildPartitions:
+    """构建过程中按需打开的分区（向量库 + 词法索引）；未启用分区时只有一个写在版本目录根下的分区。"""
+
+    def __init__(self, persist_dir: Path, full_rebuild: bool):
+        self.persist_dir = persist_dir
+        self.full_rebuild = full_rebuild
+        self.opened: dict[str, IndexPartition] = {}
+
+    def get(self, name: str) -> IndexPartition:
+        partition = self.opened.get(name)
+        if partition is None:
+            path = partition_dir(self.persist_dir, name)
+            path.mkdir(parents=True, exist_ok=True)
+            store = _open_vector_store(path)
+            lexical = None if self.full_rebuild else LexicalIndex.load(path)
+            if lexical is None:
+                lexical = LexicalIndex() if self.full_rebuild else _lexical_index_from_store(store)
+            partition = self.opened[name] = IndexPartition(name, store, lexical)
+            s = get_settings()
+            if s.dedup_enabled:
+                dedup = None if self.full_rebuild else DedupIndex.load(path, s.dedup_threshold)
+                if dedup is None:
+                    dedup = DedupIndex(s.dedup_threshold) if self.full_rebuild else _dedup_index_from_store(store, s.dedup_threshold)
+                partition.dedup = dedup
+        return partition
+
+    def persist(self) -> dict[str, IndexPartition]:
+        """持久化本次改动过的分区（分区模式下同时更新文本块数与路由质心），返回版本中的全部分区。"""
+        for name, partition in self.opened.items():
+            path = partition_dir(self.persist_dir, name)
+            with stage("index_persist"):
+                _persist(partition.store)
+            with stage("lexical_persist"):
+                partition.lexical.save(path)
+            if partition.dedup is not None:
+                with stage("dedup_persist"):
+                    partition.dedup.save(path)
+                partition.dedup = None  # 签名只在构建时使用，不随分区常驻内存
+            if name != ROOT_PARTITION:
+                with stage("partition_centroid"):
+                    save_partition_info(path, len(partition.lexical), _centroid(partition.store))
+        return _load_partitions(self.persist_dir, self.opened)
+
+
+def _update_index(full_rebuild: bool, persist_dir: Path, progress: Callable[[dict], None] | None) -> tuple[dict, dict[str, IndexPartition]]:
+    """在指定（尚未提供查询的）版本目录中执行增量更新或全量重建，返回 (变更报告, 全部分区)。"""
+    started = time.perf_counter()
+    knowledge_path = get_knowledge_path()
+    manifest = load_manifest(persist_dir)
+    params = _index_params()
+    if full_rebuild or manifest.get("params") != params:
+        if not full_rebuild:
+            logger.info("索引清单缺失或索引参数已变化，将全量重建")
+        _clear_index_dir(persist_dir)
+        manifest = new_manifest(params, index_version=int(manifest.get("index_version", 0)))
+        full_rebuild = True
+
+    partitions = _BuildPartitions(persist_dir, full_rebuild)
+    if _partitioned():
+        (persist_dir / PARTITIONS_DIRNAME).mkdir(exist_ok=True)
+    else:
+        partitions.get(ROOT_PARTITION)
+
+    files = scan_directory(knowledge_path, set(LOADER_MAP.keys()))
+    if not files:
+        logger.warning("没有可索引的文档，请检查 knowledge_docs 下是否有 .pdf/.txt/.md/.docx 且加载无报错")
+    with stage("index_diff"):
+        diff = diff_files(files, manifest)
+    known = manifest["files"]
+    s = get_settings()
+    reindexed = _dedup_dependents(diff, known, files) if s.dedup_enabled else []
+    reindex = diff["modified"] + reindexed
+    state = {"stage": "indexing", "files_total": len(diff["added"]) + len(reindex), "files_done": 0, "chunks_added": 0, "current_file": None}
+
+    # 先删除已修改、已移除文件（及须重新索引的文件）的旧文本块（各自所在的分区）
+    stale: dict[str, list[tuple[str, dict]]] = {}
+    for rel, *_ in reindex:
+        stale.setdefault(_partition_name(rel), []).append((rel, known[rel]))
+    for rel in diff["removed"]:
+        stale.setdefault(_partition_name(rel), []).append((rel, known.pop(rel)))
+    if progress:
+        progress(dict(state))
+    chunks_deleted = sum(len(entry.get("chunk_ids", [])) for entries in stale.values() for _, entry in entries)
+    if stale:
+        with stage("index_delete"):
+            for name, entries in stale.items():
+                partition = partitions.get(name)
+                ids = [cid for _, entry in entries for cid in entry.get("chunk_ids", [])]
+                if ids:
+                    partition.store.delete(ids=ids)
+                    partition.lexical.remove(ids)
+                if partition.dedup is not None:
+                    partition.dedup.remove(ids)
+                    for rel, entry in entries:
+                        partition.dedup.remove_source(entry.get("duplicate_of", []), rel)
+        CHUNKS_DELETED.inc(chunks_deleted)
+
+    # 再并行解析、切分新增与修改的文件，（启用去重时）丢弃近似重复的文本块，跨文件（按分区）攒批后交给后台线程嵌入写入
+    splitter = _get_text_splitter()
+    targets = {path: (rel, st, sha) for rel, path, st, sha in diff["added"] + reindex}
+    writer = _UpsertWorker(s.index_queue_size)
+    pending: dict[str, tuple[list[Document], list[str]]] = {}
+    chunks_added = 0
+    chunks_deduplicated = 0
+    try:
+        for path, docs in iter_load_files(list(targets), max_workers=s.loader_workers or None):
+            rel, st, sha = targets[path]
+            name = _partition_name(rel)
+            partition = partitions.get(name)
+            entry = known[rel] = {"mtime": st.st_mtime, "size": st.st_size, "sha256": sha, "chunk_ids": []}
+            # 章节流式切分，每次取 ADD_BATCH_SIZE 个文本块处理，大文件不会整体驻留内存
+            chunks = splitter.iter_split(docs)
+            count = kept_count = dropped = 0
+            own: set[str] = set()
+            duplicate_of: list[str] = []
+            while True:
+                with stage("split"):
+                    splits = list(islice(chunks, ADD_BATCH_SIZE))
+                if not splits:
+                    break
+                ids = [chunk_id(rel, sha, count + i) for i in range(len(splits))]
+                count += len(splits)
+                if partition.dedup is not None:
+                    with stage("dedup"):
+                        splits, ids, matched, batch_dropped = partition.dedup.filter(rel, splits, ids, own)
+                    dropped += batch_dropped
+                    duplicate_of += [cid for cid in matched if cid not in duplicate_of]
+                entry["chunk_ids"].extend(ids)
+                if name != ROOT_PARTITION:
+                    for split in splits:
+                        split.metadata["partition"] = name
+                partition.lexical.add(ids, [d.page_content for d in splits])
+                pending_docs, pending_ids = pending.setdefault(name, ([], []))
+                pending_docs.extend(splits)
+                pending_ids.extend(ids)
+                kept_count += len(splits)
+                if len(pending_docs) >= ADD_BATCH_SIZE:
+                    writer.put(partition.store, *pending.pop(name))
+            if dropped:
+                entry.update(duplicates=dropped, duplicate_of=duplicate_of)
+            chunks_deduplicated += dropped
+            if kept_count or dropped:
+                logger.info(f"已索引: {rel} -> {kept_count} 个文本块" + (f"（另有 {dropped} 个近似重复块未单独入库）" if dropped else ""))
+            chunks_added += kept_count
+            if progress:
+                state.update(files_done=state["files_done"] + 1, chunks_added=chunks_added, current_file=rel)
+                progress(dict(state))
+        for name, batch in pending.items():
+            if batch[0]:
+                writer.put(partitions.get(name).store, *batch)
+    finally:
+        with stage("index_write_drain"):
+            writer.close()
+    if progress:
+        progress({**state, "stage": "persisting", "current_file": None})
+    loaded = partitions.persist()
+    CHUNKS_INDEXED.inc(chunks_added)
+    CHUNKS_DEDUPLICATED.inc(chunks_deduplicated)
+
+    changed = bool(diff["added"] or diff["modified"] or diff["removed"]) or full_rebuild
+    if changed:
+        manifest["index_version"] = int(manifest.get("index_version", 0)) + 1
+    save_manifest(persist_dir, manifest)
+
+    report = {
+        "added": [rel for rel, *_ in diff["added"]],
+        "modified": [rel for rel, *_ in diff["modified"]],
+        "removed": diff["removed"],
+        "unchanged": len(diff["unchanged"]),
+        "chunks_added": chunks_added,
+        "chunks_deleted": chunks_deleted,
+        "full_rebuild": full_rebuild,
+        "index_version": manifest["index_version"],
+        "embedding_cache": get_embedding_cache_stats(),
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+    if _partitioned():
+        report["partitions"] = {name: p.chunks for name, p in loaded.items()}
+    if s.dedup_enabled:
+        report["dedup"] = _dedup_report(persist_dir, known, chunks_added, chunks_deduplicated, writer.seconds, reindexed)
+    logger.info(
+        f"索引更新完成：新增 {len(report['added'])}，修改 {len(report['modified'])}，删除 {len(report['removed'])}，"
+        f"未变更 {report['unchanged']} 个文件；写入 {chunks_added} / 删除 {chunks_deleted} 个文本块，耗时 {report['elapsed']}s"
     )
-    return _vector_store_instance
+    return report, loaded
 
 
-def build_and_persist_index(docs: list[Document] | None = None) -> Chroma:
+def _dedup_dependents(diff: dict, known: dict, files: dict[str, Path]) -> list[tuple]:
     """
-    从知识库目录加载文档、切分、向量化并持久化到 Chroma。
-    若未传入 docs，则从配置的 knowledge_base_path 加载。
-    重建后会更新全局向量库单例。
+    未变更的文件中，有些文本块因与其他文件的保留块重复而未单独入库；这些保留块随所属文件修改、删除（或其本身重新索引）而消失时，
+    该文件须重新索引，让原先的重复块补回索引。返回这些文件 [(rel, path, stat, sha)]，并将其移出 diff["unchanged"]。
+    """
+    gone = {cid for rel in [rel for rel, *_ in diff["modified"]] + diff["removed"] for cid in known.get(rel, {}).get("chunk_ids", [])}
+    unchanged = set(diff["unchanged"])
+    dependents = []
+    while gone:
+        found = [rel for rel in sorted(unchanged) if gone.intersection(known[rel].get("duplicate_of", ()))]
+        gone = set()
+        for rel in found:
+            unchanged.discard(rel)
+            dependents.append((rel, files[rel], files[rel].stat(), known[rel]["sha256"]))
+            gone.update(known[rel].get("chunk_ids", []))
+    if dependents:
+        diff["unchanged"] = [rel for rel in diff["unchanged"] if rel in unchanged]
+        logger.info(f"{len(dependents)} 个未变更文件的重复块原先并入了被修改/删除文件的文本块，将重新索引")
+    return dependents
+
+
+def _dedup_report(persist_dir: Path, known: dict, chunks_added: int, chunks_deduplicated: int, write_seconds: float, reindexed: list[tuple]) -> dict:
+    """
+    入库去重的节省情况：本次构建未单独嵌入的块数与按本次平均嵌入写入耗时估算的节省时间；
+    整个索引中并入其他块的重复块数，以及按当前索引平均每块磁盘占用估算的节省空间。
+    """
+    total_chunks = sum(len(entry.get("chunk_ids", [])) for entry in known.values())
+    total_dropped = sum(entry.get("duplicates", 0) for entry in known.values())
+    index_bytes = sum(path.stat().st_size for path in persist_dir.rglob("*") if path.is_file())
+    per_chunk_seconds = write_seconds / chunks_added if chunks_added else 0.0
+    return {
+        "chunks_dropped": chunks_deduplicated,
+        "embed_seconds_saved": round(chunks_deduplicated * per_chunk_seconds, 3),
+        "index_chunks": total_chunks,
+        "index_chunks_dropped": total_dropped,
+        "index_bytes_saved": int(total_dropped * index_bytes / total_chunks) if total_chunks else 0,
+        "reindexed": [rel for rel, *_ in reindexed],
+    }
+
+
+def build_and_persist_index(docs: list[Document] | None = None, full_rebuild: bool = False) -> dict[str, IndexPartition]:
+    """
+    从知识库目录加载文档、切分、向量化并持久化到向量库（Chroma 或扁平索引），返回全部分区。
+    若未传入 docs，则按索引清单增量更新（仅处理新增/修改/删除的文件），full_rebuild=True 时全量重建；
+    若传入 docs，则仅索引这些文档（不维护文件清单，下次增量更新会全量重建）。
+    两种方式都写入新的版本目录，完成后原子切换为当前版本。
     """
-    global _vector_store_instance
     if docs is None:
-        knowledge_path = get_knowledge_path()
-        docs = load_documents_from_directory(knowledge_path)
+        update_index(full_rebuild=full_rebuild)
+        return get_partitions(allow_create=False)
+
+    root = get_chroma_path()
+    with _build_lock, stage("index_update"):
+        name, persist_dir = index_versions.create_version(root)
+        try:
+            partitions = _build_from_documents(docs, persist_dir)
+        except Exception:
+            index_versions.discard(root, name)
+            raise
+        finally:
+            _flush_embedding_cache()
+        _activate(name, persist_dir, partitions)
+    return partitions
+
+
+def _build_from_documents(docs: list[Document], persist_dir: Path) -> dict[str, IndexPartition]:
+    # 不记录文件清单（params 为空，下次增量更新会全量重建），但递增版本号使依赖索引版本的缓存失效
+    save_manifest(persist_dir, new_manifest(params=None, index_version=get_index_version() + 1))
+    partitions = _BuildPartitions(persist_dir, full_rebuild=True)
+    if _partitioned():
+        (persist_dir / PARTITIONS_DIRNAME).mkdir(exist_ok=True)
+    else:
+        partitions.get(ROOT_PARTITION)
     if not docs:
         logger.warning("没有可索引的文档，请检查 knowledge_docs 下是否有 .pdf/.txt/.md/.docx 且加载无报错")
-        persist_dir = get_chroma_path()
-        persist_dir.mkdir(parents=True, exist_ok=True)
-        embeddings = _get_embeddings()
-        collection_name = "enterprise_knowledge"
-        # Chroma 不接受空文档列表，改为创建空库并复用
-        vector_store = Chroma(
-            collection_name=collection_name,
-            embedding_function=embeddings,
-            persist_directory=str(persist_dir),
-        )
-        _vector_store_instance = vector_store
-        return vector_store
+        return partitions.persist()
 
     splitter = _get_text_splitter()
-    splits = splitter.split_documents(docs)
+    with stage("split"):
+        splits = splitter.split_documents(docs)
     logger.info(f"切分后共 {len(splits)} 个文本块")
+    ids = [chunk_id(d.metadata.get("source", ""), "", i) for i, d in enumerate(splits)]
+    # {分区名: {来源文件: ([文本块], [ID])}}
+    groups: dict[str, dict[str, tuple[list[Document], list[str]]]] = {}
+    knowledge_path = get_knowledge_path().resolve()
+    for split, id_ in zip(splits, ids):
+        rel = _relative_source(split.metadata.get("source", ""), knowledge_path)
+        name = _partition_name(rel)
+        if name != ROOT_PARTITION:
+            split.metadata["partition"] = name
+        group = groups.setdefault(name, {}).setdefault(rel, ([], []))
+        group[0].append(split)
+        group[1].append(id_)
+    chunks_added = chunks_deduplicated = 0
+    with stage("index_build"):
+        for name, by_source in groups.items():
+            partition = partitions.get(name)
+            group_docs, group_ids = [], []
+            for rel, (source_docs, source_ids) in by_source.items():
+                if partition.dedup is not None:
+                    with stage("dedup"):
+                        source_docs, source_ids, _, dropped = partition.dedup.filter(rel, source_docs, source_ids)
+                    chunks_deduplicated += dropped
+                group_docs.extend(source_docs)
+                group_ids.extend(source_ids)
+            _add_in_batches(partition.store, group_docs, group_ids)
+            partition.lexical.add(group_ids, [d.page_content for d in group_docs])
+            chunks_added += len(group_docs)
+    CHUNKS_INDEXED.inc(chunks_added)
+    CHUNKS_DEDUPLICATED.inc(chunks_deduplicated)
+    if chunks_deduplicated:
+        logger.info(f"入库去重：{chunks_deduplicated} 个近似重复的文本块未单独入库")
+    loaded = partitions.persist()
+    logger.info(f"向量库已构建并持久化到 {persist_dir}")
+    return loaded
 
-    persist_dir = get_chroma_path()
-    persist_dir.mkdir(parents=True, exist_ok=True)
-    embeddings = _get_embeddings()
-    collection_name = "enterprise_knowledge"
 
-    vector_store = Chroma.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        collection_name=collection_name,
-        persist_directory=str(persist_dir),
-    )
-    logger.info(f"向量库已构建并持久化到 {persist_dir}")
-    _vector_store_instance = vector_store
-    return vector_store
+def _relative_source(source: str, knowledge_path: Path) -> str:
+    """文档来源相对 knowledge_docs 的 posix 路径（不在其下时只取文件名，归入默认分区）。"""
+    path = Path(source)
+    try:
+        return path.resolve().relative_to(knowledge_path).as_posix()
+    except (ValueError, OSError):
+        return path.name
+
+
+def rollback_index() -> dict | None:
+    """
+    切回上一个索引版本（重建结果有问题时使用）；没有可回滚的版本时返回 None。
+    回滚目标的索引版本号改为当前版本号 + 1（版本号只增不减，问答缓存据此丢弃切换前生成的答案）。
+    """
+    with _build_lock:
+        root = get_chroma_path()
+        previous = index_versions.read_pointer(root).get("previous")
+        target = index_versions.version_dir(root, previous) if previous else None
+        if target is not None and (target / MANIFEST_FILENAME).exists():
+            manifest = load_manifest(target)
+            manifest["index_version"] = get_index_version() + 1
+            save_manifest(target, manifest)
+        version = index_versions.rollback(root)
+        if version is None:
+            return None
+        get_partitions(allow_create=False)
+        logger.info(f"已回滚到索引版本 {version}")
+        return {"version": version, "index_version": get_index_version()}
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+进程内指标：分阶段耗时直方图、计数器与仪表，按 Prometheus 文本格式输出（/metrics），无第三方依赖。
+
+热路径用法：
+    with stage("retrieve"):
+        ...
+每个阶段一次 perf_counter + 一次加锁累加，开销为微秒级。若当前请求开启了 request_timings()，
+同一阶段的耗时还会累加到该请求的明细中（contextvar 随 asyncio.to_thread 传递到线程池）。
+"""
+import bisect
+import contextvars
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_timings: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    items = key + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self._values: dict[tuple, float] = {}
+        super().__init__(name, help)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self._values: dict[tuple, float] = {}
+        super().__init__(name, help)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # 标签 -> [各桶计数..., 总和, 总数]
+        super().__init__(name, help)
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, (('le', repr(bound)),))} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {row[-1]}"
+            yield f"{self.name}_sum{_format_labels(key)} {row[-2]}"
+            yield f"{self.name}_count{_format_labels(key)} {row[-1]}"
+
+
+class Registry:
+    """指标注册表；collector 在抓取时调用，返回 [(名称, 类型, 说明, [(标签 dict, 值)])]，用于导出已有的统计（如缓存命中数）。"""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[tuple[str, str, str, list[tuple[dict, float]]]]]] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        for collector in self._collectors:
+            for name, type_, help, values in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_}")
+                lines.extend(f"{name}{_format_labels(_label_key(labels))} {float(value)}" for labels, value in values)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "各处理阶段耗时（秒）；嵌套阶段的耗时包含在外层阶段内")
+REQUESTS = Counter("rag_requests_total", "问答请求数")
+REQUEST_SECONDS = Histogram("rag_request_seconds", "问答请求端到端耗时（秒）")
+INFLIGHT = Gauge("rag_inflight_requests", "正在处理的问答请求数")
+DOCUMENTS_LOADED = Counter("rag_documents_loaded_total", "解析得到的文档片段数")
+FILES_LOADED = Counter("rag_files_loaded_total", "解析的文件数（按结果区分）")
+CHUNKS_INDEXED = Counter("rag_chunks_indexed_total", "写入索引的文本块数")
+CHUNKS_DELETED = Counter("rag_chunks_deleted_total", "从索引删除的文本块数")
+CHUNKS_DEDUPLICATED = Counter("rag_chunks_deduplicated_total", "入库去重时因近似重复未单独入库的文本块数")
+CONTEXT_TOKENS = Histogram("rag_context_tokens", "提示词中参考文档的估算 token 数", buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000))
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """记录一次阶段耗时（计入直方图，并累加到当前请求的明细中）。"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+@contextmanager
+def request_timings() -> Iterator[dict[str, float]]:
+    """为当前请求收集各阶段耗时（秒）；退出后可通过 format_timings 转为毫秒明细。"""
+    timings: dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def format_timings(timings: dict[str, float]) -> dict[str, float]:
+    return {name: round(seconds * 1000, 2) for name, seconds in timings.items()}
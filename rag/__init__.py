@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 """RAG 问答：检索 + 生成。"""
-from .chain import answer_question, rebuild_index
+from .chain import answer_question, aanswer_question, astream_answer, abatch_answer, check_scope, rebuild_index
 
-__all__ = ["answer_question", "rebuild_index"]
+__all__ = ["answer_question", "aanswer_question", "astream_answer", "abatch_answer", "check_scope", "rebuild_index"]
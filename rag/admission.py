@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+准入控制与降载：按阶段（查询嵌入 embed、向量检索 search、LLM 生成 llm）限制同时执行的请求数，
+超出的请求进入有界的等待队列并有最长等待时间；队列已满或等待超时时立即拒绝（Overloaded），
+由 API 返回 503 + Retry-After，或在 LLM 阶段降级为仅检索的回答（与未配置 LLM 时相同）。
+
+只作用于异步问答路径（/api/ask、/api/ask/stream）；批量问答另有 batch_llm_concurrency 限制，同步的 answer_question 不受限。
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+
+from config import get_settings, on_settings_reload
+from metrics import observe_stage
+
+_STAGE_NAMES = {"embed": "查询向量", "search": "检索", "llm": "生成"}
+
+
+class Overloaded(Exception):
+    """阶段并发已满且等待队列已满（queue_full）或排队超时（timeout）。"""
+
+    def __init__(self, stage: str, reason: str, retry_after: float):
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+        what = "排队人数已满" if reason == "queue_full" else "排队超时"
+        super().__init__(f"服务繁忙（{_STAGE_NAMES.get(stage, stage)}阶段{what}），请稍后重试")
+
+
+class Gate:
+    """
+    单个阶段的准入闸门（同一事件循环内使用）：最多 limit 个请求同时执行，其余按到达顺序排队，
+    队列长度不超过 queue_size，排队超过 timeout 秒即放弃。释放时名额直接交给队首等待者。
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float, retry_after: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def full(self) -> bool:
+        """名额与队列都已占满，新请求会被立即拒绝。"""
+        return self.active >= self.limit and len(self._waiters) >= self.queue_size
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.shed_queue_full += 1
+            raise Overloaded(self.name, "queue_full", self.retry_after)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append(future)
+        self.queued += 1
+        granted = False
+        started = loop.time()
+        try:
+            await asyncio.wait({future}, timeout=self.timeout)
+            granted = future.done() and not future.cancelled()
+        finally:
+            observe_stage(f"queue_{self.name}", loop.time() - started)
+            if not granted:
+                if future.done() and not future.cancelled():
+                    self._release()  # 被取消时恰好轮到本请求：名额转交下一位
+                future.cancel()
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+        if not granted:
+            self.shed_timeout += 1
+            raise Overloaded(self.name, "timeout", self.retry_after)
+        self.admitted += 1
+
+    def _release(self) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)  # 名额直接交给等待者，active 不变
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
+
+
+class AdmissionController:
+    """各阶段闸门；limit 为 0 的阶段不限制。degraded 记录 LLM 阶段降级为仅检索回答的次数。"""
+
+    def __init__(self, limits: dict[str, int], queue_size: int, queue_timeout_ms: float, retry_after: float):
+        self.gates = {
+            stage: Gate(stage, limit, queue_size, queue_timeout_ms / 1000, retry_after)
+            for stage, limit in limits.items()
+            if limit > 0
+        }
+        self.degraded = 0
+
+    def slot(self, stage: str):
+        gate = self.gates.get(stage)
+        return gate.slot() if gate is not None else nullcontext()
+
+    def check(self) -> None:
+        """任一阶段已占满（名额与队列均满）时抛出 Overloaded，用于在开始处理前直接拒绝（如流式响应开始之前）。"""
+        for gate in self.gates.values():
+            if gate.full():
+                gate.shed_queue_full += 1
+                raise Overloaded(gate.name, "queue_full", gate.retry_after)
+
+    def stats(self) -> dict:
+        return {"stages": {name: gate.stats() for name, gate in self.gates.items()}, "degraded": self.degraded}
+
+
+_admission_instance: AdmissionController | None = None
+
+
+def get_admission() -> AdmissionController | None:
+    """获取准入控制器（单例）；未启用时返回 None。配置重载后按新配置重建（已在执行的请求照常完成）。"""
+    global _admission_instance
+    s = get_settings()
+    if not s.admission_enabled:
+        return None
+    if _admission_instance is None:
+        _admission_instance = AdmissionController(
+            limits={
+                "embed": s.admission_embed_concurrency,
+                "search": s.admission_search_concurrency,
+                "llm": s.admission_llm_concurrency,
+            },
+            queue_size=s.admission_queue_size,
+            queue_timeout_ms=s.admission_queue_timeout_ms,
+            retry_after=s.admission_retry_after,
+        )
+    return _admission_instance
+
+
+def admit(stage: str):
+    """async with admit("llm"): ... —— 进入该阶段前排队取得名额；未启用准入控制时直接放行。"""
+    admission = get_admission()
+    return admission.slot(stage) if admission is not None else nullcontext()
+
+
+def _reset_admission(_settings=None) -> None:
+    global _admission_instance
+    _admission_instance = None
+
+
+on_settings_reload(_reset_admission)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+问答结果缓存：
+- 精确层：以规范化后的问题 + top_k + 检索范围（分区）为键；
+- 语义层：新问题向量与已缓存问题向量（top_k 与检索范围相同）的余弦距离不超过阈值时复用答案。
+每条缓存带索引版本号，索引更新（/api/rebuild、增量更新、回滚、快照导入）后旧答案自动失效；支持 TTL 与 LRU 淘汰。
+索引版本号只增不减：只有更新的版本号清空缓存；检索开始后索引又被切换的请求带着旧版本号，其查找按未命中处理、写入直接丢弃。
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import get_settings
+
+_PUNCT_RE = re.compile(r"[\s?？!！。.,，、;；:：\"'“”‘’]+")
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题：去首尾空白、全角转半角、小写，并去除空白与标点，使仅标点/空格不同的问题命中同一条缓存。"""
+    text = question.strip().lower()
+    text = "".join(chr(ord(c) - 0xFEE0) if 0xFF01 <= ord(c) <= 0xFF5E else c for c in text)
+    return _PUNCT_RE.sub("", text)
+
+
+class AnswerCache:
+    """两级问答缓存（线程安全）。向量需已归一化，余弦距离 = 1 - 点积。"""
+
+    def __init__(self, max_entries: int = 2000, ttl_seconds: float = 3600, max_distance: float = 0.05):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, int, tuple], dict] = OrderedDict()  # LRU 顺序：最久未用的在前
+        self._version: int | None = None
+        # 语义层：按槽位存放问题向量，便于一次矩阵乘法比较全部缓存
+        self._vectors: np.ndarray | None = None
+        self._slot_keys: list[tuple[str, int, tuple] | None] = [None] * self.max_entries
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, index_version: int) -> bool:
+        """索引版本变新时清空全部缓存（旧答案基于旧索引）；返回 False 表示调用方的版本号已过时。"""
+        if self._version is None or index_version > self._version:
+            if self._entries:
+                self.invalidations += len(self._entries)
+            self._clear()
+            self._version = index_version
+        return index_version == self._version
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        if self._vectors is not None:
+            self._vectors[:] = 0
+        self._slot_keys = [None] * self.max_entries
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _remove(self, key: tuple[str, int, tuple]) -> None:
+        entry = self._entries.pop(key)
+        if entry["slot"] is not None:
+            self._vectors[entry["slot"]] = 0
+            self._slot_keys[entry["slot"]] = None
+            self._free.append(entry["slot"])
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl > 0 and time.monotonic() - entry["created"] > self.ttl
+
+    def _hit(self, key: tuple[str, int, tuple], entry: dict) -> dict:
+        self._entries.move_to_end(key)
+        return entry["result"]
+
+    def get_exact(self, question: str, top_k: int, index_version: int, scope: tuple = ()) -> dict | None:
+        key = (normalize_question(question), top_k, scope)
+        with self._lock:
+            if not self._check_version(index_version):
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                return None
+            self.exact_hits += 1
+            return self._hit(key, entry)
+
+    def get_semantic(self, embedding, top_k: int, index_version: int, scope: tuple = ()) -> dict | None:
+        """语义查找；未命中时计入 misses（应在精确层未命中后调用）。"""
+        with self._lock:
+            if not self._check_version(index_version) or self._vectors is None or not self._entries or self.max_distance <= 0:
+                self.misses += 1
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            scores = self._vectors @ query
+            for slot in np.argsort(-scores)[:8]:
+                if 1.0 - float(scores[slot]) > self.max_distance:
+                    break
+                key = self._slot_keys[slot]
+                if key is None or key[1:] != (top_k, scope):
+                    continue
+                entry = self._entries[key]
+                if self._expired(entry):
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+                self.semantic_hits += 1
+                return self._hit(key, entry)
+            self.misses += 1
+            return None
+
+    def put(self, question: str, top_k: int, index_version: int, embedding, result: dict, scope: tuple = ()) -> None:
+        key = (normalize_question(question), top_k, scope)
+        with self._lock:
+            if not self._check_version(index_version):
+                return  # 生成答案期间索引已切换，答案基于旧索引，不写入
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            slot = None
+            if embedding is not None:
+                vec = np.asarray(embedding, dtype=np.float32)
+                if self._vectors is None or self._vectors.shape[1] != vec.shape[0]:
+                    self._vectors = np.zeros((self.max_entries, vec.shape[0]), dtype=np.float32)
+                slot = self._free.pop()
+                self._vectors[slot] = vec
+                self._slot_keys[slot] = key
+            self._entries[key] = {"result": result, "created": time.monotonic(), "slot": slot}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "index_version": self._version,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+_answer_cache_instance: AnswerCache | None = None
+
+
+def get_answer_cache() -> AnswerCache | None:
+    """获取问答缓存（单例）；未启用时返回 None。"""
+    global _answer_cache_instance
+    s = get_settings()
+    if not s.answer_cache_enabled:
+        return None
+    if _answer_cache_instance is None:
+        _answer_cache_instance = AnswerCache(
+            max_entries=s.answer_cache_max_entries,
+            ttl_seconds=s.answer_cache_ttl_seconds,
+            max_distance=s.answer_cache_max_distance,
+        )
+    return _answer_cache_instance
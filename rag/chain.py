@@ -1,13 +1,34 @@
 # -*- coding: utf-8 -*-
 """RAG 检索与 LLM 问答链：企业知识库问答核心逻辑。"""
+import asyncio
+import contextlib
+import contextvars
+import time
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from config import get_settings
+from config import get_settings, on_settings_reload
 from logger_config import logger
-from knowledge import get_vector_store
+from metrics import CONTEXT_TOKENS, stage
+from knowledge import get_embeddings, get_index_version, get_partitions
+from knowledge.embedding_cache import embed_queries
+from knowledge.lexical_index import reciprocal_rank_fusion
+from knowledge.partitions import ROOT_PARTITION, route
+from knowledge.store_adapter import search_by_vector, search_by_vectors
+from knowledge.query_batcher import get_query_batcher
+from .admission import Overloaded, admit, get_admission
+from .answer_cache import get_answer_cache, normalize_question
+from .context_packer import estimate_tokens, pack_context
+from .llm_client import build_chat_model, get_llm_caller
+from .reranker import get_reranker
+from .singleflight import get_single_flight
+
+PARTITION_SEARCH_WORKERS = 8  # 多分区并行检索的线程数
 
 # 企业场景下的系统提示：优先依据参考文档作答，仅在文档真正无关时才说明无法回答
 SYSTEM_PROMPT = """你是企业内部知识库问答助手。请严格依据下面「参考文档」的内容回答问题。
@@ -20,83 +41,576 @@ SYSTEM_PROMPT = """你是企业内部知识库问答助手。请严格依据下
 """
 
 
-def _format_docs(docs):
-    return "\n\n---\n\n".join(doc.page_content for doc in docs)
+def _build_context(docs) -> tuple[str, list[Document]]:
+    """按 token 预算打包参考文档（合并相邻块、去重），返回 (上下文, 实际放入的文本块)。"""
+    if not docs:
+        return "（未检索到相关文档）", []
+    s = get_settings()
+    context, used = pack_context(docs, s.context_max_tokens, s.context_dedup_threshold)
+    CONTEXT_TOKENS.observe(estimate_tokens(context))
+    return context, used
 
 
 _llm_instance = None
+_llm_checked = False  # 已确认未配置 LLM 时不再每次请求重复检查与告警
+_answer_chain: tuple[object, object] | None = None  # (llm, 预先组装好的 prompt | llm | parser)
 
 
 def _get_llm():
-    """获取 LLM（单例）：若配置了 API 则用 OpenAI 兼容接口，否则返回 None（仅检索模式）。"""
-    global _llm_instance
-    if _llm_instance is not None:
+    """获取 LLM（单例）：若配置了 API 则用 OpenAI 兼容接口（连接池化的客户端，见 llm_client），否则返回 None（仅检索模式）。"""
+    global _llm_instance, _llm_checked
+    if _llm_instance is not None or _llm_checked:
         return _llm_instance
     s = get_settings()
     if not s.llm_api_base or not s.llm_api_key:
         logger.warning("未配置 LLM_API_BASE 或 LLM_API_KEY，将仅返回检索到的文档片段")
+        _llm_checked = True
         return None
     try:
-        from langchain_openai import ChatOpenAI
-        _llm_instance = ChatOpenAI(
-            base_url=s.llm_api_base,
-            api_key=s.llm_api_key,
-            model=s.llm_model,
-            temperature=s.llm_temperature,
-        )
+        _llm_instance = build_chat_model(s)
         return _llm_instance
     except Exception as e:
         logger.warning(f"初始化 LLM 失败: {e}")
         return None
 
 
-def answer_question(question: str, top_k: int | None = None) -> dict:
+HUMAN_PROMPT = "【参考文档】\n{context}\n\n【用户问题】{question}\n\n请仅根据上述参考文档回答用户问题；若文档中有相关内容请务必归纳后作答。"
+
+# 提示模板在导入时构建一次，各请求共享
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    ("human", HUMAN_PROMPT),
+])
+
+
+def _reset_llm(_settings=None) -> None:
+    """配置重载后丢弃 LLM 客户端与已组装的链，下次请求按新配置重建。"""
+    global _llm_instance, _llm_checked, _answer_chain
+    _llm_instance, _llm_checked, _answer_chain = None, False, None
+
+
+on_settings_reload(_reset_llm)
+
+
+def _build_sources(docs) -> list[dict]:
+    partitions = get_partitions(allow_create=False) if docs else {}
+    return [_build_source(d, partitions) for d in docs]
+
+
+def _build_source(d, partitions: dict | None = None) -> dict:
+    """
+    引用信息；结构化解析的文档带章节路径（section）与页码（page，从 1 开始），
+    入库去重时内容重复、未单独入库的其他文件列在 also_in 中。
+    """
+    source = {"content": d.page_content[:200] + "..." if len(d.page_content) > 200 else d.page_content, "source": d.metadata.get("source", ""), "filename": d.metadata.get("filename", "")}
+    if d.metadata.get("section"):
+        source["section"] = d.metadata["section"]
+    if d.metadata.get("page") is not None:
+        source["page"] = int(d.metadata["page"]) + 1
+    partition = (partitions or {}).get(d.metadata.get("partition", ROOT_PARTITION))
+    if partition is not None and d.id and partition.sources.get(d.id):
+        source["also_in"] = list(partition.sources[d.id])
+    return source
+
+
+def _get_answer_chain(llm):
+    """prompt | llm | parser 对每个 LLM 实例只组装一次；调用时传入 {"context", "question"}。"""
+    global _answer_chain
+    cached = _answer_chain
+    if cached is None or cached[0] is not llm:
+        cached = _answer_chain = (llm, PROMPT | llm | StrOutputParser())
+    return cached[1]
+
+
+def _retrieval_only_result(context: str, sources: list[dict]) -> dict:
+    return {
+        "answer": f"当前未配置大模型 API，仅展示检索到的相关内容：\n\n{context}",
+        "sources": sources,
+        "retrieved_only": True,
+    }
+
+
+def _degraded_result(context: str, sources: list[dict]) -> dict:
+    """LLM 阶段被准入控制拒绝时的降级回答（不写入问答缓存）。"""
+    admission = get_admission()
+    if admission is not None:
+        admission.degraded += 1
+    return {
+        "answer": f"当前问答请求较多，暂时仅展示检索到的相关内容，请稍后重试以获取完整回答：\n\n{context}",
+        "sources": sources,
+        "retrieved_only": True,
+        "degraded": True,
+    }
+
+
+def _dense_hits(vector_store, embedding: list[float], k: int, score_threshold: float | None) -> list[tuple[Document, float]]:
+    """按查询向量检索，返回 [(文本块, 相关度 0~1，越大越相关)]；设置了 score_threshold 时按相关度过滤。"""
+    with stage("vector_search"):
+        hits = search_by_vector(vector_store, embedding, k)
+    return hits if score_threshold is None else [hit for hit in hits if hit[1] >= score_threshold]
+
+
+def _answer_result(answer: str, sources: list[dict]) -> dict:
+    return {"answer": answer, "sources": sources, "retrieved_only": False}
+
+
+def _dense_hits_batch(vector_store, embeddings: list[list[float]], k: int, score_threshold: float | None) -> list[list[tuple[Document, float]]]:
+    """批量向量检索（按输入顺序返回）：扁平索引一次矩阵乘法打分，Chroma 一次 query 调用。"""
+    with stage("vector_search_batch"):
+        hits = search_by_vectors(vector_store, embeddings, k)
+    return hits if score_threshold is None else [[hit for hit in row if hit[1] >= score_threshold] for row in hits]
+
+
+def _lexical_hits(partition, question: str, k: int, s) -> list[tuple[str, float, object]]:
+    """分区内的 BM25 检索，返回 [(文本块 ID, 分数, 所在分区)]；未开启混合检索或词法索引为空时返回空列表。"""
+    lexical = partition.lexical if s.hybrid_search else None
+    if lexical is None or not len(lexical):
+        return []
+    with stage("lexical_search"):
+        return [(cid, score, partition) for cid, score in lexical.search(question, k)]
+
+
+def _fetch_k(k: int, s) -> int:
+    return max(k, s.hybrid_fetch_k) if s.hybrid_search else k
+
+
+def _fuse(dense: list[tuple[Document, float]], lexical: list[tuple[str, float, object]], k: int, s) -> list[Document]:
     """
-    基于 RAG 回答一个问题。
-    返回: { "answer": str, "sources": list[dict], "retrieved_only": bool }
+    合并各分区的向量与词法检索结果（各自按分数取前 hybrid_fetch_k 条）后做倒数排名融合（RRF），取前 k 条；
+    仅由词法检索召回的文本块从所在分区的向量库按 ID 取回。没有词法结果时直接按向量相关度取前 k 条。
+    """
+    fetch_k = _fetch_k(k, s)
+    dense = sorted(dense, key=lambda hit: -hit[1])[:fetch_k]
+    if not lexical or any(doc.id is None for doc, _ in dense):
+        return [doc for doc, _ in dense[:k]]
+    lexical = sorted(lexical, key=lambda hit: -hit[1])[:fetch_k]
+    fused = reciprocal_rank_fusion([[doc.id for doc, _ in dense], [cid for cid, _, _ in lexical]], k, rrf_k=s.rrf_k)
+
+    docs_by_id = {doc.id: doc for doc, _ in dense}
+    owners = {cid: partition for cid, _, partition in lexical}
+    missing: dict[str, tuple[object, list[str]]] = {}
+    for cid in fused:
+        if cid not in docs_by_id:
+            missing.setdefault(owners[cid].name, (owners[cid], []))[1].append(cid)
+    for partition, ids in missing.values():
+        got = partition.store.get(ids=ids, include=["documents", "metadatas"])
+        for cid, text, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+            docs_by_id[cid] = Document(page_content=text, metadata=meta or {}, id=cid)
+    return [docs_by_id[cid] for cid in fused if cid in docs_by_id]
+
+
+_partition_pool: ThreadPoolExecutor | None = None
+
+
+def _map_partitions(fn, partitions: list) -> list:
+    """对每个分区执行 fn：多个分区时在线程池中并行，每个任务带上当前请求上下文的副本（阶段耗时仍记入本次请求）。"""
+    global _partition_pool
+    if len(partitions) == 1:
+        return [fn(partitions[0])]
+    if _partition_pool is None:
+        _partition_pool = ThreadPoolExecutor(max_workers=PARTITION_SEARCH_WORKERS, thread_name_prefix="partition-search")
+    futures = [_partition_pool.submit(contextvars.copy_context().run, fn, partition) for partition in partitions]
+    return [future.result() for future in futures]
+
+
+def _search(partitions: list, question: str, embedding: list[float], k: int, score_threshold: float | None) -> list[Document]:
+    """
+    检索入口：在选中的分区中各自做向量检索（开启混合检索时另做 BM25 检索，各取 hybrid_fetch_k 条），合并后融合取前 k 条。
+    score_threshold 只作用于向量检索结果。
     """
     s = get_settings()
+    fetch_k = _fetch_k(k, s)
+
+    def search_partition(partition):
+        return _dense_hits(partition.store, embedding, fetch_k, score_threshold), _lexical_hits(partition, question, fetch_k, s)
+
+    dense, lexical = [], []
+    for partition_dense, partition_lexical in _map_partitions(search_partition, partitions):
+        dense.extend(partition_dense)
+        lexical.extend(partition_lexical)
+    return _fuse(dense, lexical, k, s)
+
+
+def _scope_key(scope: list[str] | None) -> tuple:
+    """请求指定的检索范围（分区名列表）规范化为元组，作为问答缓存键的一部分；未指定时为空元组。"""
+    return tuple(sorted(set(scope))) if scope else ()
+
+
+def check_scope(scope) -> None:
+    """检索范围（分区名列表）中有不存在的分区时抛出 ValueError。"""
+    if not scope:
+        return
+    partitions = get_partitions()
+    unknown = [name for name in scope if name not in partitions]
+    if unknown:
+        available = "、".join(name for name in partitions if name) or "无（未按目录分区）"
+        raise ValueError(f"知识库分区不存在: {'、'.join(unknown)}；可选分区: {available}")
+
+
+def _select_partitions(question: str, embedding: list[float], scope: tuple) -> list:
+    """要检索的分区：指定了范围时取这些分区；否则只有一个分区时直接使用，多个分区时按问题路由。"""
+    partitions = get_partitions()
+    if scope:
+        check_scope(scope)
+        return [partitions[name] for name in scope]
+    if len(partitions) <= 1:
+        return list(partitions.values())
+    s = get_settings()
+    with stage("route"):
+        return route(question, embedding, list(partitions.values()), s.partition_route_max, s.partition_route_margin, s.partition_name_boost)
+
+
+def _retrieve(question: str, embedding: list[float], k: int, score_threshold: float | None, scope: tuple = ()) -> list[Document]:
+    """选择分区 + 检索 + 可选重排：启用重排时先召回 rerank_fetch_k 条候选，经 cross-encoder 打分后只保留前 k 条。"""
+    with stage("retrieve"):
+        partitions = _select_partitions(question, embedding, scope)
+        if not partitions:
+            return []
+        reranker = get_reranker()
+        if reranker is None:
+            return _search(partitions, question, embedding, k, score_threshold)
+        candidates = _search(partitions, question, embedding, max(k, get_settings().rerank_fetch_k), score_threshold)
+        with stage("rerank"):
+            return reranker.rerank(question, candidates, k)
+
+
+def _retrieve_many(questions: list[str], embeddings: list[list[float]], k: int, score_threshold: float | None, scope: tuple = ()) -> list[list[Document]]:
+    """批量检索：每个分区对路由到它的问题一次完成向量检索，再逐个问题做词法融合与可选重排；结果与 _retrieve 逐个调用一致。"""
+    with stage("retrieve_batch"):
+        s = get_settings()
+        reranker = get_reranker()
+        candidate_k = max(k, s.rerank_fetch_k) if reranker else k
+        fetch_k = _fetch_k(candidate_k, s)
+        selected = [_select_partitions(q, e, scope) for q, e in zip(questions, embeddings)]
+        routed: dict[str, tuple[object, list[int]]] = {}
+        for i, partitions in enumerate(selected):
+            for partition in partitions:
+                routed.setdefault(partition.name, (partition, []))[1].append(i)
+        dense: list[list[tuple[Document, float]]] = [[] for _ in questions]
+        for partition, indexes in routed.values():
+            hits = _dense_hits_batch(partition.store, [embeddings[i] for i in indexes], fetch_k, score_threshold)
+            for i, partition_hits in zip(indexes, hits):
+                dense[i].extend(partition_hits)
+        results = []
+        for question, partitions, question_dense in zip(questions, selected, dense):
+            lexical = [hit for partition in partitions for hit in _lexical_hits(partition, question, fetch_k, s)]
+            docs = _fuse(question_dense, lexical, candidate_k, s)
+            if reranker:
+                with stage("rerank"):
+                    docs = reranker.rerank(question, docs, k)
+            results.append(docs)
+        return results
+
+
+def answer_question(question: str, top_k: int | None = None, scope: list[str] | None = None) -> dict:
+    """
+    基于 RAG 回答一个问题（先查问答缓存：精确层 → 语义层，未命中再检索 + 生成）。
+    scope: 只在这些知识库分区中检索（按目录分区时有效）；不指定时按问题路由到相关分区，分区不存在时抛出 ValueError。
+    与同时在途的相同问题合并：只有第一个请求检索并调用 LLM，其余请求共享其结果。
+    返回: { "answer": str, "sources": list[dict], "retrieved_only": bool, "cached": bool }
+    各阶段耗时记入 metrics（settings / cache_lookup / embed_query / retrieve / prompt / llm / coalesce_wait）。
+    """
+    with stage("settings"):
+        s = get_settings()
     k = top_k if top_k is not None else s.top_k
-    vector_store = get_vector_store()
+    scope = _scope_key(scope)
+    check_scope(scope)
+    with stage("cache_lookup"):
+        cache = get_answer_cache()
+        flight = get_single_flight()
+        version = get_index_version() if cache or flight else 0
+        hit = cache.get_exact(question, k, version, scope) if cache else None
+    if hit:
+        return {**hit, "cached": True}
+    if flight is None:
+        return _answer_uncached(question, k, scope, version)
+    return flight.do((normalize_question(question), k, scope, version), lambda: _answer_uncached(question, k, scope, version))
+
+
+def _answer_uncached(question: str, k: int, scope: tuple, version: int) -> dict:
+    """精确缓存未命中后的处理：问题向量 → 语义缓存 → 检索 → 生成，结果写入问答缓存。"""
+    cache = get_answer_cache()
+    get_partitions()
+    with stage("embed_query"):
+        embedding = get_embeddings().embed_query(question)
+    with stage("cache_lookup"):
+        hit = cache.get_semantic(embedding, k, version, scope) if cache else None
+    if hit:
+        return {**hit, "cached": True}
 
     # 检索
-    search_kwargs = {"k": k}
-    if s.score_threshold is not None:
-        search_kwargs["score_threshold"] = s.score_threshold
-
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs=search_kwargs)
-    docs = retriever.invoke(question)
-    context = _format_docs(docs) if docs else "（未检索到相关文档）"
-    sources = [{"content": d.page_content[:200] + "..." if len(d.page_content) > 200 else d.page_content, "source": d.metadata.get("source", ""), "filename": d.metadata.get("filename", "")} for d in docs]
-
-    llm = _get_llm()
-    if llm is None:
-        return {
-            "answer": f"当前未配置大模型 API，仅展示检索到的相关内容：\n\n{context}",
-            "sources": sources,
-            "retrieved_only": True,
-        }
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        ("human", "【参考文档】\n{context}\n\n【用户问题】{question}\n\n请仅根据上述参考文档回答用户问题；若文档中有相关内容请务必归纳后作答。"),
-    ])
-    chain = (
-        {"context": lambda _: context, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    answer = chain.invoke(question)
-    return {
-        "answer": answer,
-        "sources": sources,
-        "retrieved_only": False,
+    docs = _retrieve(question, embedding, k, get_settings().score_threshold, scope)
+    with stage("prompt"):
+        context, used = _build_context(docs)
+        sources = _build_sources(used)
+        llm = _get_llm()
+        chain = _get_answer_chain(llm) if llm is not None else None
+
+    if chain is None:
+        result = _retrieval_only_result(context, sources)
+    else:
+        with stage("llm"):
+            result = _answer_result(get_llm_caller().invoke(chain, {"context": context, "question": question}), sources)
+    if cache:
+        cache.put(question, k, version, embedding, result, scope)
+    return {**result, "cached": False}
+
+
+async def _aretrieve(question: str, k: int, embedding: list[float], scope: tuple):
+    """异步检索：分区路由、向量 + 词法检索及重排在线程池执行（经准入控制 search 阶段）。"""
+    async with admit("search"):
+        return await asyncio.to_thread(_retrieve, question, embedding, k, get_settings().score_threshold, scope)
+
+
+async def _alookup_exact(question: str, k: int, scope: tuple) -> tuple[dict | None, int]:
+    """异步查精确缓存：返回 (命中结果或 None, 索引版本)。检索范围中有不存在的分区时抛出 ValueError。"""
+    if scope:
+        await asyncio.to_thread(check_scope, scope)
+    with stage("cache_lookup"):
+        cache = get_answer_cache()
+        version = get_index_version() if cache or get_single_flight() else 0
+        hit = cache.get_exact(question, k, version, scope) if cache else None
+    return hit, version
+
+
+async def _alookup_semantic(question: str, k: int, scope: tuple, version: int) -> tuple[dict | None, list[float]]:
+    """计算问题向量（经准入控制 embed 阶段，微批器与并发请求合并计算）并查语义缓存：返回 (命中结果或 None, 问题向量)。"""
+    cache = get_answer_cache()
+    await asyncio.to_thread(get_partitions)  # 首次调用时在线程池中加载模型与向量库
+    async with admit("embed"):
+        with stage("embed_query"):
+            embedding = await get_query_batcher().embed(question)
+    with stage("cache_lookup"):
+        hit = cache.get_semantic(embedding, k, version, scope) if cache else None
+    return hit, embedding
+
+
+async def _alookup(question: str, k: int, scope: tuple) -> tuple[dict | None, list[float] | None, int]:
+    """
+    异步查缓存并计算问题向量：返回 (缓存命中结果或 None, 问题向量, 索引版本)。
+    精确命中时不计算向量；检索范围中有不存在的分区时抛出 ValueError。
+    """
+    hit, version = await _alookup_exact(question, k, scope)
+    if hit:
+        return hit, None, version
+    hit, embedding = await _alookup_semantic(question, k, scope, version)
+    return hit, embedding, version
+
+
+async def aanswer_question(question: str, top_k: int | None = None, scope: list[str] | None = None) -> dict:
+    """
+    answer_question 的异步版本：问题向量经微批器与并发请求合并计算，检索在线程池执行，LLM 调用异步进行
+    （截止时间与对冲请求见 llm_client），全程不占用请求线程；同时在途的相同问题合并为一次检索与生成。
+    参数与返回结构与 answer_question 相同。
+    """
+    with stage("settings"):
+        k = top_k if top_k is not None else get_settings().top_k
+    scope = _scope_key(scope)
+    hit, version = await _alookup_exact(question, k, scope)
+    if hit:
+        return {**hit, "cached": True}
+    flight = get_single_flight()
+    if flight is None:
+        return await _aanswer_uncached(question, k, scope, version)
+    return await flight.ado((normalize_question(question), k, scope, version), lambda: _aanswer_uncached(question, k, scope, version))
+
+
+async def _aanswer_uncached(question: str, k: int, scope: tuple, version: int) -> dict:
+    hit, embedding = await _alookup_semantic(question, k, scope, version)
+    if hit:
+        return {**hit, "cached": True}
+
+    docs = await _aretrieve(question, k, embedding, scope)
+    with stage("prompt"):
+        context, used = _build_context(docs)
+        sources = _build_sources(used)
+        llm = _get_llm()
+        chain = _get_answer_chain(llm) if llm is not None else None
+
+    if chain is None:
+        result = _retrieval_only_result(context, sources)
+    else:
+        try:
+            async with admit("llm"):
+                with stage("llm"):
+                    result = _answer_result(await get_llm_caller().ainvoke(chain, {"context": context, "question": question}), sources)
+        except Overloaded:
+            if not get_settings().admission_degrade:
+                raise
+            result = _degraded_result(context, sources)
+    cache = get_answer_cache()
+    if cache and not result.get("degraded"):
+        cache.put(question, k, version, embedding, result, scope)
+    return {**result, "cached": False}
+
+
+async def astream_answer(question: str, top_k: int | None = None, scope: list[str] | None = None) -> AsyncIterator[dict]:
+    """
+    流式问答：依次产出
+      {"event": "sources", "data": {"sources": [...], "retrieved_only": bool, "cached": bool}}   检索完成后立即发送
+      {"event": "token", "data": {"text": str}}                                  LLM 生成的增量文本（可多次）
+      {"event": "done", "data": {"retrieval_ms": float, "generation_ms": float, "total_ms": float}}
+    未配置 LLM、命中问答缓存或 LLM 阶段被准入控制降级时以单个 token 事件返回完整答案。scope 同 answer_question。
+    生成受 llm_first_token_timeout 与 llm_timeout 限制，超时抛出 TimeoutError（已发送的 token 事件不撤回），并释放 LLM 准入名额。
+    """
+    started = time.perf_counter()
+    k = top_k if top_k is not None else get_settings().top_k
+    scope = _scope_key(scope)
+    hit, embedding, version = await _alookup(question, k, scope)
+    result = hit
+    llm_slot = contextlib.AsyncExitStack()
+    if hit is None:
+        docs = await _aretrieve(question, k, embedding, scope)
+        context, used = _build_context(docs)
+        sources = _build_sources(used)
+        llm = _get_llm()
+        if llm is None:
+            result = _retrieval_only_result(context, sources)
+        else:
+            try:
+                await llm_slot.enter_async_context(admit("llm"))
+            except Overloaded:
+                if not get_settings().admission_degrade:
+                    raise
+                result = _degraded_result(context, sources)
+    retrieved = time.perf_counter()
+
+    async with llm_slot:
+        if result is not None:
+            yield {"event": "sources", "data": {"sources": result["sources"], "retrieved_only": result["retrieved_only"], "cached": hit is not None}}
+            yield {"event": "token", "data": {"text": result["answer"]}}
+        else:
+            yield {"event": "sources", "data": {"sources": sources, "retrieved_only": False, "cached": False}}
+            parts = []
+            with stage("llm"):
+                async for chunk in get_llm_caller().astream(_get_answer_chain(llm), {"context": context, "question": question}):
+                    if chunk:
+                        parts.append(chunk)
+                        yield {"event": "token", "data": {"text": chunk}}
+            result = _answer_result("".join(parts), sources)
+    cache = get_answer_cache()
+    if cache and hit is None and not result.get("degraded"):
+        cache.put(question, k, version, embedding, result, scope)
+    finished = time.perf_counter()
+    yield {
+        "event": "done",
+        "data": {
+            "retrieval_ms": round((retrieved - started) * 1000, 1),
+            "generation_ms": round((finished - retrieved) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+        },
     }
 
 
-def rebuild_index() -> dict:
-    """重建向量库索引（从知识库目录重新加载并写入 Chroma）。"""
-    from knowledge import build_and_persist_index
-    build_and_persist_index()
-    return {"status": "ok", "message": "知识库索引已重建"}
+def _batch_error(index: int, question: str, error: Exception | str) -> dict:
+    return {"index": index, "question": question, "error": str(error)}
+
+
+async def abatch_answer(
+    questions: list[str], top_k: int | None = None, concurrency: int | None = None, scope: list[str] | None = None
+) -> AsyncIterator[dict]:
+    """
+    批量问答：每 batch_chunk_size 个问题一轮，一次批量嵌入、一起做向量检索；LLM 调用最多 concurrency 路并发
+    （默认 batch_llm_concurrency），检索与生成流水进行。结果按完成顺序产出：
+      {"index": 输入序号, "question": str, "answer": str, "sources": [...], "retrieved_only": bool, "cached": bool}
+    单个问题失败时产出 {"index", "question", "error"}，不影响其余问题。scope 同 answer_question，作用于整批问题。
+    """
+    s = get_settings()
+    k = top_k if top_k is not None else s.top_k
+    scope = _scope_key(scope)
+    chunk_size = s.batch_chunk_size
+    llm_slots = asyncio.Semaphore(concurrency or s.batch_llm_concurrency)
+    cache = get_answer_cache()
+    version = get_index_version() if cache else 0
+    done: asyncio.Queue[dict] = asyncio.Queue()
+    generating: set[asyncio.Task] = set()
+
+    async def generate(index: int, question: str, embedding: list[float], docs: list[Document]) -> None:
+        try:
+            context, used = _build_context(docs)
+            sources = _build_sources(used)
+            llm = _get_llm()
+            if llm is None:
+                result = _retrieval_only_result(context, sources)
+            else:
+                async with llm_slots:
+                    with stage("llm"):
+                        # 批量问答不追求单条延迟，不发对冲请求
+                        answer = await get_llm_caller().ainvoke(_get_answer_chain(llm), {"context": context, "question": question}, hedge=False)
+                        result = _answer_result(answer, sources)
+            if cache:
+                cache.put(question, k, version, embedding, result, scope)
+            done.put_nowait({"index": index, "question": question, **result, "cached": False})
+        except Exception as e:
+            logger.warning(f"批量问答第 {index} 条生成失败: {e}")
+            done.put_nowait(_batch_error(index, question, e))
+
+    async def retrieve_chunk(pending: dict[int, str]) -> None:
+        """处理一轮问题；已产出结果或已交给生成任务的问题从 pending 中移除，出错时由调用方为剩余问题报错。"""
+        for index, question in list(pending.items()):
+            if not question.strip():
+                pending.pop(index)
+                done.put_nowait(_batch_error(index, question, "问题为空"))
+                continue
+            hit = cache.get_exact(question, k, version, scope) if cache else None
+            if hit:
+                pending.pop(index)
+                done.put_nowait({"index": index, "question": question, **hit, "cached": True})
+        if not pending:
+            return
+        texts = list(dict.fromkeys(pending.values()))
+        with stage("embed_query_batch"):
+            vectors = dict(zip(texts, await asyncio.to_thread(embed_queries, get_embeddings(), texts)))
+        for index, question in list(pending.items()):
+            hit = cache.get_semantic(vectors[question], k, version, scope) if cache else None
+            if hit:
+                pending.pop(index)
+                done.put_nowait({"index": index, "question": question, **hit, "cached": True})
+        if not pending:
+            return
+        items = list(pending.items())
+        embeddings = [vectors[q] for _, q in items]
+        retrieved = await asyncio.to_thread(_retrieve_many, [q for _, q in items], embeddings, k, s.score_threshold, scope)
+        for (index, question), embedding, docs in zip(items, embeddings, retrieved):
+            pending.pop(index)
+            task = asyncio.create_task(generate(index, question, embedding, docs))
+            generating.add(task)
+            task.add_done_callback(generating.discard)
+
+    async def produce() -> None:
+        try:
+            await asyncio.to_thread(check_scope, scope)  # 首次调用时在线程池中加载向量库
+        except Exception as e:
+            for index, question in enumerate(questions):
+                done.put_nowait(_batch_error(index, question, e))
+            return
+        for start in range(0, len(questions), chunk_size):
+            # 待生成的问题积压超过一轮时先等 LLM 消化，避免检索结果在内存中堆积
+            while len(generating) >= chunk_size:
+                await asyncio.wait(generating, return_when=asyncio.FIRST_COMPLETED)
+            pending = dict(enumerate(questions[start:start + chunk_size], start))
+            try:
+                await retrieve_chunk(pending)
+            except Exception as e:
+                logger.warning(f"批量问答第 {start} 条起的一轮检索失败（{len(pending)} 条未完成）: {e}")
+                for index, question in pending.items():
+                    done.put_nowait(_batch_error(index, question, e))
+
+    producer = asyncio.create_task(produce())
+    try:
+        for _ in range(len(questions)):
+            yield await done.get()
+    finally:
+        producer.cancel()
+        for task in list(generating):
+            task.cancel()
+
+
+def rebuild_index(full: bool = False) -> dict:
+    """
+    提交后台重建任务并立即返回：默认增量更新（仅处理新增/修改/删除的文件），full=True 时全量重建。
+    构建在新版本目录中进行，完成后原子切换；进度通过 get_index_job_manager().get(job_id) 查询。
+    """
+    from knowledge import get_index_job_manager
+    job = get_index_job_manager().submit(full=full)
+    return {"status": "accepted", "message": "重建任务已提交，将在后台执行", "job": job}
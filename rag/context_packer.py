@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+上下文打包：把检索到的文本块整理成提示词中的「参考文档」，替代逐块拼接。
+
+1. 合并同一来源（同一文件、同一页）中相邻或重叠的文本块，去掉切分时 chunk_overlap 造成的重复文字；
+2. 丢弃与已选内容几乎相同的文本块（如多个文件中重复的制度条款）；
+3. 按相关度顺序贪心装入，总量不超过 token 预算。
+
+token 数按字符估算（中日韩文字约 1 token/字，其余约 4 字符/token），无需加载分词器，偏保守。
+"""
+import math
+import re
+
+from langchain_core.documents import Document
+
+SEPARATOR = "\n\n---\n\n"
+MIN_OVERLAP_PROBE = 16  # 无 start_index 时用于识别重叠的最短前缀长度
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _shingles(text: str) -> set[str]:
+    text = "".join(text.split())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class _Passage:
+    """一段连续文本：由同一来源的若干文本块串接而成，rank 取其中最相关文本块的名次。"""
+
+    def __init__(self, rank: int, doc: Document):
+        self.rank = rank
+        self.key = _source_key(doc)
+        self.docs = [doc]
+        self.text = doc.page_content
+        self.start = doc.metadata.get("start_index")
+
+    def join(self, other: "_Passage") -> tuple[str, int | None] | None:
+        """other 紧接在本段之后（相邻或重叠）时返回串接后的 (文本, 起始位置)，否则返回 None。"""
+        if self.key != other.key:
+            return None
+        if self.start is not None and other.start is not None:
+            end = self.start + len(self.text)
+            if not self.start <= other.start <= end:
+                return None
+            return self.text + other.text[end - other.start:], self.start
+        # 旧索引的文本块没有 start_index：用 other 的开头在本段中定位重叠部分
+        probe = other.text[:MIN_OVERLAP_PROBE]
+        pos = self.text.find(probe) if len(probe) == MIN_OVERLAP_PROBE else -1
+        if pos < 0 or not other.text.startswith(self.text[pos:]):
+            return None
+        return self.text[:pos] + other.text, None
+
+    def absorb(self, other: "_Passage", joined: tuple[str, int | None]) -> None:
+        self.text, self.start = joined
+        self.docs.extend(other.docs)
+        self.rank = min(self.rank, other.rank)
+
+
+def _source_key(doc: Document) -> tuple:
+    return doc.metadata.get("source", ""), doc.metadata.get("page")
+
+
+def _merge_into(selected: list[_Passage], passage: _Passage) -> tuple[int, _Passage, _Passage, tuple] | None:
+    """在已选段落中找能与 passage 串接的一段，返回 (序号, 前段, 后段, 串接结果)。"""
+    for i, p in enumerate(selected):
+        for first, second in ((p, passage), (passage, p)):
+            joined = first.join(second)
+            if joined is not None:
+                return i, first, second, joined
+    return None
+
+
+def _tokens(selected: list[_Passage]) -> int:
+    return sum(estimate_tokens(p.text) for p in selected) + estimate_tokens(SEPARATOR) * max(0, len(selected) - 1)
+
+
+def pack_context(docs: list[Document], max_tokens: int = 0, dedup_threshold: float = 0.9) -> tuple[str, list[Document]]:
+    """
+    返回 (上下文文本, 实际放入的文本块)。docs 须按相关度降序，逐块贪心装入：与已选段落相邻或重叠的块并入该段，
+    只计新增部分的 token；装不下的块跳过，继续尝试后面更短的块。max_tokens 为 0 时不限预算；
+    dedup_threshold 为字符二元组 Jaccard 相似度阈值，达到即视为重复（>= 1 时只去除被已选内容完整包含的块）。
+    """
+    selected: list[_Passage] = []
+    seen: list[set[str]] = []
+    used = 0
+    for rank, doc in enumerate(docs):
+        shingles = _shingles(doc.page_content)
+        passage = _Passage(rank, doc)
+        merge = _merge_into(selected, passage)
+        contained = merge is None and any(doc.page_content in p.text for p in selected)
+        if contained or any(_jaccard(shingles, s) >= dedup_threshold for s in seen):
+            continue
+        if merge is not None:
+            i, first, second, joined = merge
+            cost = estimate_tokens(joined[0]) - estimate_tokens(selected[i].text)
+        else:
+            cost = estimate_tokens(doc.page_content) + (estimate_tokens(SEPARATOR) if selected else 0)
+        if max_tokens and used + cost > max_tokens:
+            if not selected:
+                # 最相关的一块本身就超出预算时截断放入，保证至少有一段参考内容
+                passage.text = _truncate(passage.text, max_tokens)
+                selected.append(passage)
+                seen.append(shingles)
+                used = _tokens(selected)
+            continue
+        if merge is None:
+            selected.append(passage)
+        else:
+            first.absorb(second, joined)
+            selected[i] = first
+            # 新块可能把两段连成一段
+            rest = selected[:i] + selected[i + 1:]
+            bridge = _merge_into(rest, first)
+            if bridge is not None:
+                j, a, b, joined = bridge
+                a.absorb(b, joined)
+                selected = [p for p in rest if p is not rest[j]] + [a]
+        seen.append(shingles)
+        used = _tokens(selected)
+    selected.sort(key=lambda p: p.rank)
+    return SEPARATOR.join(p.text for p in selected), [d for p in selected for d in p.docs]
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 调用：连接池化的 OpenAI 兼容客户端、单次调用截止时间与对冲请求（hedged request）。
+
+- 客户端复用 httpx 连接池（keep-alive），并发请求不再各自建连；连接数、空闲连接保活时间可配置；
+- 每次调用有截止时间 llm_timeout（异步调用含重试与对冲在内的总时长，超出抛出 TimeoutError；同步调用由 HTTP 超时保证）；
+  流式调用另有首个片段的超时 llm_first_token_timeout，两者任一超出即中断生成并抛出 TimeoutError；
+- 对冲：异步调用耗时超过近期调用耗时的 llm_hedge_percentile 分位仍未返回时，再发一个相同请求，取先返回者并取消另一个，
+  用少量额外请求削掉上游偶发的长尾延迟。样本不足 llm_hedge_min_samples 时不对冲。
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+
+from config import Settings, get_settings, on_settings_reload
+from logger_config import logger
+
+LATENCY_WINDOW = 500  # 计算分位数的近期调用数
+
+
+def build_chat_model(s: Settings):
+    """按配置创建 ChatOpenAI：同步与异步调用各用一个带连接池的 httpx 客户端。"""
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    limits = httpx.Limits(
+        max_connections=s.llm_max_connections,
+        max_keepalive_connections=s.llm_max_keepalive,
+        keepalive_expiry=s.llm_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(s.llm_timeout, connect=s.llm_connect_timeout)
+    return ChatOpenAI(
+        base_url=s.llm_api_base,
+        api_key=s.llm_api_key,
+        model=s.llm_model,
+        temperature=s.llm_temperature,
+        timeout=timeout,
+        max_retries=s.llm_max_retries,
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
+
+class LLMCaller:
+    """调用 prompt | llm | parser 链：记录近期耗时，异步调用按截止时间与耗时分位数决定超时与对冲。"""
+
+    def __init__(
+        self,
+        timeout: float = 60,
+        hedge_percentile: float = 0,
+        hedge_min_samples: int = 20,
+        hedge_min_delay_ms: float = 200,
+        first_token_timeout: float | None = None,
+    ):
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay_ms / 1000
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.ok = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _record(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _percentile(self, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(q / 100 * len(samples)) - 1)]
+
+    def hedge_delay(self) -> float | None:
+        """发出对冲请求前等待的秒数；未启用或样本不足时返回 None。"""
+        if not self.hedge_percentile or len(self._latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, self._percentile(self.hedge_percentile))
+
+    def invoke(self, chain, inputs: dict) -> str:
+        """同步调用（不对冲；截止时间由客户端的 HTTP 超时保证）。"""
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            result = chain.invoke(inputs)
+        except Exception:
+            self.errors += 1
+            raise
+        self._record(time.perf_counter() - started)
+        self.ok += 1
+        return result
+
+    async def ainvoke(self, chain, inputs: dict, hedge: bool = True) -> str:
+        """异步调用：超过截止时间抛出 TimeoutError；hedge=True 且已有足够耗时样本时按分位数发出对冲请求。"""
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        delay = self.hedge_delay() if hedge else None
+        started: dict[asyncio.Task, float] = {}
+
+        def launch() -> None:
+            started[asyncio.ensure_future(chain.ainvoke(inputs))] = loop.time()
+
+        launch()
+        primary = next(iter(started))
+        error: BaseException | None = None
+        try:
+            if delay is not None and delay < self.timeout:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    launch()
+            pending = set(started)
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._record(loop.time() - started[task])
+                        self.ok += 1
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            if not pending and error is not None:
+                self.errors += 1
+                raise error
+            self.timeouts += 1
+            raise TimeoutError(f"LLM 调用超过 {self.timeout:g}s 未完成")
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # 落败请求的异常已无人等待，取出以免事件循环告警
+
+    async def astream(self, chain, inputs: dict) -> AsyncIterator[str]:
+        """
+        流式调用（不对冲）：首个片段须在 first_token_timeout 内到达、整个生成须在 timeout 内完成，否则中断上游流并抛出 TimeoutError。
+        本生成器被关闭（如客户端断开、请求被取消）时同样关闭上游流。
+        """
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.timeout
+        first_deadline = min(deadline, started + self.first_token_timeout) if self.first_token_timeout else deadline
+        stream = aiter(chain.astream(inputs))
+        received = False
+        try:
+            while True:
+                limit = deadline if received else first_deadline
+                try:
+                    chunk = await asyncio.wait_for(anext(stream), max(0.0, limit - loop.time()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    what = "生成" if received else "首个片段"
+                    raise TimeoutError(f"LLM 流式调用{what}超过 {limit - started:g}s 未完成") from None
+                except Exception:
+                    self.errors += 1
+                    raise
+                received = True
+                yield chunk
+        finally:
+            close = getattr(stream, "aclose", None)
+            if close is not None:
+                await close()
+        self._record(loop.time() - started)
+        self.ok += 1
+
+    def stats(self) -> dict:
+        p50, p95 = self._percentile(50), self._percentile(95)
+        delay = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "ok": self.ok,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge_after_ms": round(delay * 1000, 1) if delay is not None else None,
+        }
+
+
+_llm_caller_instance: LLMCaller | None = None
+
+
+def get_llm_caller() -> LLMCaller:
+    """获取 LLM 调用器（单例）；配置重载后按新配置重建。"""
+    global _llm_caller_instance
+    if _llm_caller_instance is None:
+        s = get_settings()
+        _llm_caller_instance = LLMCaller(
+            timeout=s.llm_timeout,
+            hedge_percentile=s.llm_hedge_percentile,
+            hedge_min_samples=s.llm_hedge_min_samples,
+            hedge_min_delay_ms=s.llm_hedge_min_delay_ms,
+            first_token_timeout=s.llm_first_token_timeout,
+        )
+        if s.llm_hedge_percentile:
+            logger.info(f"LLM 对冲请求已启用：耗时超过近期 P{s.llm_hedge_percentile:g} 仍未返回时再发一次")
+    return _llm_caller_instance
+
+
+def _reset_llm_caller(_settings=None) -> None:
+    global _llm_caller_instance
+    _llm_caller_instance = None
+
+
+on_settings_reload(_reset_llm_caller)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+交叉编码器重排：检索阶段多召回若干候选，用本地小型 cross-encoder（CPU）对 (问题, 文本块) 打分，只把得分最高的 k 条送入提示词。
+打分分批执行并按 (规范化问题, 文本块) 缓存；每次请求有时间预算，预计超时则放弃重排、按原检索顺序取前 k 条。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+from config import get_settings
+from logger_config import logger
+from .answer_cache import normalize_question
+
+
+def _chunk_key(doc: Document) -> str:
+    return doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class CrossEncoderReranker:
+    """带分数缓存与时间预算的 cross-encoder 重排器（线程安全）。"""
+
+    def __init__(self, model_name: str, batch_size: int = 16, budget_ms: float = 200, max_cache_entries: int = 20000):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.budget = max(0.0, budget_ms) / 1000
+        self.max_cache_entries = max(1, max_cache_entries)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._batch_seconds: float | None = None  # 单批打分耗时的指数滑动平均，用于预判是否超出预算
+        self.reranked = 0
+        self.fallbacks = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                    logger.info(f"重排模型已加载: {self.model_name}")
+        return self._model
+
+    def warmup(self) -> None:
+        self._get_model()
+
+    def _predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        started = time.perf_counter()
+        scores = self._get_model().predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._batch_seconds = elapsed if self._batch_seconds is None else 0.8 * self._batch_seconds + 0.2 * elapsed
+        return [float(x) for x in scores]
+
+    def rerank(self, question: str, docs: list[Document], k: int) -> list[Document]:
+        """返回按 cross-encoder 得分排序的前 k 条；时间预算不足时按原顺序返回前 k 条。"""
+        if len(docs) <= 1:
+            return docs[:k]
+        self._get_model()  # 模型加载（仅首次）不计入时间预算
+        deadline = time.perf_counter() + self.budget
+        q = normalize_question(question)
+        keys = [(q, _chunk_key(d)) for d in docs]
+        scores: dict[tuple[str, str], float] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[key] = self._scores[key]
+            self.cache_hits += len(scores)
+            self.cache_misses += len(keys) - len(scores)
+
+        todo = [(key, d) for key, d in zip(keys, docs) if key not in scores]
+        for i in range(0, len(todo), self.batch_size):
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or (self._batch_seconds is not None and self._batch_seconds > remaining):
+                with self._lock:
+                    self.fallbacks += 1
+                logger.info(f"重排超出时间预算（{self.budget * 1000:.0f}ms），按检索顺序返回")
+                return docs[:k]
+            batch = todo[i:i + self.batch_size]
+            batch_scores = self._predict([(question, d.page_content) for _, d in batch])
+            with self._lock:
+                for (key, _), score in zip(batch, batch_scores):
+                    scores[key] = score
+                    self._scores[key] = score
+                    self._scores.move_to_end(key)
+                while len(self._scores) > self.max_cache_entries:
+                    self._scores.popitem(last=False)
+
+        with self._lock:
+            self.reranked += 1
+        order = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)
+        return [docs[i] for i in order[:k]]
+
+    def stats(self) -> dict:
+        total = self.cache_hits + self.cache_misses
+        return {
+            "model": self.model_name,
+            "model_loaded": self._model is not None,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "cache_entries": len(self._scores),
+            "cache_hit_rate": round(self.cache_hits / total, 4) if total else 0.0,
+            "avg_batch_ms": round(self._batch_seconds * 1000, 1) if self._batch_seconds is not None else None,
+        }
+
+
+_reranker_instance: CrossEncoderReranker | None = None
+
+
+def get_reranker() -> CrossEncoderReranker | None:
+    """获取重排器（单例）；未启用时返回 None。"""
+    global _reranker_instance
+    s = get_settings()
+    if not s.rerank_enabled:
+        return None
+    if _reranker_instance is None:
+        _reranker_instance = CrossEncoderReranker(
+            s.rerank_model,
+            batch_size=s.rerank_batch_size,
+            budget_ms=s.rerank_budget_ms,
+            max_cache_entries=s.rerank_cache_max_entries,
+        )
+    return _reranker_instance
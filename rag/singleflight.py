@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+请求合并（single-flight）：同一键（规范化问题、top_k、检索范围、索引版本）的请求同时在途时，
+只有第一个请求（leader）执行检索与 LLM 调用，其余请求等待并共享其结果或异常。
+适用于通知发布后大量员工同时提出同一问题、问答缓存尚未写入的那段时间。
+"""
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from config import get_settings
+from metrics import stage
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """同步（线程）与异步（asyncio）两套在途表，分别供 answer_question 与 aanswer_question 使用。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            with stage("coalesce_wait"):
+                call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        异步版本：共享的工作在独立任务中执行，任一请求被取消（如客户端断开）不影响其他等待者；
+        所有等待者都取消后任务仍会完成，结果照常写入问答缓存。
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda t: self._finish(key, t))
+            return await asyncio.shield(task)
+        self.followers += 1
+        with stage("coalesce_wait"):
+            return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # 等待者都已取消时异常无人取出，避免事件循环告警
+
+    def stats(self) -> dict:
+        total = self.leaders + self.followers
+        return {
+            "inflight": len(self._calls) + len(self._tasks),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_ratio": round(self.followers / total, 4) if total else 0.0,
+        }
+
+
+_single_flight_instance: SingleFlight | None = None
+
+
+def get_single_flight() -> SingleFlight | None:
+    """获取请求合并器（单例）；未启用时返回 None。"""
+    global _single_flight_instance
+    if not get_settings().request_coalescing:
+        return None
+    if _single_flight_instance is None:
+        _single_flight_instance = SingleFlight()
+    return _single_flight_instance
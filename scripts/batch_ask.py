@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+批量问答（FAQ 预生成、制度更新后回归检查）：读取问题文件，分轮批量嵌入与检索，LLM 有界并发，
+结果按完成顺序逐行写出 NDJSON（含 index 输入序号；失败的问题只带 error，不中断整批）。
+
+问题文件：.json 为字符串数组，其他后缀按每行一个问题（忽略空行）。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from logger_config import logger
+from rag import abatch_answer
+
+
+def read_questions(path: Path) -> list[str]:
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() == ".json":
+        return [str(q) for q in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def int_range(low: int, high: int):
+    """argparse 参数类型：low~high 之间的整数（与 /api/ask/batch 请求模型的取值范围一致）。"""
+    def parse(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"不是整数: {value}") from None
+        if not low <= number <= high:
+            raise argparse.ArgumentTypeError(f"须在 {low}~{high} 之间: {number}")
+        return number
+    return parse
+
+
+async def run(questions: list[str], out, top_k: int | None, concurrency: int | None, scope: list[str] | None = None) -> dict:
+    counts = {"ok": 0, "cached": 0, "error": 0}
+    async for item in abatch_answer(questions, top_k=top_k, concurrency=concurrency, scope=scope):
+        counts["error" if "error" in item else "cached" if item["cached"] else "ok"] += 1
+        out.write(json.dumps(item, ensure_ascii=False) + "\n")
+        out.flush()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量问答，结果输出为 NDJSON")
+    parser.add_argument("questions", type=Path, help="问题文件（.json 字符串数组，或每行一个问题的文本文件）")
+    parser.add_argument("-o", "--output", type=Path, default=None, help="结果文件，默认输出到标准输出")
+    parser.add_argument("--top-k", type=int_range(1, 20), default=None, help="检索条数（1~20），默认使用配置 TOP_K")
+    parser.add_argument("--concurrency", type=int_range(1, 64), default=None, help="LLM 并发调用数（1~64），默认使用配置 BATCH_LLM_CONCURRENCY")
+    parser.add_argument("--scope", action="append", default=None, help="只在该知识库分区中检索（可重复指定），默认按问题自动路由")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    logger.info(f"批量问答：共 {len(questions)} 个问题")
+    started = time.perf_counter()
+    out = args.output.open("w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = asyncio.run(run(questions, out, args.top_k, args.concurrency, args.scope))
+    finally:
+        if args.output:
+            out.close()
+    logger.info(f"批量问答完成：成功 {counts['ok']}，缓存命中 {counts['cached']}，失败 {counts['error']}，耗时 {time.perf_counter() - started:.1f}s")
+    sys.exit(1 if counts["error"] else 0)
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+检索与生成基准测试：生成（或读取）固定规模的语料，分阶段计时构建索引，再用固定问题集回放 answer_question（本地桩 LLM），
+输出吞吐、各阶段 p50/p95/p99 延迟、峰值内存与索引磁盘占用，以及 API 进程的模块导入耗时，结果写为 JSON，便于跨提交对比。
+
+示例：
+    python scripts/benchmark.py --docs 500 --chunk-size 500 --top-k 8
+    python scripts/benchmark.py --corpus knowledge_docs --output bench/baseline.json
+    python scripts/benchmark.py --imports-only
+所有数据写在 --workdir（默认临时目录）下，不影响正式的 knowledge_docs 与 chroma_db。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# 导入耗时分析的模块，及不应在导入 API 入口时就被加载的重型依赖
+IMPORT_PROFILE_MODULES = ("api.main", "knowledge", "rag")
+HEAVY_MODULES = ("chromadb", "sentence_transformers", "torch", "onnxruntime", "pypdf", "docx", "langchain_community", "rag.chain")
+
+# 固定问题集：与合成语料的主题、条款编号和表单名对应，保证跨提交可比
+QUESTIONS = [
+    "年假有多少天？",
+    "请假需要提前几天申请？",
+    "病假需要提供什么证明？",
+    "迟到多少分钟算旷工？",
+    "忘记打卡怎么补卡？",
+    "加班费如何计算？",
+    "出差住宿标准是多少？",
+    "差旅报销需要哪些票据？",
+    "报销单 FIN-012 在哪里填写？",
+    "采购超过多少金额需要招标？",
+    "HR-003 表单是做什么用的？",
+    "第 12 条规定了什么？",
+    "婚假可以休几天？",
+    "产假和陪产假的天数分别是多少？",
+    "试用期员工可以请年假吗？",
+    "笔记本电脑丢失应该怎么处理？",
+    "密码多久需要更换一次？",
+    "离职交接需要哪些流程？",
+    "调岗申请由谁审批？",
+    "公司的考勤时间是几点到几点？",
+]
+
+_TOPICS = {
+    "请假管理": ["年假", "病假", "事假", "婚假", "产假", "陪产假", "丧假"],
+    "考勤管理": ["迟到", "早退", "旷工", "补卡", "加班", "调休"],
+    "差旅报销": ["住宿标准", "交通费", "餐补", "票据", "借款", "报销时限"],
+    "采购管理": ["询价", "招标", "合同审批", "验收", "供应商准入"],
+    "信息安全": ["密码", "笔记本电脑", "数据外发", "访问权限", "安全事件"],
+    "人事异动": ["试用期", "转正", "调岗", "离职交接", "背景调查"],
+}
+_FORMS = ["HR-001", "HR-003", "HR-007", "FIN-012", "FIN-020", "PUR-005", "SEC-002", "ADM-009"]
+_ROLES = ["直属主管", "部门负责人", "人力资源部", "财务部", "分管副总", "总经理"]
+
+
+def _clause(rng: random.Random, number: int, topic: str) -> str:
+    item = rng.choice(_TOPICS[topic])
+    days, amount, minutes = rng.randint(1, 30), rng.choice([300, 500, 1000, 5000, 20000, 50000]), rng.choice([5, 10, 15, 30, 60])
+    templates = [
+        f"第 {number} 条 {item}：员工申请{item}须提前 {days} 个工作日在 OA 系统提交《{rng.choice(_FORMS)}》，经{rng.choice(_ROLES)}审批后生效。",
+        f"第 {number} 条 {item}的额度为每年 {days} 天，未休完部分可顺延至次年第一季度，逾期作废。",
+        f"第 {number} 条 单笔金额超过 {amount} 元的{item}事项，须由{rng.choice(_ROLES)}复核并报{rng.choice(_ROLES)}备案。",
+        f"第 {number} 条 {item}超过 {minutes} 分钟的，按{rng.choice(['旷工半天', '事假一天', '迟到一次'])}处理，当月累计三次以上通报批评。",
+        f"第 {number} 条 发生{item}相关问题时，应在 {days} 小时内通过《{rng.choice(_FORMS)}》上报{rng.choice(_ROLES)}，并保留相关记录不少于 {days} 个月。",
+    ]
+    return rng.choice(templates)
+
+
+def generate_corpus(directory: Path, n_docs: int, doc_chars: int, seed: int) -> dict:
+    """生成确定性的合成制度文档（.txt），返回语料统计。"""
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    total = 0
+    topics = list(_TOPICS)
+    for i in range(n_docs):
+        topic = topics[i % len(topics)]
+        parts, number = [f"{topic}制度（第 {i + 1} 版）\n"], 1
+        while sum(len(p) for p in parts) < doc_chars:
+            if number % 6 == 1:
+                parts.append(f"\n第{number // 6 + 1}章 {rng.choice(_TOPICS[topic])}\n")
+            parts.append(_clause(rng, number, topic) + "\n")
+            number += 1
+        text = "".join(parts)
+        (directory / f"{topic}-{i:05d}.txt").write_text(text, encoding="utf-8")
+        total += len(text)
+    return {"documents": n_docs, "characters": total, "synthetic": True, "seed": seed}
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file()) if path.exists() else 0
+
+
+def _peak_rss_mb() -> dict:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {}
+    scale = 1 if sys.platform == "darwin" else 1024  # macOS 以字节为单位，Linux 以 KB 为单位
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20, 1),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_import_profile(modules: tuple[str, ...] = IMPORT_PROFILE_MODULES, top: int = 10) -> dict:
+    """
+    在全新解释器中用 -X importtime 逐个导入 modules，报告导入耗时（毫秒，含解释器启动的进程总耗时）、
+    耗时最多的直接依赖，以及哪些重型依赖被连带加载。
+    """
+    result = {}
+    for module in modules:
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            result[module] = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+            continue
+        # 每行形如 "import time:  self [us] | cumulative | <缩进>模块名"，缩进层级表示依赖深度
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|", 2)
+            rows.append((name.strip(), (len(name) - len(name.lstrip()) - 1) // 2, int(cumulative)))
+        # 子模块先于父模块输出：紧挨在 module 之前、层级更深的连续行即它导入的依赖
+        end = next(i for i, row in enumerate(rows) if row[0] == module)
+        _, depth, total = rows[end]
+        start = end
+        while start > 0 and rows[start - 1][1] > depth:
+            start -= 1
+        loaded = {name for name, _, _ in rows}
+        children = sorted((r for r in rows[start:end] if r[1] == depth + 1), key=lambda r: -r[2])
+        result[module] = {
+            "import_ms": round(total / 1000, 1),
+            "process_ms": round(wall_ms, 1),
+            "top": {name: round(us / 1000, 1) for name, _, us in children[:top]},
+            "heavy_loaded": [m for m in HEAVY_MODULES if m in loaded],
+        }
+    return result
+
+
+def run_build(knowledge_dir: Path) -> dict:
+    """分阶段构建索引：加载 → 切分 → 嵌入（冷缓存）→ 写入（向量库 + 词法索引，嵌入命中刚写入的缓存）。"""
+    from knowledge import build_and_persist_index, get_embeddings, load_documents_from_directory
+    from knowledge.vector_store import _get_text_splitter
+
+    stages = {}
+    started = time.perf_counter()
+    docs = load_documents_from_directory(knowledge_dir)
+    stages["load_s"] = time.perf_counter() - started
+
+    t = time.perf_counter()
+    splits = _get_text_splitter().split_documents(docs)
+    stages["split_s"] = time.perf_counter() - t
+
+    embeddings = get_embeddings()  # 模型加载不计入嵌入阶段
+    t = time.perf_counter()
+    embeddings.embed_documents([d.page_content for d in splits])
+    stages["embed_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    build_and_persist_index(docs=docs)
+    stages["persist_s"] = time.perf_counter() - t - stages["split_s"]  # build_and_persist_index 内部会再切分一次
+    stages["total_s"] = time.perf_counter() - started
+    return {
+        **{k: round(v, 3) for k, v in stages.items()},
+        "chunks": len(splits),
+        "chunks_per_s": round(len(splits) / stages["embed_s"], 1) if stages["embed_s"] else None,
+    }
+
+
+def run_queries(questions: list[str], repeat: int, warmup: int, llm_latency_ms: float) -> dict:
+    """用桩 LLM 回放问题集，返回吞吐与各阶段延迟分布（阶段耗时来自 metrics 的请求级明细）。"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    import rag.chain as chain_module
+    from metrics import request_timings
+
+    chain_module._llm_instance = FakeListChatModel(
+        responses=["根据参考文档，相关规定如上所述。"],
+        sleep=llm_latency_ms / 1000 if llm_latency_ms > 0 else None,
+    )
+    for q in questions[:warmup]:
+        chain_module.answer_question(q)
+
+    samples: dict[str, list[float]] = {}
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for q in questions:
+            with request_timings() as timings:
+                t = time.perf_counter()
+                chain_module.answer_question(q)
+                timings["total"] = time.perf_counter() - t
+            # 嵌入与 LLM 之外的每请求开销（配置、检索、拼装上下文与提示等）
+            timings["overhead"] = timings["total"] - timings.get("embed_query", 0.0) - timings.get("llm", 0.0)
+            for stage, value in timings.items():
+                samples.setdefault(stage, []).append(value)
+    elapsed = time.perf_counter() - started
+    n = repeat * len(questions)
+    return {
+        "questions": n,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(n / elapsed, 2) if elapsed else None,
+        "llm_stub_latency_ms": llm_latency_ms,
+        "latency": {stage: _percentiles(values) for stage, values in samples.items()},
+        "setup_us": _setup_microbench(chain_module),
+    }
+
+
+def run_quantization_check(questions: list[str], k: int) -> dict | None:
+    """
+    flat 后端：报告检索需扫描的向量数据量（按目录分区时为全部分区之和），并在问题集上对比当前检索
+    （量化时为 int8 扫描 + 重排）与 float32 精确检索的 recall@k。
+    """
+    from knowledge import get_embeddings, get_partitions
+    from knowledge.embedding_cache import embed_queries
+
+    stores = [p.store for p in get_partitions().values()]
+    if not stores or not all(hasattr(store, "memory_stats") for store in stores):
+        return None
+    embeddings = embed_queries(get_embeddings(), questions)
+
+    def search(embedding, exact: bool):
+        hits = [hit for store in stores for hit in store.similarity_search_by_vectors_with_relevance_scores([embedding], k, exact=exact)[0]]
+        return sorted(hits, key=lambda hit: -hit[1])[:k]
+
+    timings = {}
+    results = {}
+    for mode, exact in (("search", False), ("exact", True)):
+        started = time.perf_counter()
+        results[mode] = [search(e, exact) for e in embeddings]
+        timings[f"{mode}_ms_per_query"] = round((time.perf_counter() - started) / len(embeddings) * 1000, 3)
+    recall = [
+        len({d.id for d, _ in got} & {d.id for d, _ in want}) / len(want)
+        for got, want in zip(results["search"], results["exact"]) if want
+    ]
+    all_stats = [store.memory_stats() for store in stores]
+    float32_bytes = sum(st["float32_bytes"] for st in all_stats)
+    scan_bytes = sum(st["scan_bytes"] for st in all_stats)
+    return {
+        "quantization": all_stats[0]["quantization"],
+        "partitions": len(stores),
+        "rows": sum(st["rows"] for st in all_stats),
+        "dim": all_stats[0]["dim"],
+        "float32_mb": round(float32_bytes / 2**20, 2),
+        "scan_mb": round(scan_bytes / 2**20, 2),
+        "scan_saving": round(1 - scan_bytes / float32_bytes, 3) if float32_bytes else 0.0,
+        "k": k,
+        f"recall_at_{k}": round(sum(recall) / len(recall), 4) if recall else None,
+        **timings,
+    }
+
+
+def _setup_microbench(chain_module, iterations: int = 10000) -> dict:
+    """每请求固定开销的微基准（微秒/次）：读取配置、获取 LLM 与已组装的问答链。"""
+    from config import get_settings
+
+    def per_call_us(fn) -> float:
+        t = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return round((time.perf_counter() - t) / iterations * 1e6, 3)
+
+    return {
+        "get_settings": per_call_us(get_settings),
+        "get_answer_chain": per_call_us(lambda: chain_module._get_answer_chain(chain_module._get_llm())),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="检索与生成基准测试")
+    parser.add_argument("--docs", type=int, default=200, help="合成文档数量")
+    parser.add_argument("--doc-chars", type=int, default=3000, help="每篇合成文档的大致字符数")
+    parser.add_argument("--seed", type=int, default=42, help="合成语料随机种子")
+    parser.add_argument("--corpus", type=Path, default=None, help="使用已有文档目录代替合成语料")
+    parser.add_argument("--questions", type=Path, default=None, help="问题集 JSON 文件（字符串数组），默认使用内置固定问题集")
+    parser.add_argument("--repeat", type=int, default=3, help="问题集回放轮数")
+    parser.add_argument("--warmup", type=int, default=3, help="正式计时前的预热问题数")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="桩 LLM 每次调用的模拟耗时")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--chunk-overlap", type=int, default=None)
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--embedding-model", default=None)
+    parser.add_argument("--vector-backend", choices=["chroma", "flat"], default=None)
+    parser.add_argument("--quantization", choices=["none", "int8"], default=None, help="flat 后端的向量量化方式")
+    parser.add_argument("--workdir", type=Path, default=None, help="语料与索引的工作目录，默认临时目录（结束后删除）")
+    parser.add_argument("--output", type=Path, default=None, help="结果 JSON 路径，默认 benchmarks/bench_<提交>_<时间>.json")
+    parser.add_argument("--imports-only", action="store_true", help="只分析模块导入耗时，不构建索引与回放问题")
+    args = parser.parse_args()
+
+    imports = run_import_profile()
+    if args.imports_only:
+        print(json.dumps({"meta": {"commit": _git_commit(), "python": platform.python_version()}, "imports": imports}, ensure_ascii=False, indent=2))
+        return
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    knowledge_dir = args.corpus.resolve() if args.corpus else workdir / "docs"
+    # 须在首次 get_settings() 之前设置环境变量（配置进程内只加载一次）：索引与缓存写到工作目录；关闭问答缓存以测量真实检索与生成
+    overrides = {
+        "KNOWLEDGE_BASE_PATH": str(knowledge_dir),
+        "PERSIST_DIRECTORY": str(workdir / "index"),
+        "EMBEDDING_CACHE_DIR": str(workdir / "embedding_cache"),
+        "EMBEDDING_CACHE_ENABLED": "true",
+        "ANSWER_CACHE_ENABLED": "false",
+        "CHUNK_SIZE": args.chunk_size,
+        "CHUNK_OVERLAP": args.chunk_overlap,
+        "TOP_K": args.top_k,
+        "EMBEDDING_MODEL": args.embedding_model,
+        "VECTOR_BACKEND": args.vector_backend,
+        "VECTOR_QUANTIZATION": args.quantization,
+    }
+    os.environ.update({k: str(v) for k, v in overrides.items() if v is not None})
+
+    from config import get_settings
+    from logger_config import logger
+
+    try:
+        if args.corpus:
+            corpus = {"directory": str(knowledge_dir), "synthetic": False, "characters": sum(p.stat().st_size for p in knowledge_dir.rglob("*") if p.is_file())}
+        else:
+            corpus = generate_corpus(knowledge_dir, args.docs, args.doc_chars, args.seed)
+        questions = json.loads(args.questions.read_text(encoding="utf-8")) if args.questions else QUESTIONS
+
+        logger.info(f"基准测试：构建索引（工作目录 {workdir}）")
+        build = run_build(knowledge_dir)
+        logger.info(f"基准测试：回放 {len(questions)} 个问题 × {args.repeat} 轮")
+        query = run_queries(questions, args.repeat, args.warmup, args.llm_latency_ms)
+
+        s = get_settings()
+        vectors = run_quantization_check(questions, s.top_k)
+        result = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "settings": {
+                k: getattr(s, k)
+                for k in ("embedding_model", "vector_backend", "vector_quantization", "chunk_size", "chunk_overlap", "top_k", "score_threshold", "hybrid_search", "rerank_enabled")
+            },
+            "corpus": corpus,
+            "build": build,
+            "query": query,
+            "vectors": vectors,
+            "imports": imports,
+            "resources": {
+                "peak_rss_mb": _peak_rss_mb(),
+                "index_size_mb": round(_dir_size(workdir / "index") / 2**20, 2),
+                "embedding_cache_size_mb": round(_dir_size(workdir / "embedding_cache") / 2**20, 2),
+            },
+        }
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or ROOT / "benchmarks" / f"bench_{result['meta']['commit'] or 'nogit'}_{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    logger.info(f"基准测试结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
-"""一键重建知识库向量索引（可将此脚本加入定时任务或 CI）。"""
+"""
+一键重建知识库向量索引（可将此脚本加入定时任务或 CI）。默认增量更新，--full 全量重建，--rollback 切回上一版本。
+--export 把当前索引导出为单个快照文件，--import 在新节点导入快照（不重新嵌入，嵌入模型须与本节点配置一致）。
+"""
+import argparse
+import json
 import sys
 from pathlib import Path
 
@@ -7,9 +12,34 @@ ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT))
 
 from logger_config import logger
-from knowledge import build_and_persist_index
+from knowledge import SnapshotError, export_snapshot, import_snapshot, rollback_index, update_index
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重建知识库向量索引")
+    parser.add_argument("--full", action="store_true", help="清空后全量重建（默认仅增量更新变更文件）")
+    parser.add_argument("--rollback", action="store_true", help="切回上一个索引版本，不重建")
+    parser.add_argument("--export", metavar="PATH", help="把当前索引导出为快照文件，不重建")
+    parser.add_argument("--import", dest="import_path", metavar="PATH", help="从快照文件导入索引并切换为当前版本，不重建")
+    args = parser.parse_args()
+
+    if args.export or args.import_path:
+        try:
+            result = export_snapshot(args.export) if args.export else import_snapshot(args.import_path)
+        except SnapshotError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    if args.rollback:
+        result = rollback_index()
+        if result is None:
+            logger.error("没有可回滚的索引版本")
+            sys.exit(1)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        sys.exit(0)
+
     logger.info("开始重建知识库索引…")
-    build_and_persist_index()
+    report = update_index(full_rebuild=args.full)
     logger.info("索引重建完成。")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
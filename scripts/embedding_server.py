@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+启动本机嵌入服务：本进程加载嵌入模型（及磁盘嵌入缓存），API 各 worker 与索引构建通过 Unix 套接字请求向量。
+
+    python scripts/embedding_server.py --socket /run/rag/embed.sock
+    EMBEDDING_SERVER_SOCKET=/run/rag/embed.sock uvicorn api.main:app --workers 4
+
+停止：Ctrl+C 或 SIGTERM。
+"""
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from knowledge.embedding_server import serve
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本机嵌入服务（多 worker 共用一份嵌入模型）")
+    parser.add_argument("--socket", default=None, help="Unix 套接字路径，默认使用配置 EMBEDDING_SERVER_SOCKET")
+    args = parser.parse_args()
+    serve(args.socket)
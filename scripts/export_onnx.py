@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+导出 ONNX 嵌入模型（EMBEDDING_BACKEND=onnx 使用），并可与 PyTorch（sentence-transformers）模型对比：
+余弦偏差（1 - cos）、检索近邻一致率（同一批文本内 top-10 近邻的重合比例）、批量吞吐与单条查询延迟。
+
+    python scripts/export_onnx.py                                  # 按配置导出到 onnx_models/<模型名>/
+    python scripts/export_onnx.py --quantization int8 --check      # 导出 float32 + int8 并对比
+    python scripts/export_onnx.py --check --samples 1000 --threads 4 --output bench/onnx.json
+
+导出与对比需要 torch 与 sentence-transformers；导出目录可复制到只装有 onnxruntime 的机器上使用。
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from config import PROJECT_ROOT, get_knowledge_path, get_settings
+from logger_config import logger
+from knowledge.onnx_embeddings import MODEL_FILENAMES, OnnxEmbeddings, export_onnx_model, model_export_dir
+
+NEIGHBOURS = 10
+BUILTIN_TEXTS = [
+    "年假有多少天？",
+    "员工请假应提前三天提交申请，经部门负责人审批后报人力资源部备案。",
+    "差旅住宿标准按城市分级执行，一线城市每晚不超过 600 元。",
+    "笔记本电脑丢失应在 24 小时内报告信息安全部门并挂失账号。",
+    "采购金额超过 50 万元的项目须公开招标。",
+]
+
+
+def sample_texts(corpus: Path, limit: int) -> list[str]:
+    """对比用的文本：知识库切分后的文本块（不足时用内置示例补足），外加同样数量的短问题长度的片段。"""
+    from knowledge.loader import load_documents_from_directory
+    from knowledge.vector_store import _get_text_splitter
+
+    texts: list[str] = []
+    if corpus.is_dir():
+        docs = load_documents_from_directory(corpus)
+        texts = [d.page_content for d in _get_text_splitter().split_documents(docs)][:limit]
+    while len(texts) < limit:
+        texts.append(BUILTIN_TEXTS[len(texts) % len(BUILTIN_TEXTS)] + f"（示例 {len(texts)}）")
+    queries = [t[:24] for t in texts[: max(1, limit // 4)]]
+    return texts + queries
+
+
+def timed(fn, texts: list[str]) -> tuple[np.ndarray, float]:
+    fn(texts[:8])  # 预热
+    started = time.perf_counter()
+    vectors = np.asarray(fn(texts), dtype=np.float32)
+    return vectors, time.perf_counter() - started
+
+
+def query_latency_ms(fn, texts: list[str]) -> float:
+    samples = []
+    for text in texts:
+        started = time.perf_counter()
+        fn([text])
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(float(np.percentile(samples, 50)), 2)
+
+
+def neighbour_overlap(reference: np.ndarray, candidate: np.ndarray, queries: int = 50) -> float:
+    """前 queries 条文本各自在样本内的 top-10 近邻，两组向量结果的平均重合比例。"""
+    k = min(NEIGHBOURS, len(reference) - 1)
+    if k <= 0:
+        return 1.0
+    overlaps = []
+    for i in range(min(queries, len(reference))):
+        ref = set(np.argsort(-(reference @ reference[i]))[1:k + 1])
+        cand = set(np.argsort(-(candidate @ candidate[i]))[1:k + 1])
+        overlaps.append(len(ref & cand) / k)
+    return round(float(np.mean(overlaps)), 4)
+
+
+def compare(model_name: str, model_dir: Path, quantizations: list[str], texts: list[str], threads: int, batch_size: int) -> dict:
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    torch_fn = lambda batch: st.encode(batch, batch_size=batch_size, normalize_embeddings=True)  # noqa: E731
+    reference, torch_seconds = timed(torch_fn, texts)
+    short = [t for t in texts if len(t) <= 24][:50]
+    result = {
+        "samples": len(texts),
+        "torch": {
+            "texts_per_second": round(len(texts) / torch_seconds, 1),
+            "query_p50_ms": query_latency_ms(torch_fn, short),
+        },
+    }
+    for quantization in quantizations:
+        embeddings = OnnxEmbeddings(model_dir, quantization=quantization, intra_op_threads=threads, batch_size=batch_size)
+        vectors, seconds = timed(embeddings.embed_array, texts)
+        drift = 1.0 - np.sum(reference * vectors, axis=1)
+        result[f"onnx-{quantization}"] = {
+            "model_bytes": (model_dir / MODEL_FILENAMES[quantization]).stat().st_size,
+            "cosine_drift_mean": float(f"{drift.mean():.3g}"),
+            "cosine_drift_p99": float(f"{np.percentile(drift, 99):.3g}"),
+            "cosine_drift_max": float(f"{drift.max():.3g}"),
+            "neighbour_overlap": neighbour_overlap(reference, vectors),
+            "texts_per_second": round(len(texts) / seconds, 1),
+            "speedup": round(torch_seconds / seconds, 2),
+            "query_p50_ms": query_latency_ms(embeddings.embed_array, short),
+        }
+    return result
+
+
+if __name__ == "__main__":
+    s = get_settings()
+    parser = argparse.ArgumentParser(description="导出 ONNX 嵌入模型并与 PyTorch 模型对比")
+    parser.add_argument("--model", default=s.embedding_model, help="模型名，默认使用配置 EMBEDDING_MODEL")
+    parser.add_argument("--quantization", choices=["none", "int8"], default=s.onnx_quantization, help="int8 时另外导出动态量化模型")
+    parser.add_argument("--force", action="store_true", help="已导出时重新导出")
+    parser.add_argument("--check", action="store_true", help="导出后与 PyTorch 模型对比偏差与吞吐")
+    parser.add_argument("--samples", type=int, default=500, help="对比使用的文本块数")
+    parser.add_argument("--corpus", default=None, help="取样文本的目录，默认知识库目录")
+    parser.add_argument("--threads", type=int, default=s.onnx_intra_op_threads, help="ONNX Runtime 线程数，0 为默认")
+    parser.add_argument("--batch-size", type=int, default=s.onnx_batch_size)
+    parser.add_argument("--output", default=None, help="对比结果写入该 JSON 文件")
+    args = parser.parse_args()
+
+    model_dir = model_export_dir(PROJECT_ROOT / s.onnx_model_dir, args.model)
+    export_onnx_model(args.model, model_dir, args.quantization, force=args.force)
+    report = {"model": args.model, "model_dir": str(model_dir)}
+    if args.check:
+        corpus = Path(args.corpus) if args.corpus else get_knowledge_path()
+        texts = sample_texts(corpus, args.samples)
+        quantizations = ["none", "int8"] if args.quantization == "int8" else ["none"]
+        logger.info(f"对比 {len(texts)} 条文本：PyTorch vs ONNX（{', '.join(quantizations)}）")
+        report.update(compare(args.model, model_dir, quantizations, texts, args.threads, args.batch_size))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text, encoding="utf-8")
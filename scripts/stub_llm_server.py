@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+本地桩 LLM 服务（OpenAI 兼容 /v1/chat/completions，支持 stream），用于在不调用真实模型的情况下
+验证请求合并、连接复用、截止时间与对冲请求：可设置基础延迟与一定比例的长尾慢请求。
+
+    python scripts/stub_llm_server.py --port 9000 --latency-ms 300 --slow-ratio 0.05 --slow-ms 5000
+    LLM_API_BASE=http://127.0.0.1:9000/v1 LLM_API_KEY=stub LLM_HEDGE_PERCENTILE=95 uvicorn api.main:app
+
+GET /stats 返回收到的请求数、当前并发数与新建连接数（连接复用正常时远小于请求数）。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def create_app(latency_ms: float, slow_ratio: float, slow_ms: float, seed: int | None = None) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+    rng = random.Random(seed)
+    state = {"requests": 0, "inflight": 0, "max_inflight": 0, "slow": 0, "connections": set()}
+
+    def answer_for(body: dict) -> str:
+        question = next((m.get("content", "") for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+        return f"（桩回答）已收到问题，提示词长度 {len(question)} 字。"
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        state["requests"] += 1
+        client = request.scope.get("client")
+        if client:
+            state["connections"].add(tuple(client))
+        slow = rng.random() < slow_ratio
+        state["slow"] += slow
+        delay = (slow_ms if slow else latency_ms) / 1000
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "stub")
+        text = answer_for(body)
+
+        if body.get("stream"):
+            return StreamingResponse(stream(completion_id, model, text, delay), media_type="text/event-stream")
+        with tracked():
+            await asyncio.sleep(delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text), "total_tokens": len(text)},
+        }
+
+    async def stream(completion_id: str, model: str, text: str, delay: float):
+        with tracked():
+            await asyncio.sleep(delay)
+            for piece in (text[i:i + 4] for i in range(0, len(text), 4)):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+    @contextmanager
+    def tracked():
+        state["inflight"] += 1
+        state["max_inflight"] = max(state["max_inflight"], state["inflight"])
+        try:
+            yield
+        finally:
+            state["inflight"] -= 1
+
+    @app.get("/stats")
+    def stats():
+        return {**{k: v for k, v in state.items() if k != "connections"}, "connections": len(state["connections"])}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地桩 LLM 服务（OpenAI 兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=300, help="每次请求的基础延迟")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="长尾慢请求的比例（0-1）")
+    parser.add_argument("--slow-ms", type=float, default=5000, help="慢请求的延迟")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（复现慢请求序列）")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.slow_ratio, args.slow_ms, args.seed), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：把项目根目录加入导入路径（项目未打包安装，与 scripts/ 下脚本的做法相同），
+并提供确定性的假嵌入模型与临时知识库环境，测试不加载任何模型、不访问 LLM。
+"""
+import hashlib
+import sys
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    字符二元组哈希到 dim 维的归一化向量：共有的二元组越多越相似；embedded 记录实际计算过的文本数。
+    query_prefix 非空时查询向量先加前缀再计算，模拟给查询加指令前缀的模型（如 BGE）。
+    """
+
+    def __init__(self, dim: int = 64, query_prefix: str = ""):
+        self.dim = dim
+        self.query_prefix = query_prefix
+        self.embedded = 0
+
+    def _vector(self, text: str) -> list[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for gram in [text[i:i + 2] for i in range(len(text) - 1)] or [text]:
+            vec[int(hashlib.md5(gram.encode("utf-8")).hexdigest(), 16) % self.dim] += 1
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.embedded += 1
+        return self._vector(self.query_prefix + text)
+
+    def embed_queries(self, texts):
+        """给查询加前缀的后端须实现批量查询接口（见 knowledge.embedding_cache.embed_queries）。"""
+        return [self.embed_query(t) for t in texts]
+
+
+@pytest.fixture
+def fake_embeddings() -> FakeEmbeddings:
+    return FakeEmbeddings()
+
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+@pytest.fixture
+def make_docx():
+    """
+    生成最小的 .docx（只含解析器读取的 word/document.xml 与可选的 word/styles.xml），不依赖 python-docx。
+    body / styles 为 w 命名空间下的 XML 片段，如 '<w:p><w:r><w:t>正文</w:t></w:r></w:p>'。
+    """
+
+    def make(path: Path, body: str, styles: str | None = None) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("word/document.xml", f'<w:document xmlns:w="{W_NS}"><w:body>{body}</w:body></w:document>')
+            if styles is not None:
+                archive.writestr("word/styles.xml", f'<w:styles xmlns:w="{W_NS}">{styles}</w:styles>')
+        return path
+
+    return make
+
+
+@pytest.fixture
+def knowledge_env(tmp_path, monkeypatch, fake_embeddings):
+    """
+    临时知识库目录与索引目录，嵌入模型替换为 fake_embeddings（关闭磁盘嵌入缓存）。
+    返回 SimpleNamespace(docs=知识库目录, embeddings=假嵌入模型, use=切换索引目录与后端的函数，用于模拟另一节点)。
+    """
+    import config
+    from knowledge import vector_store as vs
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+
+    def use(persist: str, backend: str = "flat") -> None:
+        monkeypatch.setenv("PERSIST_DIRECTORY", str(tmp_path / persist))
+        monkeypatch.setenv("VECTOR_BACKEND", backend)
+        config.reload_settings()
+        monkeypatch.setattr(vs, "_active_index", None)
+        monkeypatch.setattr(vs, "_index_version_cache", None)
+
+    monkeypatch.setenv("KNOWLEDGE_BASE_PATH", str(docs))
+    monkeypatch.setenv("EMBEDDING_CACHE_ENABLED", "false")
+    monkeypatch.setenv("LOADER_WORKERS", "1")
+    monkeypatch.setattr(vs, "_embeddings_instance", fake_embeddings)
+    use("idx")
+    yield SimpleNamespace(docs=docs, embeddings=fake_embeddings, use=use)
+    monkeypatch.undo()
+    config.reload_settings()
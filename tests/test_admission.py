@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from rag.admission import AdmissionController, Gate, Overloaded
+
+
+def gate(limit=1, queue_size=2, timeout=1.0) -> Gate:
+    return Gate("llm", limit, queue_size, timeout, retry_after=3)
+
+
+def test_slots_are_handed_to_waiters_in_order():
+    g = gate(limit=1, queue_size=5)
+    order = []
+
+    async def worker(i):
+        async with g.slot():
+            order.append(i)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(worker(i) for i in range(4)))
+
+    asyncio.run(main())
+    assert order == [0, 1, 2, 3]
+    assert g.stats() == {
+        "limit": 1, "active": 0, "queue_depth": 0, "queue_size": 5,
+        "admitted": 4, "queued": 3, "shed_queue_full": 0, "shed_timeout": 0,
+    }
+
+
+def test_queue_full_is_shed_immediately():
+    g = gate(limit=1, queue_size=1)
+
+    async def hold(release):
+        async with g.slot():
+            await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        holders = [asyncio.ensure_future(hold(release)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert g.active == 1 and g.queue_depth == 1 and g.full()
+        with pytest.raises(Overloaded) as info:
+            async with g.slot():
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return info.value
+
+    error = asyncio.run(main())
+    assert (error.stage, error.reason, error.retry_after) == ("llm", "queue_full", 3)
+    assert "排队人数已满" in str(error)
+    assert g.shed_queue_full == 1 and g.active == 0
+
+
+def test_waiter_times_out():
+    g = gate(limit=1, queue_size=1, timeout=0.05)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            async with g.slot():
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as info:
+            async with g.slot():
+                pass
+        assert g.queue_depth == 0
+        release.set()
+        await holder
+        return info.value
+
+    assert asyncio.run(main()).reason == "timeout"
+    assert g.shed_timeout == 1 and g.active == 0
+
+
+def test_cancelled_waiter_passes_slot_on():
+    g = gate(limit=1, queue_size=5)
+    entered = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            async with g.slot():
+                await release.wait()
+
+        async def wait_for_slot(name):
+            async with g.slot():
+                entered.append(name)
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        cancelled = asyncio.ensure_future(wait_for_slot("cancelled"))
+        after = asyncio.ensure_future(wait_for_slot("after"))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.sleep(0)  # holder 释放，名额已交给 cancelled，但它还未运行
+        cancelled.cancel()
+        await asyncio.gather(holder, after)
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+    asyncio.run(main())
+    assert entered == ["after"]
+    assert g.active == 0 and g.queue_depth == 0
+
+
+def test_controller_unlimited_stage_and_check():
+    controller = AdmissionController({"embed": 0, "llm": 1}, queue_size=0, queue_timeout_ms=100, retry_after=1)
+    assert set(controller.gates) == {"llm"}
+
+    async def main():
+        async with controller.slot("embed"):
+            pass
+        async with controller.slot("llm"):
+            with pytest.raises(Overloaded):
+                controller.check()
+        controller.check()
+
+    asyncio.run(main())
+    assert controller.stats()["stages"]["llm"]["shed_queue_full"] == 1
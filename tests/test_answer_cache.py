@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from rag.answer_cache import AnswerCache, normalize_question
+
+
+def unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def test_normalize_question():
+    assert normalize_question("  年假有几天？ ") == normalize_question("年假有几天")
+    assert normalize_question("ＶＰＮ 怎么申请!") == "vpn怎么申请"
+
+
+def test_exact_and_semantic_hits():
+    cache = AnswerCache(max_entries=10, ttl_seconds=0, max_distance=0.05)
+    cache.put("年假有几天？", 4, 1, unit(1, 0, 0), {"answer": "五天"})
+    assert cache.get_exact("年假有几天", 4, 1) == {"answer": "五天"}
+    assert cache.get_exact("年假有几天", 8, 1) is None  # top_k 不同
+    assert cache.get_semantic(unit(1, 0.05, 0), 4, 1) == {"answer": "五天"}
+    assert cache.get_semantic(unit(0, 1, 0), 4, 1) is None
+
+
+def test_newer_version_invalidates():
+    cache = AnswerCache()
+    cache.put("年假", 4, 1, None, {"answer": "旧"})
+    assert cache.get_exact("年假", 4, 2) is None
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["index_version"] == 2
+
+
+def test_stale_put_after_newer_version_is_dropped():
+    cache = AnswerCache()
+    cache.put("年假", 4, 2, unit(1, 0), {"answer": "新索引"})
+    # 检索开始于版本 1，生成答案期间索引切换到版本 2：写入丢弃，不清空新版本的缓存
+    cache.put("报销", 4, 1, unit(0, 1), {"answer": "旧索引"})
+    assert cache.stats()["index_version"] == 2 and cache.stats()["invalidations"] == 0
+    assert cache.get_exact("年假", 4, 2) == {"answer": "新索引"}
+    assert cache.get_exact("报销", 4, 2) is None
+    assert cache.get_exact("年假", 4, 1) is None  # 旧版本号的查找也不命中
+    assert cache.get_semantic(unit(1, 0), 4, 1) is None
+    assert cache.get_semantic(unit(1, 0), 4, 2) == {"answer": "新索引"}
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    for q in ("a", "b"):
+        cache.put(q, 4, 1, None, {"answer": q})
+    cache.get_exact("a", 4, 1)
+    cache.put("c", 4, 1, None, {"answer": "c"})
+    assert cache.get_exact("b", 4, 1) is None
+    assert cache.get_exact("a", 4, 1) == {"answer": "a"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_rollback_advances_index_version(knowledge_env):
+    from knowledge import vector_store as vs
+
+    (knowledge_env.docs / "a.txt").write_text("年假为每年五天。", encoding="utf-8")
+    vs.update_index()
+    (knowledge_env.docs / "b.txt").write_text("报销须在十日内提交。", encoding="utf-8")
+    vs.update_index()
+    before = vs.get_index_version()
+    cache = AnswerCache()
+    cache.put("年假", 4, before, None, {"answer": "新版本的答案"})
+
+    assert vs.rollback_index()["index_version"] == before + 1
+    assert vs.get_index_version() == before + 1
+    assert cache.get_exact("年假", 4, vs.get_index_version()) is None  # 回滚后旧答案失效
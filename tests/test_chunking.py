@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from langchain_core.documents import Document
+
+from knowledge import chunking
+from knowledge.chunking import SECTION_SEPARATOR, SectionBuilder, StructuralTextSplitter, chapter_level, clause_label
+
+
+def splitter(chunk_size: int) -> StructuralTextSplitter:
+    return StructuralTextSplitter(chunk_size=chunk_size, chunk_overlap=0, separators=["\n", "。", ""])
+
+
+def sections(docs):
+    return [(d.page_content, d.metadata["section"]) for d in docs]
+
+
+def test_heading_and_clause_detection():
+    assert chapter_level("第二章 人力资源管理") == 11
+    assert chapter_level("第3节 请假") == 12
+    assert chapter_level("第一编 总则") == 10
+    assert chapter_level("第二章规定的事项，由人力资源部负责解释，各部门应当遵照执行，不得另行制定与之冲突的细则。") is None
+    assert clause_label("第十二 条 员工应当遵守考勤制度。") == "第十二条"
+    assert clause_label("根据第十二条的规定") is None
+
+
+def test_section_builder_tracks_heading_path_and_offsets():
+    b = SectionBuilder({"source": "a.docx"})
+    docs = []
+    docs += b.heading(1, "第一章 总则")
+    docs += b.line("本制度适用于全体员工。")
+    docs += b.clause_start("第一条", "第一条 员工应遵守考勤。")
+    docs += b.line("迟到三次记旷工半天。")
+    docs += b.heading(2, "第一节 请假")
+    docs += b.clause_start("第二条", "第二条 病假须附证明。")
+    docs += b.table(["类型 | 天数", "", "年假 | 5", "病假 | 3"])
+    docs += b.heading(1, "第二章 薪酬")
+    docs += b.line("工资每月十日发放。")
+    docs += b.flush()
+
+    assert sections(docs) == [
+        ("第一章 总则\n本制度适用于全体员工。", "第一章 总则"),
+        ("第一条 员工应遵守考勤。\n迟到三次记旷工半天。", "第一章 总则 > 第一条"),
+        ("第一节 请假", "第一章 总则 > 第一节 请假"),
+        ("第二条 病假须附证明。", "第一章 总则 > 第一节 请假 > 第二条"),
+        ("类型 | 天数\n年假 | 5\n病假 | 3", "第一章 总则 > 第一节 请假 > 第二条"),
+        ("第二章 薪酬\n工资每月十日发放。", "第二章 薪酬"),  # 同级标题替换整个下级路径
+    ]
+    table = docs[4].metadata
+    assert table["block"] == "table" and table["_table_header"] == "类型 | 天数"
+    full = SECTION_SEPARATOR.join(d.page_content for d in docs)
+    for doc in docs:
+        start = doc.metadata["start_index"]
+        assert full[start:start + len(doc.page_content)] == doc.page_content
+        assert doc.metadata["source"] == "a.docx" and "page" not in doc.metadata
+
+
+def test_section_builder_text_pages_and_size_limit(monkeypatch):
+    b = SectionBuilder({"source": "a.pdf"})
+    docs = b.start_page(0)
+    docs += b.text("第一章 总则\n\n第一条 员工应遵守考勤。\n迟到三次记旷工半天。")
+    docs += b.start_page(1)
+    docs += b.text("早退按迟到处理。")
+    docs += b.flush()
+    assert sections(docs) == [
+        ("第一章 总则", "第一章 总则"),
+        ("第一条 员工应遵守考勤。\n迟到三次记旷工半天。", "第一章 总则 > 第一条"),
+        ("早退按迟到处理。", "第一章 总则 > 第一条"),  # 标题路径跨页保留
+    ]
+    assert [(d.metadata["page"], d.metadata["start_index"]) for d in docs] == [(0, 0), (0, len("第一章 总则") + 2), (1, 0)]
+
+    monkeypatch.setattr(chunking, "MAX_SECTION_CHARS", 30)
+    b = SectionBuilder({})
+    docs = []
+    for i in range(6):
+        docs += b.line(f"第{i}行没有任何标题的正文内容")
+    docs += b.flush()
+    assert [d.page_content.count("\n") + 1 for d in docs] == [3, 3]  # 缓冲超过上限即产出一段
+    assert "\n".join(d.page_content for d in docs) == "\n".join(f"第{i}行没有任何标题的正文内容" for i in range(6))
+
+
+def chapter(builder: SectionBuilder, title: str, clauses: list[str]) -> list[Document]:
+    docs = builder.heading(1, title)
+    for text in clauses:
+        docs += builder.clause_start(clause_label(text), text)
+    return docs
+
+
+def test_splitter_merges_short_sibling_sections():
+    b = SectionBuilder({"source": "a.docx"})
+    docs = chapter(b, "第一章 考勤", ["第一条 九点上班。", "第二条 六点下班。"])
+    docs += chapter(b, "第二章 薪酬", ["第三条 十日发薪。"])
+    docs += b.flush()
+
+    chunks = splitter(30).split_documents(docs)
+    assert sections(chunks) == [
+        ("第一章 考勤\n\n第一条 九点上班。\n\n第二条 六点下班。", "第一章 考勤"),
+        ("第二章 薪酬\n\n第三条 十日发薪。", "第二章 薪酬"),  # 不同章的条款不合并
+    ]
+    assert [c.metadata["start_index"] for c in chunks] == [0, docs[3].metadata["start_index"]]
+    assert all("_heading" not in c.metadata for c in chunks)
+
+    chunks = splitter(20).split_documents(docs)
+    assert sections(chunks) == [
+        ("第一章 考勤\n\n第一条 九点上班。", "第一章 考勤"),
+        ("第二条 六点下班。", "第一章 考勤 > 第二条"),  # 超过 chunk_size 不再合并，单个章节保留自己的路径
+        ("第二章 薪酬\n\n第三条 十日发薪。", "第二章 薪酬"),
+    ]
+
+
+def test_splitter_never_merges_across_files_or_pages():
+    a = SectionBuilder({"source": "a.docx"})
+    b = SectionBuilder({"source": "b.docx"})
+    docs = a.line("甲文件正文。") + a.flush() + b.line("乙文件正文。") + b.flush()
+    assert [c.page_content for c in splitter(200).split_documents(docs)] == ["甲文件正文。", "乙文件正文。"]
+
+    p = SectionBuilder({"source": "a.pdf"})
+    docs = p.start_page(0) + p.text("第一页。") + p.start_page(1) + p.text("第二页。") + p.flush()
+    assert [(c.page_content, c.metadata["page"]) for c in splitter(200).split_documents(docs)] == [("第一页。", 0), ("第二页。", 1)]
+
+
+def test_splitter_splits_long_section_with_offsets():
+    b = SectionBuilder({"source": "a.docx"})
+    body = "".join(f"第{i}句内容较长需要单独切分。" for i in range(12))
+    docs = b.line("前言。") + b.heading(1, "第一章 总则") + b.line(body) + b.flush()
+    chunks = splitter(40).split_documents(docs)
+    assert chunks[0].page_content == "前言。" and len(chunks) > 3
+    full = SECTION_SEPARATOR.join(d.page_content for d in docs)
+    for chunk in chunks:
+        assert len(chunk.page_content) <= 40
+        start = chunk.metadata["start_index"]
+        assert full[start:start + len(chunk.page_content)] == chunk.page_content
+    assert all(c.metadata["section"] == "第一章 总则" for c in chunks[1:])
+
+
+def test_splitter_splits_table_by_rows_repeating_header():
+    rows = ["项目 | 标准"] + [f"差旅{i} | 每天 {300 + i} 元" for i in range(8)]
+    docs = SectionBuilder({"source": "a.docx"}).table(rows)
+    chunks = splitter(40).split_documents(docs)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        lines = chunk.page_content.split("\n")
+        assert lines[0] == "项目 | 标准" and len(lines) > 1 and len(chunk.page_content) <= 40
+        assert chunk.metadata["block"] == "table" and "_table_header" not in chunk.metadata
+    assert [row for c in chunks for row in c.page_content.split("\n")[1:]] == rows[1:]
+    assert chunks[0].metadata["start_index"] == 0
+    assert all("start_index" not in c.metadata for c in chunks[1:])  # 非首块以重复的表头开头，不记录位置
+
+
+def test_splitter_plain_documents_and_streaming():
+    plain = Document(page_content="无结构的文本。" * 10, metadata={"source": "a.txt"})
+    chunks = splitter(30).split_documents([plain])
+    assert len(chunks) > 1 and all("section" not in c.metadata and "start_index" in c.metadata for c in chunks)
+
+    b = SectionBuilder({"source": "a.docx"})
+    docs = chapter(b, "第一章 考勤", [f"第{i}条 第{i}项考勤规定。" for i in range(1, 9)]) + b.table(["甲 | 乙", "1 | 2"]) + b.flush()
+    expected = splitter(60).split_documents(docs + [plain])
+    streamed = list(splitter(60).iter_split(d for d in docs + [plain]))
+    assert [(c.page_content, c.metadata) for c in streamed] == [(c.page_content, c.metadata) for c in expected]
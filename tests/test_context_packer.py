@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from langchain_core.documents import Document
+
+from rag.context_packer import SEPARATOR, estimate_tokens, pack_context
+
+SOURCE = "员工手册第一章规定了考勤制度。员工每日须按时打卡，迟到三次以上扣减绩效。请假须提前在OA系统提交申请并经主管审批。年假按工龄计算，满一年五天，满十年十天。病假须提供医院证明。"
+
+
+def chunk(start: int, end: int, source: str = "handbook.pdf", page: int | None = 1, with_start: bool = True) -> Document:
+    metadata = {"source": source, "page": page}
+    if with_start:
+        metadata["start_index"] = start
+    return Document(page_content=SOURCE[start:end], metadata=metadata)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("年假天数") == 4
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("年假 abcd") == 2 + 2
+
+
+def test_overlapping_chunks_are_merged_by_start_index():
+    context, used = pack_context([chunk(0, 40), chunk(30, 70)])
+    assert context == SOURCE[0:70]
+    assert len(used) == 2
+
+
+def test_overlapping_chunks_are_merged_without_start_index():
+    docs = [chunk(30, 70, with_start=False), chunk(0, 50, with_start=False)]
+    context, used = pack_context(docs)
+    assert context == SOURCE[0:70]
+    assert [d.page_content for d in used] == [docs[1].page_content, docs[0].page_content]  # 合并段内按原文顺序
+
+
+def test_gap_is_bridged_by_middle_chunk():
+    context, used = pack_context([chunk(0, 30), chunk(60, 90), chunk(25, 65)])
+    assert context == SOURCE[0:90]
+    assert len(used) == 3
+
+
+def test_different_pages_are_not_merged():
+    context, _ = pack_context([chunk(0, 40), chunk(30, 70, page=2)])
+    assert context == SOURCE[0:40] + SEPARATOR + SOURCE[30:70]
+
+
+def test_duplicates_and_contained_chunks_are_dropped():
+    dup = chunk(0, 60, source="copy.pdf")
+    inner = chunk(10, 30, with_start=False)
+    context, used = pack_context([chunk(0, 60), dup, inner])
+    assert context == SOURCE[0:60]
+    assert len(used) == 1
+
+
+def test_budget_skips_large_chunks_and_keeps_rank_order():
+    long_doc = Document(page_content="长" * 200, metadata={"source": "b.pdf"})
+    short_doc = Document(page_content="短文本内容", metadata={"source": "c.pdf"})
+    context, used = pack_context([chunk(0, 40), long_doc, short_doc], max_tokens=60)
+    assert used == [used[0], short_doc] and len(used) == 2
+    assert context.startswith(SOURCE[0:40])
+    assert estimate_tokens(context) <= 60
+
+
+def test_oversized_top_chunk_is_truncated():
+    big = Document(page_content="制" * 100, metadata={"source": "a.pdf"})
+    context, used = pack_context([big, chunk(0, 10)], max_tokens=30)
+    assert context == "制" * 30
+    assert used == [big]
+
+
+def test_empty_input():
+    assert pack_context([]) == ("", [])
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from langchain_core.documents import Document
+
+from knowledge.dedup import DedupIndex, load_sources, minhash, numbers_digest, similarity
+
+CLAUSE = (
+    "第三条 员工因公出差，须在出发前通过OA系统提交出差申请，经部门负责人审批后方可预订交通与住宿。"
+    "出差结束后须在十个工作日内提交报销单，附发票原件与行程单，财务部审核通过后统一支付。"
+)
+OTHER = "第八条 信息安全：员工不得将公司电脑借予他人使用，密码须定期更换，离职时须交还全部门禁卡与设备。"
+
+
+def docs(*texts):
+    return [Document(page_content=t) for t in texts]
+
+
+def test_minhash_similarity():
+    assert similarity(minhash(CLAUSE), minhash(CLAUSE)) == 1.0
+    assert similarity(minhash(CLAUSE), minhash("  " + CLAUSE.replace("，", "， \n"))) >= 0.9  # 空白不影响
+    edited = CLAUSE.replace("统一支付", "按月支付")
+    assert 0.8 <= similarity(minhash(CLAUSE), minhash(edited)) < 1.0
+    assert similarity(minhash(CLAUSE), minhash(OTHER)) < 0.2
+    assert minhash(" \n\t") is None
+    assert minhash("短").shape == (64,)
+
+
+def test_numbers_digest():
+    assert numbers_digest("年假 5 天，病假 3 天") == numbers_digest("年假5天；病假3天")
+    assert numbers_digest("年假 5 天") != numbers_digest("年假 10 天")
+    assert numbers_digest("金额 1.5 万") != numbers_digest("金额 15 万")
+
+
+def test_filter_drops_cross_file_duplicates_and_records_sources():
+    index = DedupIndex(threshold=0.9)
+    kept, kept_ids, dup_of, dropped = index.filter("a.pdf", docs(CLAUSE, OTHER), ["a1", "a2"])
+    assert kept_ids == ["a1", "a2"] and dropped == 0 and dup_of == []
+
+    kept, kept_ids, dup_of, dropped = index.filter("b.pdf", docs(CLAUSE + "。", "新增条款：试用期为三个月。"), ["b1", "b2"])
+    assert kept_ids == ["b2"] and [d.page_content for d in kept] == ["新增条款：试用期为三个月。"]
+    assert dup_of == ["a1"] and dropped == 1
+    assert index.sources == {"a1": ["b.pdf"]}
+
+
+def test_same_file_duplicates_do_not_record_source():
+    index = DedupIndex()
+    _, kept_ids, dup_of, dropped = index.filter("a.pdf", docs(OTHER, OTHER), ["a1", "a2"])
+    assert kept_ids == ["a1"] and dropped == 1 and dup_of == []
+    assert index.sources == {}
+
+
+def test_number_change_is_not_a_duplicate():
+    index = DedupIndex(threshold=0.8)
+    index.filter("v1.pdf", docs(CLAUSE), ["v1"])
+    _, kept_ids, _, dropped = index.filter("v2.pdf", docs(CLAUSE.replace("十个工作日", "15个工作日")), ["v2"])
+    assert kept_ids == ["v2"] and dropped == 0
+
+
+def test_empty_chunks_are_kept_without_indexing():
+    index = DedupIndex()
+    _, kept_ids, _, _ = index.filter("a.pdf", docs("  ", "  "), ["e1", "e2"])
+    assert kept_ids == ["e1", "e2"] and len(index) == 0
+
+
+def test_remove_and_remove_source():
+    index = DedupIndex()
+    index.filter("a.pdf", docs(CLAUSE), ["a1"])
+    index.filter("b.pdf", docs(CLAUSE), ["b1"])
+    index.filter("c.pdf", docs(CLAUSE), ["c1"])
+    assert index.sources == {"a1": ["b.pdf", "c.pdf"]}
+    index.remove_source(["a1"], "b.pdf")
+    assert index.sources == {"a1": ["c.pdf"]}
+
+    index.remove(["a1"])
+    assert len(index) == 0 and index.sources == {}
+    _, kept_ids, _, _ = index.filter("c.pdf", docs(CLAUSE), ["c2"])
+    assert kept_ids == ["c2"]  # 保留块删除后重新入库
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    index = DedupIndex()
+    index.filter("a.pdf", docs(CLAUSE, OTHER), ["a1", "a2"])
+    index.filter("b.pdf", docs(CLAUSE), ["b1"])
+    index.remove(["a2"])
+    index.save(tmp_path)
+
+    loaded = DedupIndex.load(tmp_path)
+    assert len(loaded) == 1 and loaded.chunk_ids == ["a1"]
+    assert loaded.sources == load_sources(tmp_path) == {"a1": ["b.pdf"]}
+    assert loaded.find(minhash(CLAUSE), numbers_digest(CLAUSE)) == "a1"
+    assert loaded.find(minhash(OTHER), numbers_digest(OTHER)) is None
+
+
+def test_load_missing_or_corrupt(tmp_path):
+    assert DedupIndex.load(tmp_path) is None
+    assert load_sources(tmp_path) == {}
+    (tmp_path / "dedup_index.npz").write_bytes(b"broken")
+    assert DedupIndex.load(tmp_path) is None
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from knowledge.embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+
+DIM = 8
+
+
+@pytest.fixture
+def base(fake_embeddings):
+    fake_embeddings.query_prefix = "为这个句子生成表示以用于检索："  # 查询向量与文档向量不同
+    return fake_embeddings
+
+
+def make_cache(tmp_path, max_entries=100) -> EmbeddingCache:
+    return EmbeddingCache(tmp_path, model_name="test/model", normalize=True, max_entries=max_entries)
+
+
+def test_hits_skip_base_model(tmp_path, base):
+    cached = CachedEmbeddings(base, make_cache(tmp_path))
+    first = cached.embed_documents(["年假", "报销", "年假"])
+    assert base.embedded == 2  # 同一批内的重复文本只计算一次
+    assert cached.embed_documents(["报销", "年假"]) == [first[1], first[0]]
+    assert base.embedded == 2
+    assert cached.cache.stats()["hits"] == 2
+
+
+def test_query_and_document_vectors_are_cached_separately(tmp_path, base):
+    cached = CachedEmbeddings(base, make_cache(tmp_path))
+    doc = cached.embed_documents(["年假天数"])[0]
+    query = cached.embed_query("年假天数")
+    assert query != doc and query == pytest.approx(base.embed_query("年假天数"))
+    assert cached.embed_queries(["年假天数", "报销"])[0] == query
+    assert cache_key("m", True, "年假", "query") != cache_key("m", True, "年假")
+
+
+def test_persisted_entries_survive_reopen(tmp_path, base):
+    cached = CachedEmbeddings(base, make_cache(tmp_path))
+    vectors = cached.embed_documents([f"条款{i}" for i in range(5)])
+    cached.cache.flush()
+
+    base.embedded = 0
+    reopened = CachedEmbeddings(base, make_cache(tmp_path))
+    assert reopened.embed_documents([f"条款{i}" for i in range(5)]) == vectors
+    assert base.embedded == 0
+
+
+def test_lru_eviction(tmp_path):
+    cache = make_cache(tmp_path, max_entries=3)
+    keys = [cache_key("m", True, str(i)) for i in range(4)]
+    cache.put_many(keys[:3], np.ones((3, DIM)))
+    cache.get_many([keys[0]])  # keys[0] 变为最近使用
+    cache.put_many([keys[3]], np.ones((1, DIM)))
+    hits = [vec is not None for vec in cache.get_many(keys)]
+    assert hits == [True, False, True, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_slot_rewritten_elsewhere_reads_as_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    key, other = cache_key("m", True, "a"), cache_key("m", True, "b")
+    cache.put_many([key], np.ones((1, DIM)))
+    slot = cache._slots[key]
+    cache._vectors[slot] = 2.0  # 其他进程改写了向量但尚未更新校验和
+    assert cache.get_many([key]) == [None]
+
+    cache.put_many([key], np.ones((1, DIM)))
+    slot = cache._slots[key]
+    cache._keys[slot] = np.frombuffer(other, dtype=np.uint8)  # 槽位已被其他进程复用
+    assert cache.get_many([key]) == [None]
+
+
+def test_dimension_mismatch_is_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many([cache_key("m", True, "a")], np.ones((1, DIM)))
+    cache.put_many([cache_key("m", True, "b")], np.ones((1, DIM + 1)))
+    assert cache.get_many([cache_key("m", True, "b")]) == [None]
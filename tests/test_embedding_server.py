@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from knowledge.embedding_server import EmbeddingServer, RemoteEmbeddings
+
+
+class ServerThread:
+    """在后台线程的事件循环中运行嵌入服务，stop() 后等待其退出。"""
+
+    def __init__(self, embeddings, socket_path: Path, max_wait_ms: float = 5.0):
+        self.server = EmbeddingServer(embeddings, socket_path, max_wait_ms=max_wait_ms)
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._main(),), daemon=True)
+        self._thread.start()
+        assert self._ready.wait(5)
+        while not socket_path.exists():
+            time.sleep(0.01)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._ready.set()
+        await self.server.serve(self._stop)
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(5)
+
+
+@pytest.fixture
+def socket_path():
+    # Unix 套接字路径长度有限（约 100 字节），不使用较深的 tmp_path
+    directory = Path(tempfile.mkdtemp(prefix="emb-", dir="/tmp"))
+    yield directory / "embed.sock"
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def base(fake_embeddings):
+    fake_embeddings.query_prefix = "查询："
+    return fake_embeddings
+
+
+def test_round_trip(socket_path, base):
+    server = ServerThread(base, socket_path)
+    try:
+        client = RemoteEmbeddings(socket_path, timeout=5)
+        texts = ["年假为每年五天", "报销须在十日内提交"]
+        np.testing.assert_allclose(client.embed_documents(texts), base.embed_documents(texts), rtol=1e-6)
+        np.testing.assert_allclose(client.embed_query("年假"), base.embed_query("年假"), rtol=1e-6)
+        np.testing.assert_allclose(client.embed_queries(["年假", "报销"])[1], base.embed_query("报销"), rtol=1e-6)
+        assert client.embed_documents([]) == []
+        assert client.server_stats()["requests"] == 3
+    finally:
+        server.stop()
+    assert not socket_path.exists()
+
+
+def test_concurrent_clients_are_batched(socket_path, base):
+    server = ServerThread(base, socket_path, max_wait_ms=100)
+    client = RemoteEmbeddings(socket_path, timeout=5)
+    results = {}
+    try:
+        threads = [threading.Thread(target=lambda i=i: results.update({i: client.embed_documents([f"条款{i}", "公共"])})) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = server.server.stats()
+    finally:
+        server.stop()
+    np.testing.assert_allclose(results[2], base.embed_documents(["条款2", "公共"]), rtol=1e-6)
+    assert stats["requests"] == 4 and stats["batches"] < 4
+    assert stats["texts"] < 8  # 重复的「公共」在同一批内只计算一次
+
+
+def test_server_error_is_reported(socket_path, base):
+    def fail(texts):
+        raise ValueError("模型未加载")
+
+    base.embed_documents = fail
+    server = ServerThread(base, socket_path)
+    try:
+        with pytest.raises(RuntimeError, match="模型未加载"):
+            RemoteEmbeddings(socket_path, timeout=5).embed_documents(["年假"])
+    finally:
+        server.stop()
+
+
+def test_client_reconnects_once_after_server_restart(socket_path, base):
+    client = RemoteEmbeddings(socket_path, timeout=5)
+    server = ServerThread(base, socket_path)
+    try:
+        first = client.embed_query("年假")
+    finally:
+        server.stop()
+    server = ServerThread(base, socket_path)  # 服务重启：客户端的旧连接已失效
+    try:
+        assert client.embed_query("年假") == first
+    finally:
+        server.stop()
+    with pytest.raises(ConnectionError, match="无法连接嵌入服务"):
+        client.embed_query("年假")
+
+
+def test_second_server_on_same_socket_is_refused(socket_path, base):
+    server = ServerThread(base, socket_path)
+    try:
+        with pytest.raises(RuntimeError, match="已有嵌入服务"):
+            EmbeddingServer(base, socket_path)._prepare_socket()
+    finally:
+        server.stop()
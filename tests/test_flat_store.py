@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from knowledge.flat_store import FLAT_INDEX_FILENAME, FlatVectorStore
+
+DIM = 64  # 与 fake_embeddings 的维度一致
+
+
+def unit(rows: np.ndarray) -> np.ndarray:
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def exact_top(store_vectors: dict[str, np.ndarray], query: np.ndarray, k: int) -> list[str]:
+    ids = list(store_vectors)
+    scores = unit(np.stack([store_vectors[i] for i in ids])) @ query
+    return [ids[j] for j in np.argsort(-scores)[:k]]
+
+
+@pytest.fixture
+def texts():
+    return [f"第{i}条制度条款" for i in range(40)]
+
+
+def test_search_before_and_after_persist(tmp_path, texts, fake_embeddings):
+    store = FlatVectorStore(tmp_path, fake_embeddings)
+    ids = store.add_texts(texts, [{"n": i} for i in range(len(texts))], ids=[f"c{i}" for i in range(len(texts))])
+    query = fake_embeddings.embed_query(texts[7])
+    before = store.similarity_search_by_vector_with_relevance_scores(query, k=3)
+    assert before[0][0].id == "c7" and before[0][0].metadata == {"n": 7}
+    assert before[0][1] == pytest.approx(0.0, abs=1e-5)
+
+    store.persist()
+    after = store.similarity_search_by_vector_with_relevance_scores(query, k=3)
+    assert [(d.id, round(s, 5)) for d, s in after] == [(d.id, round(s, 5)) for d, s in before]
+
+    reopened = FlatVectorStore(tmp_path, fake_embeddings)
+    assert reopened.get()["ids"] == ids
+    assert reopened.similarity_search(texts[7], k=1)[0].page_content == texts[7]
+
+
+def test_delete_and_overwrite(tmp_path, texts, fake_embeddings):
+    store = FlatVectorStore(tmp_path, fake_embeddings)
+    store.add_texts(texts[:10], ids=[f"c{i}" for i in range(10)])
+    store.persist()
+    store.add_texts(["新增条款"], ids=["new"])
+    store.delete(["c3", "new"])
+    store.add_texts(["改写后的第5条"], ids=["c5"])
+
+    got = store.get()
+    assert "c3" not in got["ids"] and "new" not in got["ids"]
+    assert got["documents"][got["ids"].index("c5")] == "改写后的第5条"
+    hits = store.similarity_search_by_vector(fake_embeddings.embed_query(texts[3]), k=10)
+    assert "c3" not in [d.id for d in hits]
+
+    store.persist()
+    reopened = FlatVectorStore(tmp_path, fake_embeddings)
+    assert sorted(reopened.get()["ids"]) == sorted(got["ids"])
+    assert reopened.similarity_search("改写后的第5条", k=1)[0].id == "c5"
+
+
+def test_get_paging_and_embeddings(tmp_path, texts, fake_embeddings):
+    store = FlatVectorStore(tmp_path, fake_embeddings)
+    store.add_texts(texts[:5], ids=list("abcde"))
+    store.persist()
+    store.add_texts(texts[5:7], ids=list("fg"))
+    page = store.get(include=["embeddings"], limit=3, offset=3)
+    assert page["ids"] == ["d", "e", "f"]
+    assert page["documents"] is None
+    assert page["embeddings"].shape == (3, DIM)
+    np.testing.assert_allclose(np.linalg.norm(page["embeddings"], axis=1), 1.0, rtol=1e-5)
+    assert sum(len(block) for block in store.iter_vectors()) == 7
+
+
+def test_other_instance_sees_persisted_generation(tmp_path, texts, fake_embeddings):
+    writer = FlatVectorStore(tmp_path, fake_embeddings)
+    writer.add_texts(texts[:3], ids=["a", "b", "c"])
+    writer.persist()
+    reader = FlatVectorStore(tmp_path, fake_embeddings)
+    assert len(reader.get()["ids"]) == 3
+
+    writer.delete(["a"])
+    writer.add_texts(["第二代"], ids=["d"])
+    writer.persist()
+    assert sorted(reader.get()["ids"]) == ["b", "c", "d"]
+    generations = {p.name.split("_")[1] for p in tmp_path.glob("flat_*_vectors.npy")}
+    assert len(generations) == 1  # 旧一代文件已清理
+    assert (tmp_path / FLAT_INDEX_FILENAME).exists()
+
+
+def test_batch_search_matches_single(tmp_path, texts, fake_embeddings):
+    store = FlatVectorStore(tmp_path, fake_embeddings)
+    store.add_texts(texts, ids=[f"c{i}" for i in range(len(texts))])
+    store.persist()
+    queries = [fake_embeddings.embed_query(t) for t in ("第1条", "制度", "条款")]
+    batch = store.similarity_search_by_vectors_with_relevance_scores(queries, k=5)
+    for query, hits in zip(queries, batch):
+        single = store.similarity_search_by_vector_with_relevance_scores(query, k=5)
+        assert [d.id for d, _ in hits] == [d.id for d, _ in single]
+
+
+def test_int8_search_recall_and_exact_rescoring(tmp_path, fake_embeddings):
+    rng = np.random.default_rng(0)
+    vectors = {f"c{i}": rng.standard_normal(DIM).astype(np.float32) for i in range(2000)}
+    store = FlatVectorStore(tmp_path, fake_embeddings, quantization="int8", rescore_factor=4)
+    store.add_embeddings(list(vectors), list(vectors), np.stack(list(vectors.values())))
+    store.persist()
+
+    stats = store.memory_stats()
+    assert stats["quantization"] == "int8"
+    assert stats["int8_bytes"] * 4 == stats["float32_bytes"]
+
+    k, recalled = 10, 0
+    queries = unit(rng.standard_normal((20, DIM)).astype(np.float32))
+    for query in queries:
+        approx = store.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=k)
+        exact = store.similarity_search_by_vectors_with_relevance_scores([query.tolist()], k=k, exact=True)[0]
+        assert [d.id for d, _ in exact] == exact_top(vectors, query, k)
+        exact_distance = {d.id: s for d, s in exact}
+        for doc, distance in approx:
+            if doc.id in exact_distance:
+                # 候选按原始 float32 向量重新打分，距离与精确检索一致
+                assert distance == pytest.approx(exact_distance[doc.id], abs=1e-5)
+        recalled += len(set(exact_distance) & {d.id for d, _ in approx})
+    assert recalled / (k * len(queries)) >= 0.95
+
+
+def test_switching_quantization_rewrites_generation(tmp_path, texts, fake_embeddings):
+    store = FlatVectorStore(tmp_path, fake_embeddings)
+    store.add_texts(texts, ids=[f"c{i}" for i in range(len(texts))])
+    store.persist()
+    assert store.memory_stats()["int8_bytes"] is None
+
+    quantized = FlatVectorStore(tmp_path, fake_embeddings, quantization="int8")
+    quantized.persist()
+    assert quantized.memory_stats()["quantization"] == "int8"
+    assert quantized.similarity_search(texts[11], k=1)[0].id == "c11"
+
+
+def test_rejects_unknown_quantization(tmp_path, fake_embeddings):
+    with pytest.raises(ValueError):
+        FlatVectorStore(tmp_path, fake_embeddings, quantization="pq")
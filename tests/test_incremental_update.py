@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from knowledge import vector_store as vs
+from knowledge.manifest import diff_files, file_sha256, load_manifest, new_manifest, scan_directory
+
+
+def write(path, paragraphs: int, tag: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    text = "\n\n".join(f"{tag}第{j}条：员工须遵守第{j}项规定，" + "具体内容" * 40 for j in range(paragraphs))
+    path.write_text(text, encoding="utf-8")
+
+
+def stored_ids() -> set[str]:
+    return {cid for p in vs.get_partitions(allow_create=False).values() for cid in p.store.get()["ids"]}
+
+
+def chunks_of(rel: str) -> list[str]:
+    return load_manifest(vs.get_index_dir())["files"][rel]["chunk_ids"]
+
+
+@pytest.fixture
+def kb(knowledge_env):
+    write(knowledge_env.docs / "a.txt", 6, "考勤制度")
+    write(knowledge_env.docs / "b.txt", 4, "报销制度")
+    report = vs.update_index()
+    assert report["added"] == ["a.txt", "b.txt"] and report["chunks_added"] > 0
+    return knowledge_env
+
+
+def test_diff_files(tmp_path):
+    (tmp_path / "a.txt").write_text("甲", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("乙", encoding="utf-8")
+    files = scan_directory(tmp_path, {".txt"})
+    manifest = new_manifest(params={})
+    for rel, path in files.items():
+        st = path.stat()
+        manifest["files"][rel] = {"mtime": st.st_mtime, "size": st.st_size, "sha256": file_sha256(path)}
+    manifest["files"]["gone.txt"] = {"mtime": 0, "size": 0, "sha256": ""}
+
+    (tmp_path / "b.txt").write_text("乙（修订）", encoding="utf-8")
+    (tmp_path / "c.txt").write_text("丙", encoding="utf-8")
+    stat = (tmp_path / "a.txt").stat()
+    os.utime(tmp_path / "a.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    diff = diff_files(scan_directory(tmp_path, {".txt"}), manifest)
+    assert [rel for rel, *_ in diff["added"]] == ["c.txt"]
+    assert [rel for rel, *_ in diff["modified"]] == ["b.txt"]
+    assert diff["removed"] == ["gone.txt"]
+    assert diff["unchanged"] == ["a.txt"] and diff["refreshed"] == ["a.txt"]
+    assert manifest["files"]["a.txt"]["mtime"] == (tmp_path / "a.txt").stat().st_mtime
+
+
+def test_add_file(kb):
+    before = stored_ids()
+    write(kb.docs / "c.txt", 3, "保密制度")
+    report = vs.update_index()
+    assert report["added"] == ["c.txt"] and report["modified"] == [] and report["removed"] == []
+    assert report["chunks_added"] == len(chunks_of("c.txt")) and report["chunks_deleted"] == 0
+    assert stored_ids() == before | set(chunks_of("c.txt"))
+
+
+def test_modify_file(kb):
+    old = set(chunks_of("a.txt"))
+    write(kb.docs / "a.txt", 3, "考勤制度（修订）")
+    report = vs.update_index()
+    assert report["modified"] == ["a.txt"]
+    assert report["chunks_deleted"] == len(old)
+    assert report["chunks_added"] == len(chunks_of("a.txt"))
+    assert not old & stored_ids() and set(chunks_of("a.txt")) <= stored_ids()
+    hits = vs.get_lexical_index().search("修订", 3)
+    assert hits and hits[0][0] in chunks_of("a.txt")
+
+
+def test_delete_file(kb):
+    old = set(chunks_of("b.txt"))
+    (kb.docs / "b.txt").unlink()
+    report = vs.update_index()
+    assert report["removed"] == ["b.txt"] and report["chunks_added"] == 0
+    assert report["chunks_deleted"] == len(old)
+    assert not old & stored_ids()
+    assert "b.txt" not in load_manifest(vs.get_index_dir())["files"]
+
+
+def test_touch_reembeds_nothing(kb, monkeypatch):
+    version, index_dir = vs.get_index_version(), vs.get_index_dir()
+    path = kb.docs / "a.txt"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    kb.embeddings.embedded = 0
+    report = vs.update_index()
+    assert report["chunks_added"] == report["chunks_deleted"] == 0
+    assert kb.embeddings.embedded == 0
+    assert vs.get_index_dir() == index_dir and vs.get_index_version() == version  # 不生成新版本
+    assert load_manifest(index_dir)["files"]["a.txt"]["mtime"] == path.stat().st_mtime
+
+    # 刷新后的 mtime 已写回清单：再次检查不重新计算哈希
+    hashed = []
+    monkeypatch.setattr("knowledge.manifest.file_sha256", lambda p, *a: hashed.append(p) or "")
+    assert vs.update_index()["chunks_added"] == 0
+    assert hashed == []
+
+
+def test_unchanged_knowledge_base_is_a_no_op(kb):
+    index_dir = vs.get_index_dir()
+    kb.embeddings.embedded = 0
+    report = vs.update_index()
+    assert report["added"] == report["modified"] == report["removed"] == []
+    assert kb.embeddings.embedded == 0 and vs.get_index_dir() == index_dir
+
+
+def test_large_file_is_indexed_in_batches(knowledge_env, make_docx, monkeypatch):
+    from knowledge import loader
+    from knowledge.manifest import chunk_id
+
+    monkeypatch.setattr(loader, "SECTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(vs, "ADD_BATCH_SIZE", 3)
+    monkeypatch.setenv("DEDUP_ENABLED", "true")
+    knowledge_env.use("idx")
+
+    rules = {
+        "考勤": "工作日九点前打卡，迟到三次计旷工半天，全年无迟到者年终评优加分。",
+        "请假": "病假须附二级以上医院证明，事假须提前两天在系统中提交并经主管批准。",
+        "报销": "发票须在开具后九十天内提交，超期不予受理，单笔超过五千元须总监签字。",
+        "差旅": "高铁二等座与经济舱可直接预订，住宿标准一线城市每晚不超过六百元。",
+        "保密": "涉密文件不得拍照或外传，离职前须签署保密承诺书并交还全部门禁卡。",
+        "培训": "新员工入职首月完成线上课程，考试不合格者由导师安排一对一辅导补考。",
+        "绩效": "季度考核分为优良中差四档，连续两季度为差者进入改进计划或调岗。",
+    }
+    topics = list(rules) + ["考勤"]  # 末章与首章完全相同，且不在同一批
+    numbers = list(range(1, len(rules) + 1)) + [1]
+    body = "".join(
+        f"<w:p><w:r><w:t>第{n}章 {topic}</w:t></w:r></w:p><w:p><w:r><w:t>第{n}条 {rules[topic]}</w:t></w:r></w:p>"
+        for n, topic in zip(numbers, topics)
+    )
+    path = make_docx(knowledge_env.docs / "手册.docx", body)
+    report = vs.update_index()
+
+    splits = vs._get_text_splitter().split_documents(loader._load_docx(path))
+    entry = load_manifest(vs.get_index_dir())["files"]["手册.docx"]
+    all_ids = [chunk_id("手册.docx", file_sha256(path), i) for i in range(len(splits))]
+    assert len(splits) == len(topics) and entry["chunk_ids"] == all_ids[:-1]
+    assert entry["duplicates"] == 1 and entry["duplicate_of"] == []  # 同一文件内的重复不记出处
+    assert report["chunks_added"] == len(topics) - 1 and stored_ids() == set(all_ids[:-1])
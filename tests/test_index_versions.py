@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+
+from knowledge import index_versions as iv
+
+
+def test_legacy_layout_without_pointer(tmp_path):
+    assert iv.read_pointer(tmp_path) == {"version": iv.LEGACY_VERSION, "previous": None}
+    assert iv.active_dir(tmp_path) == tmp_path
+    assert iv.rollback(tmp_path) is None
+
+
+def test_create_activate_and_rollback(tmp_path):
+    (tmp_path / "index.bin").write_text("v0")
+    first, first_dir = iv.create_version(tmp_path, copy_from=tmp_path)
+    assert (first_dir / "index.bin").read_text() == "v0"
+    assert not (first_dir / iv.VERSIONS_DIRNAME).exists()  # 复制时跳过版本目录本身
+
+    assert iv.activate(tmp_path, first) == iv.LEGACY_VERSION
+    assert iv.active_dir(tmp_path) == first_dir
+
+    second, second_dir = iv.create_version(tmp_path, copy_from=first_dir)
+    (second_dir / "index.bin").write_text("v2")
+    assert iv.activate(tmp_path, second) == first
+    assert iv.active_dir(tmp_path) == second_dir
+    assert (first_dir / "index.bin").read_text() == "v0"  # 增量更新不改动旧版本
+
+    assert iv.rollback(tmp_path) == first
+    assert iv.active_dir(tmp_path) == first_dir
+    assert iv.read_pointer(tmp_path)["previous"] == second
+
+
+def test_rollback_to_missing_version(tmp_path):
+    first, _ = iv.create_version(tmp_path)
+    iv.activate(tmp_path, first)
+    second, _ = iv.create_version(tmp_path)
+    iv.activate(tmp_path, second)
+    iv.discard(tmp_path, first)
+    assert iv.rollback(tmp_path) is None
+    assert iv.read_pointer(tmp_path)["version"] == second
+
+
+def test_pointer_rewrites_are_seen_immediately(tmp_path):
+    versions = [iv.create_version(tmp_path)[0] for _ in range(5)]
+    for name in versions:
+        iv.activate(tmp_path, name)
+        assert iv.read_pointer(tmp_path)["version"] == name
+
+
+def test_prune_keeps_current_previous_and_newer(tmp_path):
+    names = [iv.create_version(tmp_path)[0] for _ in range(4)]
+    iv.activate(tmp_path, names[1])
+    iv.activate(tmp_path, names[2])
+    removed = iv.prune(tmp_path)
+    assert removed == [names[0]]
+    remaining = sorted(p.name for p in (tmp_path / iv.VERSIONS_DIRNAME).iterdir())
+    assert remaining == names[1:]  # names[3] 晚于当前版本创建，视为进行中的构建
+
+
+def test_corrupt_pointer_falls_back_to_root(tmp_path):
+    (tmp_path / iv.POINTER_FILENAME).write_text("{broken")
+    assert iv.active_dir(tmp_path) == tmp_path
+    (tmp_path / iv.POINTER_FILENAME).write_text(json.dumps({"version": "x", "previous": None, "pad": "reload"}))
+    assert iv.read_pointer(tmp_path)["version"] == "x"
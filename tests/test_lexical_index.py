@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from knowledge.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+DOCS = {
+    "a": "员工年假为每年五天，请假须提前三天在OA提交HR-003表单。",
+    "b": "差旅报销须在出差结束后十日内提交FIN-012报销单。",
+    "c": "信息安全：密码每九十天更换一次，VPN 账号不得外借。",
+    "d": "年假未休完的部分可顺延至次年第一季度。",
+    "e": "采购金额超过 50 万元的项目须公开招标。",
+}
+
+
+def build(items: dict[str, str]) -> LexicalIndex:
+    index = LexicalIndex()
+    index.add(list(items), list(items.values()))
+    return index
+
+
+def results(index: LexicalIndex, query: str, k: int = 10) -> list[tuple[str, float]]:
+    return [(cid, round(score, 5)) for cid, score in index.search(query, k)]
+
+
+def test_tokenize_bigrams_words_and_fullwidth():
+    assert tokenize("年假") == ["年假"]
+    assert tokenize("年假天数") == ["年假", "假天", "天数"]
+    assert tokenize("假") == ["假"]
+    assert tokenize("提交 FIN-012 报销单") == ["提交", "fin-012", "报销", "销单"]
+    assert tokenize("ＶＰＮ v2.1") == ["vpn", "v2.1"]
+
+
+def test_search_ranks_exact_identifier_first():
+    index = build(DOCS)
+    hits = index.search("FIN-012 报销单", 3)
+    assert hits[0][0] == "b"
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_search_without_matching_terms_is_empty():
+    assert build(DOCS).search("火星基地", 5) == []
+    assert LexicalIndex().search("年假", 5) == []
+
+
+def test_remove_and_readd_match_fresh_build():
+    index = build(DOCS)
+    index.remove(["a", "c"])
+    index.add(["a"], ["年假申请需部门负责人审批。"])
+    index.add(["f"], ["VPN 账号每季度复核一次。"])
+    expected = build({"b": DOCS["b"], "d": DOCS["d"], "e": DOCS["e"], "a": "年假申请需部门负责人审批。", "f": "VPN 账号每季度复核一次。"})
+    assert len(index) == len(expected) == 5
+    for query in ("年假", "VPN 账号", "报销单", "密码更换"):
+        assert results(index, query) == results(expected, query)
+
+
+def test_add_existing_id_replaces_text():
+    index = build(DOCS)
+    index.add(["e"], ["年假"])
+    assert len(index) == len(DOCS)
+    assert "e" not in [cid for cid, _ in index.search("招标", 5)]
+    assert "e" in [cid for cid, _ in index.search("年假", 5)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_updates_with_interleaved_compaction(seed):
+    rng = random.Random(seed)
+    words = ["年假", "报销", "密码", "招标", "审批", "hr-003", "fin-012", "vpn"]
+    index, truth = LexicalIndex(), {}
+    for step in range(60):
+        if truth and rng.random() < 0.35:
+            gone = rng.sample(sorted(truth), min(len(truth), rng.randint(1, 3)))
+            index.remove(gone)
+            for cid in gone:
+                del truth[cid]
+        else:
+            cid = f"c{rng.randint(0, 30)}"
+            text = " ".join(rng.choices(words, k=rng.randint(1, 6)))
+            index.add([cid], [text])
+            truth[cid] = text
+        if step % 7 == 0:
+            index.search("年假", 3)  # 查询触发合并
+    expected = build(truth)
+    for query in words:
+        assert results(index, query) == results(expected, query)
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    index = build(DOCS)
+    index.remove(["c"])
+    index.save(tmp_path)
+    loaded = LexicalIndex.load(tmp_path)
+    assert len(loaded) == 4
+    for query in ("年假", "报销单", "VPN"):
+        assert results(loaded, query) == results(index, query)
+    loaded.add(["g"], ["VPN 审批"])
+    assert loaded.search("VPN", 1)[0][0] == "g"
+
+
+def test_load_missing_or_corrupt(tmp_path):
+    assert LexicalIndex.load(tmp_path) is None
+    (tmp_path / "lexical_index.npz").write_bytes(b"not a zip")
+    assert LexicalIndex.load(tmp_path) is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=3, rrf_k=60)
+    assert fused[:2] == ["b", "c"]
+    assert len(fused) == 3
+    assert reciprocal_rank_fusion([["x", "y"]], k=1) == ["x"]
+    assert reciprocal_rank_fusion([], k=3) == []
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from rag.llm_client import LLMCaller
+
+
+class FakeChain:
+    """按调用顺序使用 delays 中的耗时；记录每次调用的开始时间、是否被取消，以及流是否被关闭。"""
+
+    def __init__(self, delays, fail=False, chunks=3):
+        self.delays = list(delays)
+        self.fail = fail
+        self.chunks = chunks
+        self.started: list[float] = []
+        self.cancelled: list[int] = []
+        self.closed = False
+
+    async def ainvoke(self, inputs):
+        call = len(self.started)
+        self.started.append(asyncio.get_running_loop().time())
+        try:
+            await asyncio.sleep(self.delays[call])
+        except asyncio.CancelledError:
+            self.cancelled.append(call)
+            raise
+        if self.fail:
+            raise RuntimeError(f"上游错误 {call}")
+        return f"答案 {call}"
+
+    async def astream(self, inputs):
+        try:
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delays[min(i, len(self.delays) - 1)])
+                yield f"片段{i}"
+        finally:
+            self.closed = True
+
+
+def hedging_caller(**kwargs) -> LLMCaller:
+    caller = LLMCaller(timeout=2, hedge_percentile=50, hedge_min_samples=1, hedge_min_delay_ms=50, **kwargs)
+    caller._record(0.05)  # 近期 P50 为 50ms：超过 50ms 未返回即对冲
+    return caller
+
+
+def test_hedge_fires_after_delay_and_cancels_loser():
+    caller, chain = hedging_caller(), FakeChain([1.0, 0.01])
+
+    async def main():
+        return await caller.ainvoke(chain, {})
+
+    assert asyncio.run(main()) == "答案 1"
+    assert chain.started[1] - chain.started[0] >= 0.05
+    assert chain.cancelled == [0]
+    assert (caller.hedged, caller.hedge_wins, caller.ok) == (1, 1, 1)
+
+
+def test_fast_primary_is_not_hedged():
+    caller, chain = hedging_caller(), FakeChain([0.01])
+    assert asyncio.run(caller.ainvoke(chain, {})) == "答案 0"
+    assert len(chain.started) == 1 and caller.hedged == 0
+
+
+def test_no_hedge_without_enough_samples():
+    caller = LLMCaller(timeout=2, hedge_percentile=50, hedge_min_samples=5)
+    assert caller.hedge_delay() is None
+    chain = FakeChain([0.1])
+    assert asyncio.run(caller.ainvoke(chain, {})) == "答案 0"
+    assert len(chain.started) == 1
+
+
+def test_deadline_raises_and_cancels():
+    caller, chain = LLMCaller(timeout=0.1), FakeChain([1.0])
+    with pytest.raises(TimeoutError):
+        asyncio.run(caller.ainvoke(chain, {}))
+    assert chain.cancelled == [0] and caller.timeouts == 1
+
+
+def test_deadline_covers_hedged_requests():
+    caller = LLMCaller(timeout=0.2, hedge_percentile=50, hedge_min_samples=1, hedge_min_delay_ms=50)
+    caller._record(0.05)
+    chain = FakeChain([1.0, 1.0])
+    with pytest.raises(TimeoutError):
+        asyncio.run(caller.ainvoke(chain, {}))
+    assert sorted(chain.cancelled) == [0, 1]
+
+
+def test_errors_propagate_when_all_attempts_fail():
+    caller, chain = hedging_caller(), FakeChain([0.1, 0.1], fail=True)
+    with pytest.raises(RuntimeError, match="上游错误"):
+        asyncio.run(caller.ainvoke(chain, {}))
+    assert caller.errors == 1
+
+
+def collect(caller: LLMCaller, chain: FakeChain) -> list[str]:
+    async def main():
+        return [chunk async for chunk in caller.astream(chain, {})]
+
+    return asyncio.run(main())
+
+
+def test_stream_completes():
+    caller, chain = LLMCaller(timeout=1, first_token_timeout=0.5), FakeChain([0.01])
+    assert collect(caller, chain) == ["片段0", "片段1", "片段2"]
+    assert caller.ok == 1 and chain.closed
+
+
+def test_stream_first_token_timeout():
+    caller, chain = LLMCaller(timeout=2, first_token_timeout=0.05), FakeChain([1.0])
+    with pytest.raises(TimeoutError, match="首个片段"):
+        collect(caller, chain)
+    assert chain.closed and caller.timeouts == 1
+
+
+def test_stream_total_deadline():
+    caller = LLMCaller(timeout=0.2, first_token_timeout=0.1)
+    chain = FakeChain([0.03], chunks=100)
+    received = []
+
+    async def main():
+        async for chunk in caller.astream(chain, {}):
+            received.append(chunk)
+
+    with pytest.raises(TimeoutError, match="生成"):
+        asyncio.run(main())
+    assert 0 < len(received) < 100 and chain.closed
+
+
+def test_stream_closed_by_consumer_closes_upstream():
+    caller, chain = LLMCaller(timeout=2), FakeChain([0.01], chunks=100)
+
+    async def main():
+        stream = caller.astream(chain, {})
+        assert await anext(stream) == "片段0"
+        await stream.aclose()
+
+    asyncio.run(main())
+    assert chain.closed
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import pickle
+import tempfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from knowledge import loader
+from knowledge.loader import _docx_heading_styles, _iter_docx_sections, _load_docx, _load_file_spooled, _read_spool, iter_load_files
+
+STYLES = (
+    '<w:style w:styleId="Title"><w:name w:val="Title"/></w:style>'
+    '<w:style w:styleId="Heading1"><w:name w:val="heading 1"/></w:style>'
+    '<w:style w:styleId="a3"><w:name w:val="标题 2"/></w:style>'
+    '<w:style w:styleId="Outline"><w:name w:val="Custom"/><w:pPr><w:outlineLvl w:val="2"/></w:pPr></w:style>'
+    '<w:style w:styleId="Body"><w:name w:val="Normal"/><w:pPr><w:outlineLvl w:val="9"/></w:pPr></w:style>'
+)
+
+
+def para(text: str, style: str | None = None, outline: int | None = None) -> str:
+    props = ""
+    if style:
+        props += f'<w:pStyle w:val="{style}"/>'
+    if outline is not None:
+        props += f'<w:outlineLvl w:val="{outline}"/>'
+    return f"<w:p><w:pPr>{props}</w:pPr><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def table(*rows: list[str]) -> str:
+    body = "".join("<w:tr>" + "".join(f"<w:tc>{para(cell)}</w:tc>" for cell in row) + "</w:tr>" for row in rows)
+    return f"<w:tbl>{body}</w:tbl>"
+
+
+HANDBOOK = "".join([
+    para("员工手册", "Title"),
+    para("考勤管理", "Heading1"),
+    para("九点上班。"),
+    para("请假", outline=1),  # 段落直接设置大纲级别
+    para("第一条 病假须附证明。", "Body"),
+    para("第二章 薪酬福利"),  # 无标题样式，按「第X章」推断
+    table(["类型", "天数"], ["年假", "5"]),
+    para("工资每月十日发放。"),
+    para("   "),
+])
+
+
+def test_docx_heading_styles(tmp_path, make_docx):
+    path = make_docx(tmp_path / "a.docx", "", STYLES)
+    with zipfile.ZipFile(path) as archive:
+        assert _docx_heading_styles(archive) == {"Title": 0, "Heading1": 1, "a3": 2, "Outline": 3}
+    with zipfile.ZipFile(make_docx(tmp_path / "b.docx", "")) as archive:
+        assert _docx_heading_styles(archive) == {}
+
+
+def test_docx_sections(tmp_path, make_docx):
+    path = make_docx(tmp_path / "手册.docx", HANDBOOK, STYLES)
+    docs = _load_docx(path)
+    path_1 = "员工手册 > 考勤管理"
+    assert [(d.page_content, d.metadata["section"]) for d in docs] == [
+        ("员工手册", "员工手册"),
+        ("考勤管理\n九点上班。", path_1),
+        ("请假", f"{path_1} > 请假"),
+        ("第一条 病假须附证明。", f"{path_1} > 请假 > 第一条"),
+        ("第二章 薪酬福利", f"{path_1} > 请假 > 第二章 薪酬福利"),  # 推断的级别排在样式标题之下
+        ("类型 | 天数\n年假 | 5", f"{path_1} > 请假 > 第二章 薪酬福利"),
+        ("工资每月十日发放。", f"{path_1} > 请假 > 第二章 薪酬福利"),
+    ]
+    assert docs[5].metadata["block"] == "table"
+    assert all(d.metadata["source"] == str(path) and d.metadata["filename"] == "手册.docx" for d in docs)
+
+    styled = make_docx(tmp_path / "styled.docx", para("总则", "a3") + para("适用范围。") + para("细则", "Outline"), STYLES)
+    assert [d.metadata["section"] for d in _load_docx(styled)] == ["总则", "总则 > 细则"]
+
+
+def test_docx_broken_file_is_empty(tmp_path):
+    path = tmp_path / "broken.docx"
+    path.write_bytes(b"not a zip")
+    assert _load_docx(path) == []
+
+
+def test_sections_are_spooled_in_batches(tmp_path, make_docx, monkeypatch):
+    monkeypatch.setattr(loader, "SECTION_BATCH_SIZE", 2)
+    path = make_docx(tmp_path / "a.docx", HANDBOOK, STYLES)
+    spool, count, seconds = _load_file_spooled(path, str(tmp_path))
+    assert isinstance(spool, str) and count == 7 and seconds >= 0
+
+    batches = []
+    with open(spool, "rb") as f:
+        while True:
+            try:
+                batches.append(pickle.load(f))
+            except EOFError:
+                break
+    assert [len(b) for b in batches] == [2, 2, 2, 1]
+    expected = [(d.page_content, d.metadata) for d in _iter_docx_sections(path)]
+    assert [(d.page_content, d.metadata) for d in _read_spool(spool)] == expected
+    assert not Path(spool).exists()  # 读完即删除
+
+    broken = tmp_path / "broken.docx"
+    broken.write_bytes(b"not a zip")
+    assert _load_file_spooled(broken, str(tmp_path))[:2] == ([], 0)
+    assert not list(tmp_path.glob("*.sections"))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_iter_load_files(tmp_path, make_docx, monkeypatch, workers):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "tmp"))
+    (tmp_path / "tmp").mkdir()
+    docs = tmp_path / "docs"
+    a = make_docx(docs / "a.docx", HANDBOOK, STYLES)
+    b = make_docx(docs / "b.docx", para("第一章 总则") + para("第一条 适用于全体员工。"))
+    (docs / "c.txt").write_text("纯文本制度。", encoding="utf-8")
+    (docs / "broken.docx").write_bytes(b"not a zip")
+
+    loaded = {}
+    for path, items in iter_load_files(sorted(docs.iterdir()), max_workers=workers):
+        loaded[path.name] = [d.page_content for d in items]
+    assert loaded["a.docx"] == [d.page_content for d in _iter_docx_sections(a)]
+    assert loaded["b.docx"] == [d.page_content for d in _iter_docx_sections(b)]
+    assert loaded["c.txt"] == ["纯文本制度。"] and loaded["broken.docx"] == []
+    assert list((tmp_path / "tmp").glob("rag-sections-*")) == []  # 章节临时目录已清理
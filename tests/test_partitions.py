@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from knowledge.partitions import DEFAULT_PARTITION, IndexPartition, partition_of, route
+
+
+def unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+def partitions():
+    return [
+        IndexPartition("人事", None, None, centroid=unit(1, 0, 0)),
+        IndexPartition("财务", None, None, centroid=unit(0, 1, 0)),
+        IndexPartition("IT", None, None, centroid=unit(0, 0, 1)),
+    ]
+
+
+def names(selected):
+    return [p.name for p in selected]
+
+
+def test_partition_of():
+    assert partition_of("人事/考勤.pdf") == "人事"
+    assert partition_of("人事/2024/考勤.pdf") == "人事"
+    assert partition_of("通知.txt") == DEFAULT_PARTITION
+
+
+def test_route_by_centroid():
+    assert names(route("报销流程", unit(0.1, 1, 0), partitions(), max_partitions=2, margin=0.05)) == ["财务"]
+
+
+def test_name_in_question_with_low_centroid_score_is_only_a_boost():
+    # 问题提到「人事」，但内容与财务分区最相关：加分不足以越过差距，仍只检索财务
+    selected = route("人事部门的报销流程", unit(0.2, 1, 0), partitions(), max_partitions=2, margin=0.05, name_boost=0.05)
+    assert names(selected) == ["财务"]
+    # 加分使人事进入 margin 之内时两个分区一并检索，内容最相关的财务不会被挤掉
+    selected = route("人事部门的报销流程", unit(0.9, 1, 0), partitions(), max_partitions=2, margin=0.05, name_boost=0.05)
+    assert names(selected) == ["财务", "人事"]
+
+
+def test_margin_tie_selects_both():
+    selected = route("年假与报销", unit(1, 1, 0), partitions(), max_partitions=3, margin=0.0)
+    assert sorted(names(selected)) == ["人事", "财务"]
+    assert len(route("年假与报销", unit(1, 1, 0), partitions(), max_partitions=1, margin=0.0)) == 1
+
+
+def test_missing_centroid_searches_all():
+    parts = partitions() + [IndexPartition("旧分区", None, None)]
+    assert route("年假", unit(1, 0, 0), parts, max_partitions=1, margin=0.05) == parts
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from knowledge.query_batcher import QueryEmbeddingBatcher
+
+
+class RecordingEmbeddings:
+    """记录每次批量计算的文本；fail 为 True 时抛出异常。"""
+
+    def __init__(self, base, fail: bool = False):
+        self.base = base
+        self.fail = fail
+        self.batches: list[list[str]] = []
+
+    def embed_queries(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("嵌入服务不可用")
+        return [self.base.embed_query(t) for t in texts]
+
+
+def test_concurrent_calls_share_one_batch(fake_embeddings):
+    embeddings = RecordingEmbeddings(fake_embeddings)
+    batcher = QueryEmbeddingBatcher(embeddings, max_batch_size=32, max_wait_ms=50)
+    questions = ["年假几天", "报销流程", "年假几天", "VPN 申请"]
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed(q) for q in questions))
+
+    vectors = asyncio.run(main())
+    assert embeddings.batches == [["年假几天", "报销流程", "VPN 申请"]]  # 同一批内重复的问题只计算一次
+    assert vectors == [fake_embeddings.embed_query(q) for q in questions]
+    assert batcher.stats() == {"batches": 1, "queries": 4, "avg_batch_size": 4.0}
+
+
+def test_batches_are_capped_by_size(fake_embeddings):
+    embeddings = RecordingEmbeddings(fake_embeddings)
+    batcher = QueryEmbeddingBatcher(embeddings, max_batch_size=2, max_wait_ms=50)
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed(f"问题{i}") for i in range(5)))
+
+    assert len(asyncio.run(main())) == 5
+    assert [len(b) for b in embeddings.batches] == [2, 2, 1]
+
+
+def test_error_reaches_every_waiter_and_batcher_recovers(fake_embeddings):
+    embeddings = RecordingEmbeddings(fake_embeddings, fail=True)
+    batcher = QueryEmbeddingBatcher(embeddings, max_wait_ms=50)
+
+    async def main():
+        results = await asyncio.gather(*(batcher.embed(q) for q in ("a", "b", "c")), return_exceptions=True)
+        embeddings.fail = False
+        return results, await batcher.embed("年假")
+
+    results, after = asyncio.run(main())
+    assert [str(r) for r in results] == ["嵌入服务不可用"] * 3
+    assert len(embeddings.batches) == 2
+    assert after == fake_embeddings.embed_query("年假")
+
+
+def test_cancelled_waiter_does_not_break_batch(fake_embeddings):
+    embeddings = RecordingEmbeddings(fake_embeddings)
+    batcher = QueryEmbeddingBatcher(embeddings, max_wait_ms=50)
+
+    async def main():
+        gone = asyncio.ensure_future(batcher.embed("已取消"))
+        kept = asyncio.ensure_future(batcher.embed("年假"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        return await kept
+
+    assert asyncio.run(main()) == fake_embeddings.embed_query("年假")
+    assert embeddings.batches == [["年假"]]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import time
+
+from langchain_core.documents import Document
+
+from rag.reranker import CrossEncoderReranker
+
+
+class FakeCrossEncoder:
+    """得分为文本中问题关键词出现的次数；每批打分耗时 delay 秒。"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = 0
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False):
+        self.batches += 1
+        time.sleep(self.delay)
+        return [float(text.count(question[:2])) for question, text in pairs]
+
+
+def reranker(model: FakeCrossEncoder, **kwargs) -> CrossEncoderReranker:
+    r = CrossEncoderReranker("fake", **kwargs)
+    r._model = model
+    return r
+
+
+DOCS = [Document(page_content=text, id=f"d{i}") for i, text in enumerate(["报销流程", "年假", "年假年假年假", "考勤", "年假年假"])]
+
+
+def test_rerank_orders_by_score_and_caches():
+    model = FakeCrossEncoder()
+    r = reranker(model, batch_size=2, budget_ms=1000)
+    assert [d.id for d in r.rerank("年假几天", DOCS, 3)] == ["d2", "d4", "d1"]
+    assert model.batches == 3
+    assert [d.id for d in r.rerank("年假几天？", DOCS, 3)] == ["d2", "d4", "d1"]  # 规范化后相同的问题命中分数缓存
+    assert model.batches == 3
+    assert r.stats()["reranked"] == 2 and r.stats()["cache_hit_rate"] == 0.5
+
+
+def test_slow_model_falls_back_to_retrieval_order():
+    model = FakeCrossEncoder(delay=0.05)
+    r = reranker(model, batch_size=2, budget_ms=80)
+    # 第一批耗时 50ms 后剩余预算不足一批的预计耗时：放弃重排，按检索顺序返回
+    assert r.rerank("年假几天", DOCS, 3) == DOCS[:3]
+    assert model.batches == 1 and r.stats()["fallbacks"] == 1 and r.stats()["reranked"] == 0
+
+
+def test_estimated_batch_time_skips_scoring_entirely():
+    model = FakeCrossEncoder(delay=0.05)
+    r = reranker(model, batch_size=10, budget_ms=30)
+    r._batch_seconds = 0.05  # 近期单批耗时已超出整个预算
+    assert r.rerank("年假几天", DOCS, 2) == DOCS[:2]
+    assert model.batches == 0
+
+
+def test_single_doc_is_returned_unscored():
+    model = FakeCrossEncoder()
+    assert reranker(model).rerank("年假", DOCS[:1], 3) == DOCS[:1]
+    assert model.batches == 0
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rag.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+    started = threading.Event()
+
+    def work():
+        nonlocal calls
+        calls += 1
+        started.set()
+        time.sleep(0.2)
+        return "答案"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("q", work)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("q", work))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    for t in [leader, *followers]:
+        t.join()
+    assert results == ["答案"] * 5
+    assert calls == 1
+    assert flight.stats() == {"inflight": 0, "leaders": 1, "followers": 4, "coalesced_ratio": 0.8}
+
+
+def test_error_is_shared_and_key_released():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        release.wait()
+        raise RuntimeError("LLM 超时")
+
+    def run():
+        try:
+            flight.do("q", fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run)]
+    threads[0].start()
+    started.wait()
+    threads.append(threading.Thread(target=run))
+    threads[1].start()
+    while flight.followers < 1:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert errors == ["LLM 超时"] * 2
+    assert flight.do("q", lambda: 1) == 1  # 失败后不残留在途记录
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["leaders"] == 2
+
+
+def test_async_calls_share_one_task():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("q", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert calls == 1
+    assert flight.stats()["inflight"] == 0
+
+
+def test_async_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "答案"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("q", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.ado("q", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "答案"
+
+
+def test_async_error_is_shared():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("检索失败")
+
+    async def main():
+        return await asyncio.gather(flight.ado("q", fail), flight.ado("q", fail), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [str(r) for r in results] == ["检索失败"] * 2
+    assert all(isinstance(r, ValueError) for r in results)
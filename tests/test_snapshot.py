@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import io
+import tarfile
+
+import pytest
+
+import config
+from knowledge import index_versions
+from knowledge import vector_store as vs
+from knowledge.snapshot import SnapshotError, export_snapshot, import_snapshot
+from knowledge.store_adapter import search_by_vector
+
+
+@pytest.fixture
+def node(knowledge_env):
+    """三个制度文件的知识库；返回切换索引目录（模拟另一节点）的函数。"""
+    for i in range(3):
+        paragraphs = (f"制度{i}第{j}条：员工福利第{j}项说明，" + "内容" * 30 for j in range(20))
+        (knowledge_env.docs / f"policy{i}.txt").write_text("\n\n".join(paragraphs), encoding="utf-8")
+    return knowledge_env.use
+
+
+def drop_member(source, target, prefix: str) -> str:
+    """复制快照，去掉第一个名称以 prefix 开头的成员（其余成员及其校验头不变），返回被去掉的成员名。"""
+    dropped = None
+    with tarfile.open(str(source), "r|gz") as src, tarfile.open(str(target), "w|gz", format=tarfile.PAX_FORMAT) as dst:
+        for member in src:
+            data = src.extractfile(member).read()
+            if dropped is None and member.name.startswith(prefix):
+                dropped = member.name
+                continue
+            dst.addfile(member, io.BytesIO(data))
+    return dropped
+
+
+def chunk_ids() -> list[str]:
+    return sorted(cid for p in vs.get_partitions(allow_create=False).values() for cid in p.store.get()["ids"])
+
+
+def top_hits(query: str) -> list[str]:
+    store = vs.get_vector_store(allow_create=False)
+    return [doc.page_content for doc, _ in search_by_vector(store, vs.get_embeddings().embed_query(query), 3)]
+
+
+@pytest.mark.parametrize("backend", ["flat", "chroma"])
+def test_export_import_roundtrip(tmp_path, node, backend):
+    vs.update_index()
+    expected_ids, expected_hits = chunk_ids(), top_hits("制度1第5条员工福利")
+    version = vs.get_index_version()
+    report = export_snapshot(tmp_path / "index.snap")
+    assert report["chunks"] == len(expected_ids) > 0
+
+    node("idx2", backend)
+    imported = import_snapshot(tmp_path / "index.snap")
+    assert imported["chunks"] == len(expected_ids)
+    assert imported["index_version"] == version + 1
+    assert chunk_ids() == expected_ids
+    assert top_hits("制度1第5条员工福利") == expected_hits
+    assert vs.get_lexical_index().search("制度1第5条", 1)
+
+    result = vs.update_index()  # 清单随快照导入，知识库未变化时无需重新嵌入
+    assert result["chunks_added"] == 0
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path, node, monkeypatch):
+    monkeypatch.setenv("DEDUP_ENABLED", "true")  # 快照中带 extra/ 下的去重文件
+    config.reload_settings()
+    vs.update_index()
+    export_snapshot(tmp_path / "index.snap")
+    data = bytearray((tmp_path / "index.snap").read_bytes())
+
+    node("idx2")
+    vs.update_index()
+    before = vs.get_index_dir()
+    flipped = bytearray(data)
+    flipped[len(flipped) // 2] ^= 0xFF
+    (tmp_path / "bad.snap").write_bytes(flipped)
+    (tmp_path / "trunc.snap").write_bytes(data[:-200])
+    assert drop_member(tmp_path / "index.snap", tmp_path / "no-manifest.snap", "manifest.json")
+    assert drop_member(tmp_path / "index.snap", tmp_path / "no-extra.snap", "extra/")
+    for name in ("bad.snap", "trunc.snap", "no-manifest.snap", "no-extra.snap"):
+        with pytest.raises(SnapshotError):
+            import_snapshot(tmp_path / name)
+        assert vs.get_index_dir() == before
+    versions = sorted(p.name for p in (tmp_path / "idx2" / index_versions.VERSIONS_DIRNAME).iterdir())
+    assert versions == [before.name]  # 失败的导入不残留版本目录
+
+
+def test_incompatible_snapshot_is_rejected(tmp_path, node, monkeypatch):
+    vs.update_index()
+    export_snapshot(tmp_path / "index.snap")
+    node("idx2")
+    monkeypatch.setenv("EMBEDDING_MODEL", "other-model")
+    config.reload_settings()
+    with pytest.raises(SnapshotError, match="嵌入模型"):
+        import_snapshot(tmp_path / "index.snap")
+
+
+def test_export_without_index(tmp_path, node):
+    with pytest.raises(SnapshotError):
+        export_snapshot(tmp_path / "index.snap")
+    assert not (tmp_path / "index.snap").exists()
+    assert not (tmp_path / "index.snap.tmp").exists()